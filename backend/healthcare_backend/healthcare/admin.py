@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from . import catalog
 from .models import (
     User, Doctor, Department, Appointment, MedicalRecord,
-    FamilyMember, DoctorAvailability, Admin as AdminModel, QueueStatus
+    FamilyMember, DoctorAvailability, Admin as AdminModel, QueueStatus,
+    TokenSequence, AppointmentRollup, DoctorStats
 )
 
 @admin.register(User)
@@ -46,7 +48,11 @@ class DoctorAdmin(admin.ModelAdmin):
     actions = ['verify_doctors']
 
     def verify_doctors(self, request, queryset):
+        department_ids = list(queryset.values_list('department_id', flat=True).distinct())
         updated = queryset.update(is_verified=True)
+        # update() skips the signals that invalidate the cached catalog
+        catalog.departments_changed()
+        catalog.directory_changed(department_ids)
         self.message_user(request, f'{updated} doctors verified.')
 
 
@@ -76,4 +82,7 @@ class MedicalRecordAdmin(admin.ModelAdmin):
 admin.site.register(DoctorAvailability)
 admin.site.register(FamilyMember)
 admin.site.register(AdminModel)
-admin.site.register(QueueStatus)
\ No newline at end of file
+admin.site.register(QueueStatus)
+admin.site.register(TokenSequence)
+admin.site.register(AppointmentRollup)
+admin.site.register(DoctorStats)
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+JWT authentication without a per-request user query.
+
+Tokens issued by ``ClaimsRefreshToken`` carry the user's role, doctor
+profile id and the time they logged in. ``CachedJWTAuthentication`` builds
+``request.user`` from those claims alone; the User row is only loaded, and
+then through a short-lived cache, when a view reads a field the claims do
+not cover.
+
+Claims cannot be changed once issued, so deactivating a user or changing
+their role records a revocation time, and tokens from earlier logins are
+refused from then on. The time is stored on the user row and refreshing a
+token checks it there, along with ``is_active``, as rotated refresh tokens
+keep their claims for REFRESH_TOKEN_LIFETIME. Access tokens check a cached
+copy instead, so losing the cache lets an earlier access token through for
+at most ACCESS_TOKEN_LIFETIME.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User, Doctor
+
+USER_CACHE_TIMEOUT = 60
+
+
+def user_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def revoked_key(user_id):
+    return f'auth-revoked:{user_id}'
+
+
+def load_user(user_id):
+    """The user with their doctor profile id as ``doctor_pk``, cached briefly; None if missing"""
+    key = user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.annotate(doctor_pk=F('doctor_profile__id')).filter(pk=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, user, USER_CACHE_TIMEOUT)
+    return user
+
+
+def revoke(user_id):
+    """
+    Refuse tokens from earlier logins: recorded on the user row now, and in
+    the cache (dropping the cached user) once the transaction commits.
+    Returns the revocation time.
+    """
+    revoked_at = timezone.now()
+    User.objects.filter(pk=user_id).update(tokens_revoked_at=revoked_at)
+
+    def apply():
+        lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+        cache.set(revoked_key(user_id), revoked_at.timestamp(), lifetime)
+        cache.delete(user_key(user_id))
+
+    transaction.on_commit(apply)
+    return revoked_at
+
+
+def forget(user_id):
+    transaction.on_commit(lambda: cache.delete(user_key(user_id)))
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose claims (copied into its access tokens) authenticate without a query"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        token['auth_time'] = time.time()
+        if user.role == 'doctor':
+            doctor_id = Doctor.objects.filter(user=user).values_list('id', flat=True).first()
+            if doctor_id:
+                token['doctor_id'] = doctor_id
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens of inactive users and those issued before a revocation, checked in the database"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(pk=refresh.get(api_settings.USER_ID_CLAIM)).values(
+            'is_active', 'tokens_revoked_at'
+        ).first()
+        if user is None or not user['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if user['tokens_revoked_at'] and refresh.get('auth_time', 0) < user['tokens_revoked_at'].timestamp():
+            raise AuthenticationFailed('Token has been revoked, please log in again', code='token_revoked')
+        return super().validate(attrs)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    ``request.user`` known from token claims: id, pk, role and doctor_id
+    are answered directly, as are is_authenticated and is_anonymous.
+    Anything else, including is_active, isinstance checks and passing the
+    user to the ORM, loads the cached User and answers from it.
+    """
+
+    def __init__(self, user_id, role, doctor_id=None):
+        def load():
+            user = load_user(user_id)
+            if user is None:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+            return user
+
+        super().__init__(load)
+        self.__dict__.update(
+            id=user_id, pk=user_id, role=role, doctor_id=doctor_id,
+            is_authenticated=True, is_anonymous=False,
+        )
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        return isinstance(other, User) and other.pk == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        revoked_at = cache.get(revoked_key(user_id))
+        if revoked_at is not None and validated_token.get('auth_time', 0) < revoked_at:
+            raise AuthenticationFailed('Token has been revoked, please log in again', code='token_revoked')
+
+        if 'role' in validated_token:
+            return ClaimsUser(user_id, validated_token['role'], validated_token.get('doctor_id'))
+
+        # Tokens issued without claims fall back to the (cached) user
+        user = load_user(user_id)
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return ClaimsUser(user.id, user.role, user.doctor_pk)
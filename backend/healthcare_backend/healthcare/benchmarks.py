@@ -0,0 +1,166 @@
+"""
+Measurements behind the ``benchmark_queries`` command.
+
+A scenario is repeated and summarised as its response status, the most
+queries any run made, p50/p95/p99 latency in milliseconds and sequential
+throughput per second. HTTP scenarios go through the full middleware stack
+with DRF's test client; the queue WebSocket is driven in-process with
+channels' WebsocketCommunicator on the in-memory channel layer, so nothing
+but the database (and the configured cache) is needed.
+
+Results can be stored as a JSON baseline and later runs compared against
+it: a scenario regresses when its p95 grows beyond the tolerance (and by
+more than MIN_REGRESSION_MS) or it runs more queries than before.
+"""
+import json
+import statistics
+import time as clock
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.utils import timezone
+
+from . import queues, slots
+from .budgets import QueryCounter
+from .models import DoctorAvailability
+from .routing import websocket_urlpatterns
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+# How far ahead free slots are looked for when planning bookings
+BOOKING_HORIZON_DAYS = 60
+# Latency growth below this is timer noise, whatever the tolerance
+MIN_REGRESSION_MS = 1.0
+
+
+def percentiles(values):
+    """p50, p95 and p99 of a non-empty list"""
+    if len(values) > 1:
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+    else:
+        cuts = values * 99
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def summarize(timings, queries, status=None):
+    """Result of a scenario from its run times (ms) and query counts"""
+    return dict(
+        status=status,
+        queries=max(queries),
+        throughput=len(timings) / (sum(timings) / 1000) if sum(timings) else 0.0,
+        **percentiles(timings),
+    )
+
+
+def measure_requests(client, method, path, repeat, data=None):
+    """
+    Send ``repeat`` requests; ``data`` is a body, or a callable giving the
+    body of run ``n``
+    """
+    timings, queries = [], []
+    send = getattr(client, method.lower())
+    for n in range(repeat):
+        body = data(n) if callable(data) else data
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = clock.perf_counter()
+            response = send(path, body, format='json') if body is not None else send(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            timings.append((clock.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+    return summarize(timings, queries, response.status_code)
+
+
+def measure_queue_socket(doctor_id, clients, broadcasts):
+    """
+    Connect ``clients`` to the doctor's queue WebSocket, then publish
+    ``broadcasts`` messages to them. Returns the results of connecting
+    (until the initial snapshot arrives) and of broadcasting (until every
+    client has the message).
+    """
+    payload = queues.get_snapshot(doctor_id)
+    counter = QueryCounter()
+
+    async def session():
+        application = URLRouter(websocket_urlpatterns)
+        communicators, connect_timings, connect_queries = [], [], []
+        for _ in range(clients):
+            communicator = WebsocketCommunicator(application, f'/ws/queue/{doctor_id}/')
+            before = counter.count
+            started = clock.perf_counter()
+            await communicator.connect()
+            await communicator.receive_json_from()
+            connect_timings.append((clock.perf_counter() - started) * 1000)
+            connect_queries.append(counter.count - before)
+            communicators.append(communicator)
+
+        publish = sync_to_async(queues.publish)
+        broadcast_timings, broadcast_queries = [], []
+        for number in range(broadcasts):
+            before = counter.count
+            started = clock.perf_counter()
+            # A later seq each time, as the consumer drops queue states its client already has
+            await publish(doctor_id, dict(payload, seq=payload['seq'] + number + 1))
+            for communicator in communicators:
+                await communicator.receive_json_from()
+            broadcast_timings.append((clock.perf_counter() - started) * 1000)
+            broadcast_queries.append(counter.count - before)
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        return summarize(connect_timings, connect_queries), summarize(broadcast_timings, broadcast_queries)
+
+    # The in-memory channel layer only delivers within this event loop, so the
+    # broadcaster must send from the publishing call rather than its own thread
+    window, queues.broadcaster.window = queues.broadcaster.window, 0
+    try:
+        # Thread-sensitive database calls run on this thread, where the counter is installed
+        with connection.execute_wrapper(counter):
+            connected, broadcast = async_to_sync(session)()
+    finally:
+        queues.broadcaster.window = window
+    # Broadcast throughput counts deliveries, one per client
+    broadcast['throughput'] *= clients
+    return connected, broadcast
+
+
+def free_slots(doctor, count, start=None):
+    """Up to ``count`` unbooked (date, time slot) pairs of the doctor, from ``start`` (tomorrow) on"""
+    hours = {
+        availability.day_of_week: (availability.start_time, availability.end_time)
+        for availability in DoctorAvailability.objects.filter(doctor=doctor, is_available=True)
+    }
+    day = start or timezone.localdate() + timedelta(days=1)
+    found = []
+    for _ in range(BOOKING_HORIZON_DAYS):
+        window = slots.window_mask(*hours.get(day.strftime('%A').lower(), slots.DEFAULT_HOURS))
+        free = window & ~slots.occupancy(doctor.id, day)
+        found.extend((day, slot['value']) for slot in slots.describe(free))
+        if len(found) >= count:
+            return found[:count]
+        day += timedelta(days=1)
+    return found
+
+
+# ==================== Baselines ====================
+def save_baseline(path, results, **context):
+    with open(path, 'w') as handle:
+        json.dump(dict(context, results=results), handle, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def compare(result, baseline, tolerance):
+    """Reasons ``result`` regressed from ``baseline``, the same scenario's stored result"""
+    reasons = []
+    if result['queries'] > baseline['queries']:
+        reasons.append(f"queries {baseline['queries']} -> {result['queries']}")
+    if result['p95'] > max(baseline['p95'] * (1 + tolerance), baseline['p95'] + MIN_REGRESSION_MS):
+        reasons.append(f"p95 {baseline['p95']:.1f} -> {result['p95']:.1f} ms")
+    return reasons
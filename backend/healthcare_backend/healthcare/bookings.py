@@ -0,0 +1,95 @@
+"""
+Bulk booking for health camps and outreach drives.
+
+``book_many`` books a batch of patients into one doctor's day as a single
+unit: one block of token numbers is reserved from the department's
+TokenSequence, the appointments are inserted with ``bulk_create`` and the
+state normally derived by appointment signals (queue counters, slot
+bitmaps, rollups, doctor stats, patient dashboards) is refreshed once for
+the whole batch.
+
+A slot holds one active booking, enforced by the unique_active_slot
+constraint rather than a SELECT before the insert, which concurrent
+bookings could both pass. ``slot_guard`` turns the resulting
+IntegrityError into SlotTaken (409).
+"""
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import APIException
+
+from . import dashboards, queues, rollups, slots, stats
+from .models import Appointment, TokenSequence
+from .querysets import appointment_queryset
+
+
+def _slot_constraint_names():
+    """How the databases name unique_active_slot in their errors"""
+    constraint = next(c for c in Appointment._meta.constraints if c.name == 'unique_active_slot')
+    table = Appointment._meta.db_table
+    # MySQL and PostgreSQL give the name, SQLite the column list
+    columns = ', '.join(f'{table}.{Appointment._meta.get_field(name).column}' for name in constraint.fields)
+    return constraint.name, columns
+
+
+SLOT_CONSTRAINT_NAMES = _slot_constraint_names()
+
+
+class SlotTaken(APIException):
+    status_code = 409
+    default_detail = 'This time slot is already booked by another patient. Please select a different time.'
+    default_code = 'slot_taken'
+
+
+@contextmanager
+def slot_guard():
+    """
+    Raise SlotTaken when a write in the block is refused for booking a taken
+    slot. The write must run in its own atomic block so the surrounding
+    transaction survives the error.
+    """
+    try:
+        yield
+    except IntegrityError as error:
+        if not any(name in str(error) for name in SLOT_CONSTRAINT_NAMES):
+            raise
+        raise SlotTaken() from error
+
+
+def book_many(doctor, appointment_date, appointments, booking_type='doctor'):
+    """
+    Book ``appointments`` (dicts with patient_id, time_slot, reason and
+    optionally is_for_self and patient_relation, as validated by
+    BulkAppointmentSerializer) with ``doctor`` on ``appointment_date``.
+    Tokens follow the order of the time slots. Returns the new appointments.
+    """
+    department = doctor.department
+    entries = sorted(appointments, key=lambda entry: entry['time_slot'])
+    TokenSequence.ensure(department, appointment_date)
+    with transaction.atomic():
+        last = TokenSequence.next_value(department, appointment_date, count=len(entries))
+        date_str = appointment_date.strftime('%Y%m%d')
+        created = [
+            Appointment(
+                doctor=doctor, department=department, appointment_date=appointment_date,
+                booking_type=booking_type, token_number=f"{department.code}-{date_str}-{position:04d}",
+                queue_position=position, **entry
+            )
+            for position, entry in enumerate(entries, start=last - len(entries) + 1)
+        ]
+        Appointment.objects.bulk_create(created)
+        _refresh_derived_state(doctor.pk, appointment_date, [appointment.tracked_state() for appointment in created])
+
+    # bulk_create does not return primary keys on every backend (MySQL)
+    return list(appointment_queryset().filter(
+        token_number__in=[appointment.token_number for appointment in created]
+    ).order_by('queue_position'))
+
+
+def _refresh_derived_state(doctor_id, appointment_date, states):
+    queues.rebuild_queue_statuses(appointment_date, doctor_ids=[doctor_id], publish=True)
+    rollups.record_created(states)
+    stats.refresh(doctor_id)
+    dashboards.patients_changed(state['patient_id'] for state in states)
+    # The bitmap is rebuilt from the database on its next read
+    transaction.on_commit(lambda: slots.forget(doctor_id, appointment_date))
@@ -0,0 +1,94 @@
+"""
+Debounced, coalescing message pipeline.
+
+Messages published for the same key within ``window`` seconds of each other
+are merged into one by ``coalesce`` and sent together by a single background
+thread. The window restarts with every message but a batch is never held
+longer than ``max_delay`` seconds after its first message, so a queue that
+changes continuously still reaches clients at a bounded latency.
+
+Counts of messages published, sent and merged away are kept for
+``stats()`` and logged every ``log_interval`` seconds while messages flow.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Broadcaster:
+    def __init__(self, send, coalesce, window=0.1, max_delay=0.5, log_interval=60):
+        self.send = send
+        self.coalesce = coalesce
+        self.window = window
+        self.max_delay = max_delay
+        self.log_interval = log_interval
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stats = {'published': 0, 'sent': 0, 'coalesced': 0}
+
+    def publish(self, key, message):
+        with self._condition:
+            self._stats['published'] += 1
+            if self.window <= 0:
+                self._stats['sent'] += 1
+            else:
+                now = time.monotonic()
+                batch = self._pending.setdefault(key, {'messages': [], 'deadline': now + self.max_delay})
+                batch['messages'].append(message)
+                batch['due'] = min(now + self.window, batch['deadline'])
+                self._start()
+                self._condition.notify()
+                return
+        self._send(key, [message])
+
+    def stats(self):
+        """Messages published, messages actually sent, and messages merged away"""
+        with self._condition:
+            return dict(self._stats, pending=sum(len(b['messages']) for b in self._pending.values()))
+
+    def flush(self):
+        """Send every pending batch now"""
+        with self._condition:
+            pending, self._pending = self._pending, {}
+            self._count(pending)
+        for key, batch in pending.items():
+            self._send(key, batch['messages'])
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='queue-broadcaster', daemon=True)
+            self._thread.start()
+
+    def _count(self, batches):
+        for batch in batches.values():
+            self._stats['sent'] += 1
+            self._stats['coalesced'] += len(batch['messages']) - 1
+
+    def _run(self):
+        logged = time.monotonic()
+        while True:
+            if time.monotonic() - logged >= self.log_interval:
+                logger.info('Broadcast counters: %s', self.stats())
+                logged = time.monotonic()
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                now = time.monotonic()
+                due = {key: batch for key, batch in self._pending.items() if batch['due'] <= now}
+                if not due:
+                    self._condition.wait(min(batch['due'] for batch in self._pending.values()) - now)
+                    continue
+                for key in due:
+                    del self._pending[key]
+                self._count(due)
+            for key, batch in due.items():
+                self._send(key, batch['messages'])
+
+    def _send(self, key, messages):
+        try:
+            self.send(key, self.coalesce(key, messages))
+        except Exception:
+            logger.exception('Failed to broadcast %d message(s) for %s', len(messages), key)
@@ -0,0 +1,94 @@
+"""
+Per-endpoint query budgets.
+
+A viewset declares the most queries each action may run, either with the
+``query_budget`` decorator on an action or, for inherited actions such as
+``list``, with a ``query_budgets`` mapping on the class::
+
+    class DepartmentViewSet(viewsets.ReadOnlyModelViewSet):
+        query_budgets = {'list': 2, 'retrieve': 2}
+
+        @query_budget(3)
+        @action(detail=False, methods=['get'])
+        def summary(self, request): ...
+
+Budgets count every query of the request, authentication included.
+``QueryBudgetMiddleware`` counts the queries of each request and, depending
+on QUERY_BUDGET_MODE, logs ('log') or raises ('raise') when an action goes
+over its budget; 'off' disables counting.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Declare the maximum number of queries a viewset action may run"""
+    def decorator(func):
+        func.query_budget = limit
+        return func
+    return decorator
+
+
+def resolve_action(view_func, method):
+    """(viewset class, action name) served by a router view function, if any"""
+    cls = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    if cls is None or not actions:
+        return None, None
+    return cls, actions.get(method.lower())
+
+
+def budget_for(cls, action):
+    if cls is None or action is None:
+        return None
+    budget = getattr(getattr(cls, action, None), 'query_budget', None)
+    if budget is None:
+        budget = getattr(cls, 'query_budgets', {}).get(action)
+    return budget
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', 'log')
+
+    def __call__(self, request):
+        if self.mode == 'off':
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and counter.count > budget:
+            message = (
+                f'{request.method} {request.path} ran {counter.count} queries, '
+                f'over its budget of {budget} ({request._query_budget_action})'
+            )
+            if self.mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        cls, action = resolve_action(view_func, request.method)
+        request._query_budget = budget_for(cls, action)
+        request._query_budget_action = f'{cls.__name__}.{action}' if cls else None
@@ -0,0 +1,83 @@
+"""
+Cached public catalog.
+
+The department list and the doctor directory are served to every visitor,
+so rendered responses are kept in the cache under version numbers. Signals
+bump a version whenever something its responses show changes; entries of
+older versions are never read again and simply expire.
+
+The directory is versioned per department plus once for all doctors, so
+editing one doctor only invalidates the listings that doctor appears in.
+Its pages are stored as JSON bytes and sent without re-rendering.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from . import versions
+from .querysets import doctor_queryset
+from .serializers import DoctorSerializer
+
+CATALOG_TIMEOUT = 60 * 60
+DEPARTMENTS_VERSION_KEY = 'catalog-version:departments'
+
+
+# ==================== Departments ====================
+def departments_version():
+    return versions.version(DEPARTMENTS_VERSION_KEY)
+
+
+def departments_key(path):
+    digest = hashlib.md5(path.encode(), usedforsecurity=False).hexdigest()[:12]
+    return f'catalog:departments:{departments_version()}:{digest}'
+
+
+def bump_departments():
+    versions.bump(DEPARTMENTS_VERSION_KEY)
+
+
+def departments_changed():
+    """Invalidate cached department responses once the current transaction commits"""
+    transaction.on_commit(bump_departments)
+
+
+# ==================== Doctor Directory ====================
+def directory_version_key(department_id=None):
+    return f'catalog-version:doctors:{department_id or "all"}'
+
+
+def bump_directory(department_ids):
+    versions.bump(directory_version_key())
+    for department_id in department_ids:
+        versions.bump(directory_version_key(department_id))
+
+
+def directory_changed(department_ids):
+    """Invalidate the all-doctors listing and those of ``department_ids`` once the transaction commits"""
+    department_ids = {department_id for department_id in department_ids if department_id is not None}
+    transaction.on_commit(lambda: bump_directory(department_ids))
+
+
+def doctor_directory(department_id=None, page=1, page_size=None):
+    """
+    ``(count, results)`` for one page of verified, available doctors, where
+    ``results`` is the page already rendered to JSON. Raises InvalidPage for
+    pages out of range.
+    """
+    page_size = page_size or settings.REST_FRAMEWORK['PAGE_SIZE']
+    version = versions.version(directory_version_key(department_id))
+    key = f'catalog:doctors:{department_id or "all"}:{version}:{page_size}:{page}'
+    entry = cache.get(key)
+    if entry is None:
+        doctors = doctor_queryset().filter(is_verified=True, is_available=True)
+        if department_id:
+            doctors = doctors.filter(department_id=department_id)
+        current = Paginator(doctors, page_size).page(page)
+        results = JSONRenderer().render(DoctorSerializer(current.object_list, many=True).data)
+        entry = (current.paginator.count, results)
+        cache.set(key, entry, CATALOG_TIMEOUT)
+    return entry
@@ -1,9 +1,9 @@
 import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Doctor, Appointment, QueueStatus
-from django.utils import timezone
-from .models import User # Make sure User is imported if you plan to auth
+from . import queues
 
 class QueueConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for live queue updates"""
@@ -11,6 +11,8 @@ class QueueConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.doctor_id = self.scope['url_route']['kwargs']['doctor_id']
         self.room_group_name = f'queue_{self.doctor_id}'
+        # (epoch, seq) of the newest queue state sent to the client
+        self.position = None
 
         # Join room group
         await self.channel_layer.group_add(
@@ -19,9 +21,11 @@ class QueueConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
-        # Send initial queue status
-        queue_data = await self.get_queue_status()
-        await self.send(text_data=json.dumps(queue_data))
+        # Send initial queue status, or only the missed deltas when resuming
+        # with ?epoch=<epoch>&seq=<seq>
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        position = self.parse_position(params.get('epoch', [None])[0], params.get('seq', [None])[0])
+        await self.send_queue(await self.get_queue_status(position))
 
     async def disconnect(self, close_code):
         # Leave room group
@@ -31,54 +35,65 @@ class QueueConsumer(AsyncWebsocketConsumer):
         )
 
     async def receive(self, text_data):
-        """Handle incoming messages (e.g., manual refresh request)"""
-        queue_data = await self.get_queue_status()
-        await self.send(text_data=json.dumps(queue_data))
+        """
+        Handle incoming messages: {"type": "resume", "epoch": ..., "seq": ...}
+        replays missed deltas, anything else (e.g. manual refresh) gets a snapshot
+        """
+        try:
+            message = json.loads(text_data)
+        except ValueError:
+            message = None
+        position = None
+        if isinstance(message, dict) and message.get('type') == 'resume':
+            position = self.parse_position(message.get('epoch'), message.get('seq'))
+        await self.send_queue(await self.get_queue_status(position))
 
     async def queue_update(self, event):
-        """Send message to WebSocket when a queue_update is received"""
-        await self.send(text_data=json.dumps(event['data']))
+        """Send message to WebSocket when a queue_update is received, unless the client is already past it"""
+        message = self.unseen(event['data'])
+        if message is not None:
+            await self.send_queue(message)
+
+    async def send_queue(self, message):
+        if 'epoch' in message:
+            self.position = (message['epoch'], message['seq'])
+        await self.send(text_data=json.dumps(message))
+
+    def unseen(self, message):
+        """
+        ``message`` without the deltas the client already has; None if it
+        brings nothing newer. Broadcasts from different workers can arrive
+        out of order.
+        """
+        if self.position is None or 'epoch' not in message:
+            return message
+        epoch, seq = self.position
+        if message['epoch'] != epoch:
+            return message if message['epoch'] > epoch else None
+        if message['type'] == 'queue_replay':
+            deltas = [delta for delta in message['deltas'] if delta['seq'] > seq]
+            return dict(message, deltas=deltas) if deltas else None
+        return message if message['seq'] > seq else None
+
+    @staticmethod
+    def parse_position(epoch, seq):
+        try:
+            return int(epoch), int(seq)
+        except (TypeError, ValueError):
+            return None
 
     @database_sync_to_async
-    def get_queue_status(self):
-        """Fetches the current queue status from the database"""
-        try:
-            doctor = Doctor.objects.get(id=self.doctor_id)
-            today = timezone.now().date()
-
-            # Get today's appointments that are in the queue
-            appointments = Appointment.objects.filter(
-                doctor=doctor,
-                appointment_date=today,
-                status__in=['scheduled', 'confirmed', 'in_progress']
-            ).order_by('queue_position')
-
-            # Get the single QueueStatus object for the day
-            queue_status = QueueStatus.objects.filter(
-                doctor=doctor,
-                appointment_date=today
-            ).first()
-
-            return {
-                'type': 'queue_status',
-                'doctor_id': doctor.id,
-                'doctor_name': doctor.full_name,
-                'current_token': queue_status.current_token if queue_status else None,
-                'total_tokens': queue_status.total_tokens if queue_status else 0,
-                'completed_tokens': queue_status.completed_tokens if queue_status else 0,
-                'queue': [
-                    {
-                        'token_number': apt.token_number,
-                        'patient_name': apt.patient.full_name,
-                        'status': apt.status,
-                        'queue_position': apt.queue_position,
-                        'estimated_time': str(apt.estimated_time) if apt.estimated_time else None,
-                    }
-                    for apt in appointments
-                ]
-            }
-        except Doctor.DoesNotExist:
+    def get_queue_status(self, position=None):
+        """Reads the doctor's live queue snapshot; the database is only hit to rebuild it"""
+        if not self.doctor_id.isdigit():
+            data = None
+        elif position is not None:
+            data = queues.resume(self.doctor_id, *position)
+        else:
+            data = queues.get_snapshot(self.doctor_id)
+        if data is None:
             return {'type': 'error', 'message': 'Doctor not found'}
+        return data
 
 
 class AppointmentConsumer(AsyncWebsocketConsumer):
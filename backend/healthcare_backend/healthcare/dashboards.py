@@ -0,0 +1,143 @@
+"""
+Cached dashboards.
+
+The admin dashboard counts rows across whole tables, and admin screens
+reload it constantly, so its stats are shared through the cache. An entry is
+served as is for ADMIN_DASHBOARD_TTL seconds; after that the stale entry is
+still returned while a single background thread recomputes it, so only a
+cold cache makes a request wait for the counts.
+
+A patient's dashboard is cached under a per-patient version that signals
+bump whenever that patient's profile, appointments or medical records are
+written. Names of doctors and departments it embeds may lag behind by up to
+PATIENT_DASHBOARD_TIMEOUT.
+"""
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from . import versions
+from .models import User, Doctor, Department, Appointment, AppointmentRollup
+from .querysets import appointment_queryset, medical_record_queryset
+from .serializers import UserProfileSerializer, AppointmentSerializer, MedicalRecordSerializer
+
+logger = logging.getLogger(__name__)
+
+ADMIN_DASHBOARD_KEY = 'dashboard:admin'
+ADMIN_DASHBOARD_TTL = 15
+# How long a stale entry may still be served while it is refreshed
+ADMIN_DASHBOARD_MAX_AGE = 60 * 5
+REFRESH_LOCK_TIMEOUT = 30
+PATIENT_DASHBOARD_TIMEOUT = 60 * 5
+
+
+# ==================== Admin Dashboard ====================
+def admin_stats():
+    """Admin dashboard stats, one conditional aggregate per table"""
+    today = timezone.now().date()
+    users = User.objects.aggregate(
+        total_users=Count('id'),
+        total_patients=Count('id', filter=Q(role='patient')),
+    )
+    doctors = Doctor.objects.aggregate(
+        total_doctors=Count('id'),
+        pending_verifications=Count('id', filter=Q(is_verified=False)),
+    )
+    # Appointment totals come from the daily rollups, see healthcare.rollups
+    appointments = AppointmentRollup.objects.aggregate(
+        total_appointments=Sum('count'),
+        today_appointments=Sum('count', filter=Q(appointment_date=today)),
+    )
+    return {
+        'total_users': users['total_users'],
+        'total_patients': users['total_patients'],
+        'total_doctors': doctors['total_doctors'],
+        'total_departments': Department.objects.filter(is_active=True).count(),
+        'total_appointments': appointments['total_appointments'] or 0,
+        'today_appointments': appointments['today_appointments'] or 0,
+        'pending_verifications': doctors['pending_verifications'],
+        'recent_registrations': UserProfileSerializer(User.objects.order_by('-created_at')[:5], many=True).data,
+    }
+
+
+def refresh_admin_dashboard():
+    stats = admin_stats()
+    cache.set(ADMIN_DASHBOARD_KEY, {'stats': stats, 'computed_at': time.time()}, ADMIN_DASHBOARD_MAX_AGE)
+    return stats
+
+
+def admin_dashboard():
+    entry = cache.get(ADMIN_DASHBOARD_KEY)
+    if entry is None:
+        return refresh_admin_dashboard()
+    if time.time() - entry['computed_at'] > ADMIN_DASHBOARD_TTL:
+        _refresh_in_background()
+    return entry['stats']
+
+
+def _refresh_in_background():
+    # One refresh at a time across processes; the others keep serving the stale entry
+    lock_key = f'{ADMIN_DASHBOARD_KEY}:refreshing'
+    if not cache.add(lock_key, 1, REFRESH_LOCK_TIMEOUT):
+        return
+
+    def run():
+        try:
+            refresh_admin_dashboard()
+        except Exception:
+            logger.exception('Admin dashboard refresh failed')
+        finally:
+            cache.delete(lock_key)
+            connection.close()
+
+    threading.Thread(target=run, name='admin-dashboard-refresh', daemon=True).start()
+
+
+# ==================== Patient Dashboard ====================
+def patient_version_key(patient_id):
+    return f'dashboard-version:patient:{patient_id}'
+
+
+def patients_changed(patient_ids):
+    """Invalidate the dashboards of ``patient_ids`` once the current transaction commits"""
+    patient_ids = {patient_id for patient_id in patient_ids if patient_id is not None}
+
+    def bump():
+        for patient_id in patient_ids:
+            versions.bump(patient_version_key(patient_id))
+
+    transaction.on_commit(bump)
+
+
+def patient_stats(user):
+    """Patient dashboard payload, built in a fixed number of queries"""
+    today = timezone.now().date()
+    upcoming = list(appointment_queryset().filter(
+        patient_id=user.id,
+        appointment_date__gte=today,
+        status__in=['scheduled', 'confirmed']
+    ).order_by('appointment_date', 'time_slot')[:5])
+    recent_records = medical_record_queryset().filter(patient_id=user.id).order_by('-visit_date')[:3]
+    return {
+        'profile': UserProfileSerializer(user).data,
+        'upcoming_appointments': AppointmentSerializer(upcoming, many=True).data,
+        'recent_records': MedicalRecordSerializer(recent_records, many=True).data,
+        'total_appointments': Appointment.objects.filter(patient_id=user.id).count(),
+        'pending_appointments': len(upcoming),
+    }
+
+
+def patient_dashboard(user):
+    # Keyed by date as well, since what counts as upcoming changes at midnight
+    version = versions.version(patient_version_key(user.id))
+    key = f'dashboard:patient:{user.id}:{version}:{timezone.now().date().isoformat()}'
+    data = cache.get(key)
+    if data is None:
+        data = patient_stats(user)
+        cache.set(key, data, PATIENT_DASHBOARD_TIMEOUT)
+    return data
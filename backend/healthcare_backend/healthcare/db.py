@@ -0,0 +1,18 @@
+"""Database helpers shared by the bulk maintenance paths"""
+from django.db import connections, router
+
+
+def bulk_upsert(model, objs, unique_fields, update_fields, batch_size=None):
+    """
+    Insert ``objs``, updating ``update_fields`` on rows that hit the unique
+    constraint over ``unique_fields``. MySQL picks the constraint itself and
+    rejects an explicit target, so it is only passed where supported.
+    """
+    features = connections[router.db_for_write(model)].features
+    return model.objects.bulk_create(
+        objs,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=unique_fields if features.supports_update_conflicts_with_target else None,
+        update_fields=update_fields,
+    )
@@ -0,0 +1,217 @@
+"""
+Bulk import of patients and doctors from CSV or NDJSON.
+
+Rows are processed in chunks. Each chunk is validated without queries
+(field formats via ``clean_fields``), checked for existing emails, phones,
+Aadhaar and license numbers with one batched ``IN`` query per table, hashed
+across a process pool, and written with ``bulk_create`` in one transaction:
+users, then doctor profiles, then their weekly availability.
+
+Rows whose user already exists are skipped rather than rejected, so running
+an import again after it stopped halfway is safe.
+"""
+import csv
+import json
+import uuid
+from datetime import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from . import catalog
+from .models import User, Doctor, Department, DoctorAvailability
+from .passwords import hash_password
+
+USER_FIELDS = ('email', 'full_name', 'phone', 'date_of_birth', 'gender', 'address', 'aadhaar_number', 'blood_group')
+DOCTOR_FIELDS = ('specialty', 'qualification', 'experience', 'license_number', 'consultation_fee', 'bio')
+ROLES = ('patient', 'doctor')
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(path, fmt):
+    """Rows of a CSV or NDJSON file as dicts"""
+    with open(path, newline='', encoding='utf-8') as handle:
+        if fmt == 'csv':
+            yield from csv.DictReader(handle)
+            return
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_availability(value):
+    """(day, start, end) triples from 'monday 09:00-17:00; tuesday 09:00-13:00' or a list of dicts"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [
+            dict(zip(('day_of_week', 'hours'), part.split()))
+            for part in value.split(';') if part.strip()
+        ]
+    try:
+        entries = []
+        for entry in value:
+            start, end = entry['hours'].split('-') if 'hours' in entry else (entry['start_time'], entry['end_time'])
+            entries.append((entry['day_of_week'].lower(), time.fromisoformat(start), time.fromisoformat(end)))
+        return entries
+    except (KeyError, ValueError, AttributeError):
+        raise RowError(f'Invalid availability: {value!r}')
+
+
+def _errors(error):
+    return '; '.join(f'{field}: {" ".join(messages)}' for field, messages in error.message_dict.items())
+
+
+class Candidate:
+    """One valid row, ready to be written"""
+
+    def __init__(self, number, row, default_role, departments):
+        self.number = number
+        role = (row.get('role') or default_role).lower()
+        if role not in ROLES:
+            raise RowError(f'Unknown role {role!r}')
+
+        self.password = row.get('password') or None
+        self.user = User(
+            role=role, is_verified=role == 'doctor',
+            **{name: row.get(name) or None for name in USER_FIELDS}
+        )
+        self.user.email = User.objects.normalize_email(self.user.email or '')
+        self.user.full_name = self.user.full_name or ''
+        self.user.blood_group = self.user.blood_group or ''
+        try:
+            self.user.clean_fields(exclude=['password', 'username'])
+        except ValidationError as error:
+            raise RowError(_errors(error))
+        # As User.save() would, which bulk_create does not call
+        self.user.username = self.user.email.split('@')[0] + str(uuid.uuid4())[:8]
+
+        self.doctor = None
+        self.availability = []
+        if role == 'doctor':
+            department_id = departments.get((row.get('department') or '').upper())
+            if department_id is None:
+                raise RowError(f"Unknown department {row.get('department')!r}")
+            self.doctor = Doctor(department_id=department_id, is_verified=True, **{
+                name: row.get(name) or ('' if name == 'bio' else None) for name in DOCTOR_FIELDS
+            })
+            self.availability = [
+                DoctorAvailability(day_of_week=day, start_time=start, end_time=end)
+                for day, start, end in parse_availability(row.get('availability'))
+            ]
+            try:
+                self.doctor.clean_fields(exclude=['user', 'department', 'registered_by'])
+                for availability in self.availability:
+                    availability.clean_fields(exclude=['doctor'])
+            except ValidationError as error:
+                raise RowError(_errors(error))
+
+    def unique_values(self):
+        """(kind, value) pairs that must not exist yet"""
+        values = [('email', self.user.email), ('phone', self.user.phone)]
+        if self.user.aadhaar_number:
+            values.append(('aadhaar_number', self.user.aadhaar_number))
+        if self.doctor:
+            values.append(('license_number', self.doctor.license_number))
+        return values
+
+
+class Importer:
+    """
+    Imports chunks of rows, remembering the unique values it has seen so
+    duplicates within the file are rejected too
+    """
+
+    def __init__(self, default_role='patient', hash_passwords=None):
+        self.default_role = default_role
+        self.hash_passwords = hash_passwords or (lambda passwords: [hash_password(password) for password in passwords])
+        self.departments = {code.upper(): pk for code, pk in Department.objects.values_list('code', 'id')}
+        self.seen = {'email': set(), 'phone': set(), 'aadhaar_number': set(), 'license_number': set()}
+
+    def import_chunk(self, numbered_rows):
+        """Import ``(row number, row)`` pairs; returns (created, skipped, [(row number, reason)])"""
+        candidates, rejected = [], []
+        for number, row in numbered_rows:
+            try:
+                candidates.append(Candidate(number, row, self.default_role, self.departments))
+            except RowError as error:
+                rejected.append((number, str(error)))
+
+        existing = self._existing(candidates)
+        new, skipped = [], 0
+        for candidate in candidates:
+            if candidate.user.email in existing['email']:
+                skipped += 1
+                continue
+            clash = next((
+                f'{kind} {value} already exists' if value in existing[kind] else f'duplicate {kind} {value} in file'
+                for kind, value in candidate.unique_values()
+                if value in existing[kind] or value in self.seen[kind]
+            ), None)
+            if clash:
+                rejected.append((candidate.number, clash))
+                continue
+            for kind, value in candidate.unique_values():
+                self.seen[kind].add(value)
+            new.append(candidate)
+
+        for candidate, hashed in zip(new, self.hash_passwords([candidate.password for candidate in new])):
+            candidate.user.password = hashed
+        if new:
+            self._write(new)
+        return len(new), skipped, rejected
+
+    def _existing(self, candidates):
+        """Unique values of ``candidates`` already in the database, one query per table"""
+        wanted = {'email': set(), 'phone': set(), 'aadhaar_number': set(), 'license_number': set()}
+        for candidate in candidates:
+            for kind, value in candidate.unique_values():
+                wanted[kind].add(value)
+
+        existing = {kind: set() for kind in wanted}
+        if candidates:
+            for row in User.objects.filter(
+                Q(email__in=wanted['email']) | Q(phone__in=wanted['phone'])
+                | Q(aadhaar_number__in=wanted['aadhaar_number'])
+            ).order_by().values('email', 'phone', 'aadhaar_number'):
+                for kind, value in row.items():
+                    existing[kind].add(value)
+        if wanted['license_number']:
+            existing['license_number'] = set(Doctor.objects.filter(
+                license_number__in=wanted['license_number']
+            ).values_list('license_number', flat=True))
+        return existing
+
+    @transaction.atomic
+    def _write(self, candidates):
+        User.objects.bulk_create([candidate.user for candidate in candidates])
+        doctors = [candidate for candidate in candidates if candidate.doctor]
+        if not doctors:
+            return
+
+        # bulk_create does not return primary keys on every backend (MySQL)
+        user_ids = dict(User.objects.filter(
+            email__in=[candidate.user.email for candidate in doctors]
+        ).values_list('email', 'id'))
+        for candidate in doctors:
+            candidate.doctor.user_id = user_ids[candidate.user.email]
+        Doctor.objects.bulk_create([candidate.doctor for candidate in doctors])
+
+        doctor_ids = dict(Doctor.objects.filter(
+            license_number__in=[candidate.doctor.license_number for candidate in doctors]
+        ).values_list('license_number', 'id'))
+        availability = []
+        for candidate in doctors:
+            for entry in candidate.availability:
+                entry.doctor_id = doctor_ids[candidate.doctor.license_number]
+                availability.append(entry)
+        DoctorAvailability.objects.bulk_create(availability)
+
+        # bulk_create sends no signals, so invalidate the catalog here
+        catalog.departments_changed()
+        catalog.directory_changed({candidate.doctor.department_id for candidate in doctors})
+
@@ -0,0 +1,202 @@
+"""
+WebSocket fan-out load testing for the queue and appointment consumers.
+
+``LoadTest`` opens many concurrent clients on ``ws/queue/<doctor_id>/``
+(lobby displays) and ``ws/appointments/<user_id>/`` (patient phones), then
+publishes rounds of updates to their channel groups exactly as the queue
+broadcaster does, and measures how long each message takes to reach each
+client. See the ``loadtest_websockets`` command.
+
+Clients run either in-process, as channels' WebsocketCommunicator against
+the consumers on the in-memory channel layer, or against a running server
+(``ws://host:port``) through the optional ``websockets`` package. Against a
+server, updates are published on the configured channel layer, so it must
+be the one the server uses (Redis). Every message carries its sequence
+number, so latency is measured on this process's clock either way.
+
+In-process runs share one event loop between clients and consumers, and
+the in-memory channel layer sweeps every channel for expired messages on
+each send and receive, so with thousands of clients they mostly measure
+that; capacity figures for a daphne worker should come from ``--url``.
+"""
+import asyncio
+import json
+import time as clock
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from .benchmarks import percentiles
+from .routing import websocket_urlpatterns
+
+QUEUE_PATH = 'ws/queue/{}/'
+APPOINTMENTS_PATH = 'ws/appointments/{}/'
+
+
+def rss_bytes(pid='self'):
+    """Resident memory of a process, from /proc (Linux); None where unavailable"""
+    try:
+        with open(f'/proc/{pid}/status') as handle:
+            for line in handle:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class CommunicatorClient:
+    """A client served by the consumers in this process"""
+    application = None
+
+    def __init__(self, path):
+        if CommunicatorClient.application is None:
+            CommunicatorClient.application = URLRouter(websocket_urlpatterns)
+        self.communicator = WebsocketCommunicator(self.application, f'/{path}')
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise ConnectionError('WebSocket connection rejected')
+
+    async def receive(self, timeout):
+        return await self.communicator.receive_from(timeout)
+
+    async def close(self):
+        # A receive that timed out has already stopped the application
+        if not self.communicator.future.done():
+            await self.communicator.disconnect()
+
+
+class ServerClient:
+    """A client of a running server, through the optional ``websockets`` package"""
+
+    def __init__(self, url, path):
+        self.url = f"{url.rstrip('/')}/{path}"
+        self.socket = None
+
+    async def connect(self):
+        import websockets
+
+        self.socket = await websockets.connect(self.url, max_size=None)
+
+    async def receive(self, timeout):
+        return await asyncio.wait_for(self.socket.recv(), timeout)
+
+    async def close(self):
+        await self.socket.close()
+
+
+class LoadTest:
+    """
+    ``queue_clients`` are spread over ``doctor_ids`` and
+    ``appointment_clients`` over ``user_ids``. Each of ``rounds`` publishes
+    one update to every queue and every user, ``interval`` seconds apart.
+    ``payloads`` maps doctor ids to the queue snapshot sent as the body of
+    their updates, so messages are the size clients really receive.
+    """
+
+    def __init__(self, doctor_ids, user_ids, queue_clients, appointment_clients, rounds=10, interval=0.1,
+                 payloads=None, url=None, server_pid=None, connect_batch=200, timeout=30):
+        self.targets = (
+            [(QUEUE_PATH.format(doctor_ids[n % len(doctor_ids)]), True) for n in range(queue_clients)]
+            + [(APPOINTMENTS_PATH.format(user_ids[n % len(user_ids)]), False) for n in range(appointment_clients)]
+        )
+        self.doctor_ids = sorted({doctor_ids[n % len(doctor_ids)] for n in range(queue_clients)})
+        self.user_ids = sorted({user_ids[n % len(user_ids)] for n in range(appointment_clients)})
+        self.rounds = rounds
+        self.interval = interval
+        self.payloads = payloads or {}
+        self.url = url
+        self.server_pid = server_pid
+        self.connect_batch = connect_batch
+        self.timeout = timeout
+        self.sent = {}
+        self.latencies = []
+
+    def client(self, path):
+        return ServerClient(self.url, path) if self.url else CommunicatorClient(path)
+
+    def memory(self):
+        return rss_bytes(self.server_pid or 'self')
+
+    async def run(self):
+        """Connect, broadcast and disconnect; returns the measurements"""
+        memory_before = self.memory()
+        clients, connect_times = [], []
+        for start in range(0, len(self.targets), self.connect_batch):
+            batch = self.targets[start:start + self.connect_batch]
+            connected = await asyncio.gather(*(self._connect(path, is_queue) for path, is_queue in batch))
+            for client, elapsed in connected:
+                clients.append(client)
+                connect_times.append(elapsed)
+        memory_after = self.memory()
+
+        # Every client is in one group, which gets one message per round
+        readers = [asyncio.create_task(self._read(client, self.rounds)) for client in clients]
+        started = clock.perf_counter()
+        await self._publish()
+        published = clock.perf_counter()
+        received = sum(await asyncio.gather(*readers))
+        finished = clock.perf_counter()
+        await asyncio.gather(*(client.close() for client in clients))
+
+        return {
+            'clients': len(clients),
+            'connect_ms': percentiles(connect_times),
+            'memory_per_client': (
+                (memory_after - memory_before) / len(clients) if memory_before and memory_after and clients
+                else None
+            ),
+            'published': len(self.sent),
+            'publish_seconds': published - started,
+            'expected': len(clients) * self.rounds,
+            'received': received,
+            'throughput': received / (finished - started) if finished > started else 0.0,
+            'latency_ms': dict(percentiles(self.latencies), max=max(self.latencies)) if self.latencies else None,
+        }
+
+    async def _connect(self, path, is_queue):
+        client = self.client(path)
+        started = clock.perf_counter()
+        await client.connect()
+        if is_queue:
+            # The consumer sends the current snapshot on connect
+            await client.receive(self.timeout)
+        return client, (clock.perf_counter() - started) * 1000
+
+    async def _publish(self):
+        layer = get_channel_layer()
+        for number in range(self.rounds):
+            if number:
+                await asyncio.sleep(self.interval)
+            # The same events the queue broadcaster and the appointment consumer expect
+            for doctor_id in self.doctor_ids:
+                # A later seq each round, as the consumer drops queue states its client already has
+                payload = self.payloads.get(doctor_id, {})
+                await self._send(layer, f'queue_{doctor_id}', 'queue_update', dict(
+                    payload, seq=payload.get('seq', 0) + number + 1
+                ))
+            for user_id in self.user_ids:
+                await self._send(layer, f'appointments_{user_id}', 'appointment_update', {'type': 'appointment'})
+
+    async def _send(self, layer, group, event, body):
+        sequence = len(self.sent)
+        self.sent[sequence] = clock.perf_counter()
+        await layer.group_send(group, {'type': event, 'data': dict(body, loadtest_seq=sequence)})
+
+    async def _read(self, client, expected):
+        """Receive ``expected`` load test messages, or as many as arrive without a gap of ``timeout``"""
+        received = 0
+        while received < expected:
+            try:
+                message = json.loads(await client.receive(self.timeout))
+            except (asyncio.TimeoutError, TimeoutError):
+                break
+            sequence = message.get('loadtest_seq')
+            if sequence is None:
+                continue
+            self.latencies.append((clock.perf_counter() - self.sent[sequence]) * 1000)
+            received += 1
+        return received
@@ -0,0 +1,24 @@
+"""Cross-process locks held in the cache, for read-modify-write of cached state"""
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+LOCK_TIMEOUT = 5
+
+
+@contextmanager
+def cache_lock(key, timeout=None):
+    """Lock ``key`` for the block; yields False if it could not be taken within ``timeout`` seconds"""
+    timeout = timeout or LOCK_TIMEOUT
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + timeout
+    while not cache.add(lock_key, 1, timeout):
+        if time.monotonic() > deadline:
+            yield False
+            return
+        time.sleep(0.005)
+    try:
+        yield True
+    finally:
+        cache.delete(lock_key)
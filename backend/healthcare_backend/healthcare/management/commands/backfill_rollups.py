@@ -0,0 +1,38 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from healthcare.models import Appointment
+from healthcare.rollups import rebuild_rollups
+
+# Days recomputed per transaction
+CHUNK_DAYS = 31
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily appointment rollups behind the admin reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First date to rebuild (YYYY-MM-DD), defaults to the earliest appointment')
+        parser.add_argument('--end', help='Last date to rebuild (YYYY-MM-DD), defaults to the latest appointment')
+
+    def handle(self, *args, **options):
+        bounds = Appointment.objects.aggregate(first=Min('appointment_date'), last=Max('appointment_date'))
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else bounds['first']
+            end = date.fromisoformat(options['end']) if options['end'] else bounds['last']
+        except ValueError:
+            raise CommandError('Invalid date format, expected YYYY-MM-DD')
+        if start is None or end is None:
+            self.stdout.write('No appointments to roll up')
+            return
+        if start > end:
+            raise CommandError('--start is after --end')
+
+        rows = 0
+        while start <= end:
+            chunk_end = min(start + timedelta(days=CHUNK_DAYS - 1), end)
+            rows += rebuild_rollups(start, chunk_end)
+            start = chunk_end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows'))
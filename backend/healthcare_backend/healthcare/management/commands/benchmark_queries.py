@@ -0,0 +1,195 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from healthcare.authentication import ClaimsRefreshToken
+from healthcare.benchmarks import (
+    IN_MEMORY_CHANNEL_LAYERS, compare, free_slots, load_baseline, measure_queue_socket, measure_requests,
+    save_baseline,
+)
+from healthcare.models import Doctor, User, Appointment
+from healthcare.synthetic import Generator
+
+# (role, method, path) measured; None is an anonymous request. Paths are
+# filled in with the doctor measured and the first date with free slots.
+ENDPOINTS = [
+    (None, 'GET', '/api/departments/'),
+    (None, 'POST', '/api/auth/login/'),
+    ('patient', 'GET', '/api/patient/dashboard/'),
+    ('patient', 'GET', '/api/appointments/'),
+    ('patient', 'GET', '/api/appointments/available_slots/?doctor_id={doctor_id}&date={date}'),
+    ('patient', 'POST', '/api/appointments/'),
+    ('patient', 'GET', '/api/medical-records/'),
+    ('doctor', 'GET', '/api/doctor/dashboard/'),
+    ('doctor', 'GET', '/api/doctor/appointments/'),
+    ('doctor', 'GET', '/api/appointments/'),
+    ('admin', 'GET', '/api/appointments/'),
+    ('admin', 'GET', '/api/doctor/'),
+    ('admin', 'GET', '/api/medical-records/'),
+    ('admin', 'GET', '/api/queue-status/'),
+    ('admin', 'GET', '/api/queue-status/?doctor={doctor_id}'),
+    ('admin', 'GET', '/api/admin/dashboard/'),
+    ('admin', 'GET', '/api/admin/reports/'),
+    ('admin', 'GET', '/api/admin/reports/?type=doctors'),
+]
+# Names of the queue WebSocket results
+QUEUE_CONNECT = 'WS /ws/queue/{doctor_id}/ connect'
+QUEUE_BROADCAST = 'WS /ws/queue/{doctor_id}/ broadcast'
+
+BENCH_PATIENTS = 2000
+# Days of appointments seeded, two thirds of them history
+BENCH_DAYS = 90
+# Average appointments per doctor per working day, well below a day's slots
+BENCH_PER_DAY = 20
+# Appointments the generator books per doctor per day of its range, per
+# unit of ``per_day`` (weekends off, future days only partly booked)
+BOOKED_PER_DAY = 0.8
+LOGIN_EMAIL = 'bench-login@example.com'
+LOGIN_PASSWORD = 'bench-login-password'
+# Appointments booked by the benchmark, deleted again afterwards
+BOOKING_REASON = 'Benchmark booking'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency percentiles, queries per request and throughput of the hot endpoints and the queue '
+        'WebSocket, optionally saving a baseline or comparing against one'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--appointments', type=int, default=0,
+            help='Seed synthetic data until the database holds at least this many appointments'
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per endpoint')
+        parser.add_argument('--clients', type=int, default=50, help='WebSocket clients connected to one queue')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for synthetic data')
+        parser.add_argument('--baseline', default='benchmark_baseline.json', help='Baseline file')
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+        parser.add_argument('--compare', action='store_true',
+                            help='Compare against the baseline and fail on regressions')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Growth of p95 latency tolerated when comparing, as a fraction')
+
+    def handle(self, *args, **options):
+        missing = options['appointments'] - Appointment.objects.count()
+        if missing > 0:
+            self.stdout.write(f'Seeding {missing} appointments...')
+            self.seed(missing, options['seed'])
+
+        baseline = load_baseline(options['baseline'])['results'] if options['compare'] else {}
+        users, doctor = self.pick_users()
+        plan = free_slots(doctor, options['repeat']) if doctor else []
+        context = {'doctor_id': doctor.id if doctor else '', 'date': plan[0][0].isoformat() if plan else ''}
+
+        self.stdout.write(
+            f'{"scenario":<72} {"role":<8} {"status":>6} {"queries":>7} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"p99 ms":>8} {"per s":>8}' + (f' {"base p95":>8}' if baseline else '')
+        )
+        results, regressions = {}, []
+
+        def report(name, role, result):
+            results[f'{name} [{role or "-"}]'] = result
+            line = (
+                f'{name:<72} {role or "-":<8} {result["status"] or "-":>6} {result["queries"]:>7} '
+                f'{result["p50"]:>8.1f} {result["p95"]:>8.1f} {result["p99"]:>8.1f} {result["throughput"]:>8.1f}'
+            )
+            previous = baseline.get(f'{name} [{role or "-"}]')
+            if previous:
+                reasons = compare(result, previous, options['tolerance'])
+                line += f' {previous["p95"]:>8.1f}'
+                if reasons:
+                    regressions.append(f'{name} [{role or "-"}]: {", ".join(reasons)}')
+                    line = self.style.ERROR(f'{line}  REGRESSED ({", ".join(reasons)})')
+            self.stdout.write(line)
+
+        for role, method, path in ENDPOINTS:
+            if role and role not in users or '{doctor_id}' in path and not doctor:
+                continue
+            client = APIClient()
+            if role:
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(users[role]).access_token}')
+            name = f'{method} {path}'
+            if (method, path) == ('POST', '/api/auth/login/'):
+                self.ensure_login_user()
+                data = {'email': LOGIN_EMAIL, 'password': LOGIN_PASSWORD}
+            elif (method, path) == ('POST', '/api/appointments/'):
+                if len(plan) < options['repeat']:
+                    self.stdout.write(f'{name:<72} skipped: not enough free slots')
+                    continue
+                report(name, role, self.measure_bookings(client, doctor, plan, options['repeat']))
+                continue
+            else:
+                data = None
+            report(name, role, measure_requests(client, method, path.format(**context), options['repeat'], data))
+
+        if doctor:
+            with override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS):
+                connected, broadcast = measure_queue_socket(doctor.id, options['clients'], options['repeat'])
+            report(QUEUE_CONNECT, None, connected)
+            report(QUEUE_BROADCAST, None, broadcast)
+
+        if options['save_baseline']:
+            save_baseline(
+                options['baseline'], results, appointments=Appointment.objects.count(),
+                repeat=options['repeat'], clients=options['clients'], created=timezone.now().isoformat()
+            )
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}"))
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+
+    @staticmethod
+    def measure_bookings(client, doctor, plan, repeat):
+        """Book one free slot per request, then delete the bookings so repeated runs see the same data"""
+        last_id = Appointment.objects.aggregate(last=Max('id'))['last'] or 0
+        try:
+            return measure_requests(client, 'POST', '/api/appointments/', repeat, lambda n: {
+                'doctor': doctor.id, 'department': doctor.department_id,
+                'appointment_date': plan[n][0].isoformat(), 'time_slot': plan[n][1],
+                'reason': BOOKING_REASON, 'booking_type': 'doctor',
+            })
+        finally:
+            Appointment.objects.filter(id__gt=last_id, doctor=doctor, reason=BOOKING_REASON).delete()
+
+    @staticmethod
+    def ensure_login_user():
+        user, created = User.objects.get_or_create(email=LOGIN_EMAIL, defaults={
+            'full_name': 'Bench Login', 'phone': '+910000000001', 'role': 'patient'
+        })
+        if created or not user.check_password(LOGIN_PASSWORD):
+            user.set_password(LOGIN_PASSWORD)
+            user.save()
+
+    def pick_users(self):
+        """The busiest patient and doctor, and any admin, to make requests as; and that doctor's profile"""
+        users = {}
+        admin = User.objects.filter(role='admin').first()
+        if admin:
+            users['admin'] = admin
+        patient_id, doctor_id = (
+            Appointment.objects.values(field).annotate(n=Count('id')).order_by('-n').values_list(field, flat=True).first()
+            for field in ('patient', 'doctor')
+        )
+        doctor = None
+        if patient_id:
+            users['patient'] = User.objects.get(pk=patient_id)
+        if doctor_id:
+            doctor = Doctor.objects.select_related('user').get(pk=doctor_id)
+            users['doctor'] = doctor.user
+        return users, doctor
+
+    def seed(self, count, seed):
+        """Generate synthetic data until the database holds at least ``count`` more appointments"""
+        target = Appointment.objects.count() + count
+        while (missing := target - Appointment.objects.count()) > 0:
+            doctors = math.ceil(missing / (BENCH_DAYS * BENCH_PER_DAY * BOOKED_PER_DAY))
+            Generator(
+                patients=max(BENCH_PATIENTS, missing // 50), doctors=doctors,
+                days=BENCH_DAYS * 2 // 3, future_days=BENCH_DAYS // 3,
+                per_day=missing / (doctors * BENCH_DAYS * BOOKED_PER_DAY), seed=seed,
+            ).run()
+            seed += 1
@@ -0,0 +1,49 @@
+import argparse
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from healthcare.synthetic import BATCH_SIZE, Generator
+
+
+def count(value):
+    """A non-negative whole number, also written like 1e6"""
+    try:
+        number = float(value)
+    except ValueError:
+        number = -1
+    if number < 0 or not number.is_integer():
+        raise argparse.ArgumentTypeError(f'{value!r} is not a whole number')
+    return int(number)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset: departments, demo accounts, doctors, patients, appointments and '
+        'medical records. The same seed, sizes and --today give the same data on the same starting database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=count, default=200, help='Patients to create, e.g. 1e6')
+        parser.add_argument('--doctors', type=count, default=12, help='Doctors to create')
+        parser.add_argument('--days', type=count, default=30, help='Days of appointment history, up to and including today')
+        parser.add_argument('--future-days', type=count, default=14, help='Days of appointments booked ahead')
+        parser.add_argument('--per-day', type=float, default=12,
+                            help='Average appointments per working doctor per day')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--today', type=date.fromisoformat, help='Anchor date (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--password', default='password123', help='Password of every generated account')
+        parser.add_argument('--batch-size', type=count, default=BATCH_SIZE, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        generator = Generator(
+            patients=options['patients'], doctors=options['doctors'], days=options['days'],
+            future_days=options['future_days'], per_day=options['per_day'], seed=options['seed'],
+            today=options['today'], password=options['password'], batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        written = generator.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {written['patients']} patients, {written['doctors']} doctors, "
+            f"{written['appointments']} appointments and {written['medical_records']} medical records"
+        ))
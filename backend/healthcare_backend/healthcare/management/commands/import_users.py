@@ -0,0 +1,82 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from healthcare.imports import Importer, read_rows
+from healthcare.passwords import hash_password, init_worker
+
+
+class Command(BaseCommand):
+    help = 'Import patients and doctors (with their availability) from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or NDJSON with one object per line')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--role', choices=['patient', 'doctor'], default='patient',
+                            help='Role of rows without a role column')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows validated and written per transaction')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes hashing passwords; 0 hashes in this process')
+        parser.add_argument('--progress', help='Progress file used to resume, defaults to <path>.progress')
+        parser.add_argument('--restart', action='store_true', help='Ignore earlier progress and start from row 1')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        progress_path = options['progress'] or f'{path}.progress'
+        progress = {'rows': 0, 'created': 0, 'skipped': 0, 'rejected': 0}
+        if os.path.exists(progress_path) and not options['restart']:
+            with open(progress_path) as handle:
+                progress.update(json.load(handle))
+            self.stdout.write(f"Resuming after row {progress['rows']}")
+
+        pool = None
+        if options['workers']:
+            pool = ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker)
+            importer = Importer(options['role'], lambda passwords: list(pool.map(hash_password, passwords, chunksize=16)))
+        else:
+            importer = Importer(options['role'])
+
+        # Rows are numbered from 1, as in the progress file
+        rows = enumerate(islice(read_rows(path, fmt), progress['rows'], None), start=progress['rows'] + 1)
+        try:
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                created, skipped, rejected = importer.import_chunk(chunk)
+                for number, reason in rejected:
+                    self.stderr.write(f'Row {number}: {reason}')
+
+                progress['rows'] = chunk[-1][0]
+                progress['created'] += created
+                progress['skipped'] += skipped
+                progress['rejected'] += len(rejected)
+                self._save(progress_path, progress)
+                self.stdout.write(
+                    f"Rows {chunk[0][0]}-{chunk[-1][0]}: {created} created, {skipped} already present, "
+                    f"{len(rejected)} rejected"
+                )
+        except json.JSONDecodeError as error:
+            raise CommandError(f"Row {progress['rows'] + 1} and after could not be read: {error}")
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {progress['created']} users ({progress['skipped']} already present, "
+            f"{progress['rejected']} rejected) from {progress['rows']} rows"
+        ))
+
+    @staticmethod
+    def _save(path, progress):
+        # Written after each committed chunk, and replaced atomically so an interrupted write never loses it
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(progress, handle)
+        os.replace(temporary, path)
@@ -0,0 +1,93 @@
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import override_settings
+
+from healthcare.benchmarks import IN_MEMORY_CHANNEL_LAYERS
+from healthcare.loadtest import LoadTest
+from healthcare.models import Appointment, Doctor, User
+from healthcare.queues import get_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Open many WebSocket clients on the queue and appointment consumers, broadcast updates to them and '
+        'report connect time, memory per connection, delivery latency and throughput'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue-clients', type=int, default=1000, help='Clients on ws/queue/<doctor_id>/')
+        parser.add_argument('--appointment-clients', type=int, default=0,
+                            help='Clients on ws/appointments/<user_id>/')
+        parser.add_argument('--doctors', type=int, default=10, help='Queues the queue clients are spread over')
+        parser.add_argument('--rounds', type=int, default=10, help='Updates sent to every queue and user')
+        parser.add_argument('--interval', type=float, default=0.1, help='Seconds between rounds')
+        parser.add_argument('--connect-batch', type=int, default=200, help='Clients connecting concurrently')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds a client waits for its next message before giving up')
+        parser.add_argument(
+            '--url',
+            help='Server to connect to, e.g. ws://localhost:8000 (needs the websockets package and the '
+                 "server's channel layer); by default clients run in-process on the in-memory channel layer"
+        )
+        parser.add_argument('--server-pid', type=int, help="Server process whose memory is measured with --url")
+
+    def handle(self, *args, **options):
+        if options['url']:
+            try:
+                import websockets  # noqa: F401
+            except ImportError:
+                raise CommandError('--url needs the websockets package: pip install websockets')
+            if isinstance(get_channel_layer(), InMemoryChannelLayer):
+                raise CommandError("--url needs the server's channel layer (e.g. Redis), not the in-memory one")
+
+        # Busiest doctors and patients first, so queues carry realistic snapshots
+        doctor_ids = list(Appointment.objects.values('doctor').annotate(n=Count('id')).order_by('-n').values_list(
+            'doctor', flat=True
+        )[:options['doctors']]) or list(Doctor.objects.values_list('id', flat=True)[:options['doctors']])
+        user_ids = list(User.objects.filter(role='patient').values_list('id', flat=True)[:max(
+            options['appointment_clients'], 1
+        )])
+        if options['queue_clients'] and not doctor_ids:
+            raise CommandError('No doctors to open queues for; generate data first (see generate_data)')
+        if options['appointment_clients'] and not user_ids:
+            raise CommandError('No patients to open appointment updates for; generate data first (see generate_data)')
+
+        load_test = LoadTest(
+            doctor_ids, user_ids, options['queue_clients'], options['appointment_clients'],
+            rounds=options['rounds'], interval=options['interval'],
+            payloads={doctor_id: get_snapshot(doctor_id) for doctor_id in doctor_ids},
+            url=options['url'], server_pid=options['server_pid'],
+            connect_batch=options['connect_batch'], timeout=options['timeout'],
+        )
+        if options['url']:
+            result = async_to_sync(load_test.run)()
+        else:
+            with override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS):
+                result = async_to_sync(load_test.run)()
+        self.report(result, options)
+
+    def report(self, result, options):
+        connect = result['connect_ms']
+        self.stdout.write(
+            f"Connected {result['clients']} clients: p50 {connect['p50']:.1f} ms, p95 {connect['p95']:.1f} ms, "
+            f"p99 {connect['p99']:.1f} ms"
+        )
+        if result['memory_per_client'] is not None:
+            whose = 'server' if options['url'] else 'process, client and consumer sides'
+            self.stdout.write(f"Memory: {result['memory_per_client'] / 1024:.1f} KiB per connection ({whose})")
+        self.stdout.write(
+            f"Published {result['published']} updates in {result['publish_seconds']:.2f} s; "
+            f"delivered {result['received']} of {result['expected']}, {result['throughput']:.0f} messages/s"
+        )
+        latency = result['latency_ms']
+        if latency:
+            self.stdout.write(
+                f"Broadcast-to-receive latency: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+                f"p99 {latency['p99']:.1f} ms, max {latency['max']:.1f} ms"
+            )
+        missing = result['expected'] - result['received']
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} messages did not arrive within the timeout'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Every client received every update'))
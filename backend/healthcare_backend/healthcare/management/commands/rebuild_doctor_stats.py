@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from healthcare.stats import rebuild_doctor_stats
+
+
+class Command(BaseCommand):
+    help = 'Recount every doctor\'s patient and consultation totals from their appointments'
+
+    def handle(self, *args, **options):
+        rows = rebuild_doctor_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rows} doctors'))
@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from healthcare.queues import rebuild_queue_statuses
+
+
+class Command(BaseCommand):
+    help = 'Recompute QueueStatus counters for a date from its appointments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Date to rebuild (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        try:
+            appointment_date = date.fromisoformat(options['date']) if options['date'] else timezone.now().date()
+        except ValueError:
+            raise CommandError('Invalid date format, expected YYYY-MM-DD')
+
+        rows = rebuild_queue_statuses(appointment_date)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} queue status rows for {appointment_date}'))
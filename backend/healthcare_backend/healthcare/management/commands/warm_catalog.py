@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from healthcare import catalog
+from healthcare.models import Department
+
+
+class Command(BaseCommand):
+    help = 'Render every page of the doctor directory into the cache, for all doctors and per department'
+
+    def handle(self, *args, **options):
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        scopes = [None] + list(Department.objects.filter(is_active=True).values_list('id', flat=True))
+        pages = 0
+        for department_id in scopes:
+            page = 1
+            while True:
+                count, _ = catalog.doctor_directory(department_id, page)
+                pages += 1
+                if page * page_size >= count:
+                    break
+                page += 1
+        self.stdout.write(self.style.SUCCESS(f'Warmed {pages} doctor directory pages for {len(scopes)} listings'))
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0003_doctor_average_time_per_patient_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField()),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_sequences', to='healthcare.department')),
+            ],
+            options={
+                'db_table': 'token_sequences',
+                'unique_together': {('department', 'appointment_date')},
+            },
+        ),
+    ]
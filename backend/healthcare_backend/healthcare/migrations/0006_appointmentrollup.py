@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:20
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Count the appointments booked before the table existed, since the
+    reports read the rollups from here on.
+    """
+    Appointment = apps.get_model('healthcare', 'Appointment')
+    AppointmentRollup = apps.get_model('healthcare', 'AppointmentRollup')
+    counts = Appointment.objects.order_by().values(
+        'appointment_date', 'department_id', 'doctor_id', 'status'
+    ).annotate(count=Count('id'))
+    AppointmentRollup.objects.bulk_create(
+        (AppointmentRollup(**row) for row in counts.iterator()), batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='healthcare.department')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='healthcare.doctor')),
+            ],
+            options={
+                'db_table': 'appointment_rollups',
+                'indexes': [models.Index(fields=['appointment_date', 'status'], name='appointment_appoint_a4c665_idx')],
+                'unique_together': {('appointment_date', 'department', 'doctor', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0006_appointmentrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorStats',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='healthcare.doctor')),
+                ('total_patients', models.IntegerField(default=0)),
+                ('total_consultations', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Doctor stats',
+                'db_table': 'doctor_stats',
+            },
+        ),
+    ]
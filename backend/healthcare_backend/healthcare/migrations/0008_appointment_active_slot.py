@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:55
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+import healthcare.models
+
+
+BOOKED_STATUSES = ['scheduled', 'confirmed', 'in_progress']
+
+
+def mark_active_slots(apps, schema_editor):
+    """
+    Flag the appointments holding their slot. Where a slot was already
+    double-booked, only the earliest booking keeps the flag, so the
+    constraint can be created; the others are left for staff to move or
+    cancel, and are refused as a taken slot (409) if started or saved as
+    booked in the meantime.
+    """
+    Appointment = apps.get_model('healthcare', 'Appointment')
+    active = Appointment.objects.filter(status__in=BOOKED_STATUSES)
+    active.update(active_slot=True)
+    clashes = active.values('doctor_id', 'appointment_date', 'time_slot').annotate(
+        n=Count('id'), first=Min('id')
+    ).filter(n__gt=1)
+    for clash in clashes:
+        active.filter(
+            doctor_id=clash['doctor_id'], appointment_date=clash['appointment_date'], time_slot=clash['time_slot']
+        ).exclude(id=clash['first']).update(active_slot=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0007_doctorstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='active_slot',
+            field=healthcare.models.ActiveSlotField(default=None, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_active_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('doctor', 'appointment_date', 'time_slot', 'active_slot'), name='unique_active_slot'),
+        ),
+    ]
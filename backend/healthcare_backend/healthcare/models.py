@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.validators import RegexValidator
 from django.utils import timezone
@@ -85,6 +86,8 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     last_login_at = models.DateTimeField(null=True, blank=True)
+    # Tokens from logins before this are refused, see healthcare.authentication
+    tokens_revoked_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['full_name', 'phone']
@@ -99,12 +102,27 @@ class User(AbstractUser):
             models.Index(fields=['email']),
             models.Index(fields=['role']),
             models.Index(fields=['is_active']),
+            models.Index(fields=['created_at']),
         ]
         ordering = ['-created_at']
 
     def __str__(self):
         return f"{self.full_name} ({self.email}) - {self.get_role_display()}"
 
+    # Fields shown in the doctor directory, and those carried in auth tokens
+    DIRECTORY_FIELDS = ('full_name', 'email', 'phone')
+    AUTH_FIELDS = ('role', 'is_active')
+    TRACKED_FIELDS = DIRECTORY_FIELDS + AUTH_FIELDS
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._tracked_state = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        return {name: self.__dict__.get(name) for name in self.TRACKED_FIELDS}
+
     def save(self, *args, **kwargs):
         if not self.username:
             # Create a unique username if not provided
@@ -222,6 +240,13 @@ class Doctor(models.Model):
     def __str__(self):
         return f"Dr. {self.user.full_name} - {self.specialty}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # A doctor moved to another department leaves the old department's directory
+        instance._loaded_department_id = instance.__dict__.get('department_id')
+        return instance
+
     @property
     def full_name(self):
         return f"Dr. {self.user.full_name}"
@@ -269,6 +294,25 @@ class DoctorAvailability(models.Model):
         return f"{self.doctor.full_name} - {self.get_day_of_week_display()}"
 
 
+class ActiveSlotField(models.BooleanField):
+    """
+    True while the appointment holds its time slot, NULL once it is
+    completed, cancelled or missed. Set from the status on every save, so it
+    cannot drift; the unique (doctor, date, time slot, active_slot)
+    constraint then lets the database refuse a second booking of a slot,
+    as NULLs never collide (MySQL has no partial unique indexes).
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.update(null=True, default=None, editable=False)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = True if model_instance.status in Appointment.BOOKED_STATUSES else None
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class Appointment(models.Model):
     """Appointment booking system with queue management"""
     STATUS_CHOICES = [
@@ -306,6 +350,7 @@ class Appointment(models.Model):
         choices=STATUS_CHOICES,
         default='scheduled'
     )
+    active_slot = ActiveSlotField()
 
     # Token System
     token_number = models.CharField(max_length=20, unique=True, blank=True)
@@ -337,29 +382,100 @@ class Appointment(models.Model):
         ordering = ['-appointment_date', 'queue_position']
         indexes = [
             models.Index(fields=['appointment_date', 'doctor']),
+            models.Index(fields=['patient', 'appointment_date']),
             models.Index(fields=['status']),
             models.Index(fields=['token_number']),
         ]
-        # Note: Serializer validation ensures only one patient per time slot
+        # One active booking per slot, enforced by the insert or update itself
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'time_slot', 'active_slot'], name='unique_active_slot'
+            ),
+        ]
+
+    # Statuses that hold a time slot
+    BOOKED_STATUSES = ('scheduled', 'confirmed', 'in_progress')
+
+    # Fields that derived booking state (slot bitmaps, queue counters) is keyed on
+    TRACKED_FIELDS = (
+        'doctor_id', 'department_id', 'patient_id',
+        'appointment_date', 'time_slot', 'status', 'token_number',
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._tracked_state = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        return {name: self.__dict__.get(name) for name in self.TRACKED_FIELDS}
 
     def save(self, *args, **kwargs):
-        if not self.token_number:
-            # Generate unique token: DEPT-YYYYMMDD-NNNN
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'active_slot'}
+        if self.token_number:
+            return super().save(*args, **kwargs)
+
+        # Generate unique token: DEPT-YYYYMMDD-NNNN
+        TokenSequence.ensure(self.department, self.appointment_date)
+        with transaction.atomic():
+            count = TokenSequence.next_value(self.department, self.appointment_date)
             date_str = self.appointment_date.strftime('%Y%m%d')
-            dept_prefix = self.department.code
-            count = Appointment.objects.filter(
-                department=self.department,
-                appointment_date=self.appointment_date
-            ).count() + 1
-            self.token_number = f"{dept_prefix}-{date_str}-{count:04d}"
+            self.token_number = f"{self.department.code}-{date_str}-{count:04d}"
             # Set queue position
             self.queue_position = count
-        super().save(*args, **kwargs)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.token_number}: {self.patient.full_name} with {self.doctor.full_name}"
 
 
+class TokenSequence(models.Model):
+    """Per-department daily counter backing appointment token numbers"""
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='token_sequences')
+    appointment_date = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'token_sequences'
+        unique_together = ['department', 'appointment_date']
+
+    def __str__(self):
+        return f"{self.department.code} ({self.appointment_date}) - {self.last_value}"
+
+    @classmethod
+    def ensure(cls, department, appointment_date):
+        """Create the counter row for the day, seeded past any tokens issued before it existed"""
+        if cls.objects.filter(department=department, appointment_date=appointment_date).exists():
+            return
+        seed = Appointment.objects.filter(
+            department=department,
+            appointment_date=appointment_date
+        ).aggregate(last=Max('queue_position'))['last'] or 0
+        try:
+            with transaction.atomic():
+                cls.objects.create(department=department, appointment_date=appointment_date, last_value=seed)
+        except IntegrityError:
+            # Created concurrently, seeded the same way
+            pass
+
+    @classmethod
+    def next_value(cls, department, appointment_date, count=1):
+        """
+        Reserve the next ``count`` values of an existing counter and return
+        the last of them.
+
+        Must run inside the transaction that saves the appointment: the UPDATE
+        holds the row lock until commit, so concurrent bookings are serialized
+        on this single row and a rolled back booking gives its numbers back.
+        """
+        sequence = cls.objects.filter(department=department, appointment_date=appointment_date)
+        sequence.update(last_value=F('last_value') + count)
+        return sequence.values_list('last_value', flat=True).get()
+
+
 class QueueStatus(models.Model):
     """Real-time queue status for doctors"""
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='queue_statuses')
@@ -379,6 +495,40 @@ class QueueStatus(models.Model):
         return f"{self.doctor.full_name} ({self.appointment_date}) - Token: {self.current_token}"
 
 
+class AppointmentRollup(models.Model):
+    """Number of appointments per day, department, doctor and status, kept for reports"""
+    appointment_date = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='daily_rollups')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='daily_rollups')
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'appointment_rollups'
+        unique_together = ['appointment_date', 'department', 'doctor', 'status']
+        indexes = [
+            models.Index(fields=['appointment_date', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.appointment_date} {self.department_id}/{self.doctor_id} {self.status}: {self.count}"
+
+
+class DoctorStats(models.Model):
+    """Lifetime counters shown on the doctor dashboard, kept in step with appointments"""
+    doctor = models.OneToOneField(Doctor, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_patients = models.IntegerField(default=0)
+    total_consultations = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'doctor_stats'
+        verbose_name_plural = 'Doctor stats'
+
+    def __str__(self):
+        return f"{self.doctor_id}: {self.total_patients} patients, {self.total_consultations} consultations"
+
+
 class MedicalRecord(models.Model):
     """Patient medical records from consultations"""
     patient = models.ForeignKey(
@@ -0,0 +1,99 @@
+"""
+Keyset pagination.
+
+Each page continues after the ordering values of the previous page's last
+row (``WHERE (created_at, id) < (...)``) instead of skipping rows with
+OFFSET, so a deep page costs the same as the first one as long as the
+ordering is backed by an index. The ordering must end with a unique field,
+normally ``id``, so rows with equal values are neither skipped nor repeated.
+
+Pages link forward only and carry no total count, which would need a full
+scan of the list.
+"""
+import base64
+import json
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+
+    def __init__(self, ordering=None):
+        if ordering:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = getattr(view, 'keyset_ordering', None) or self.ordering
+        fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._after(ordering, self._decode(cursor, fields)))
+
+        size = self.get_page_size(request)
+        rows = list(queryset.order_by(*ordering)[:size + 1])
+        self.next_position = None
+        if len(rows) > size:
+            rows = rows[:size]
+            self.next_position = [getattr(rows[-1], field.attname) for field in fields]
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self._encode(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    @staticmethod
+    def _after(ordering, position):
+        """Rows strictly after ``position`` in ``ordering``"""
+        clauses, equal = [], {}
+        for name, value in zip(ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            clauses.append(Q(**equal, **{f'{field}__{lookup}': value}))
+            equal[field] = value
+        return reduce(or_, clauses)
+
+    @staticmethod
+    def _encode(position):
+        # isoformat() rather than DjangoJSONEncoder, which drops microseconds
+        return base64.urlsafe_b64encode(json.dumps(position, default=lambda value: value.isoformat()).encode()).decode()
+
+    @staticmethod
+    def _decode(cursor, fields):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(fields, values)]
+        except Exception:
+            raise NotFound('Invalid cursor')
@@ -0,0 +1,18 @@
+"""
+Password hashing for worker processes.
+
+Kept free of model imports so a process pool can load it, and set Django up
+through ``init_worker``, under any multiprocessing start method.
+"""
+
+
+def init_worker():
+    import django
+
+    django.setup()
+
+
+def hash_password(password):
+    from django.contrib.auth.hashers import make_password
+
+    return make_password(password or None)
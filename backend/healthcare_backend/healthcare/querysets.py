@@ -0,0 +1,34 @@
+"""
+Querysets that load everything their serializers read in a fixed number of
+queries, shared by the views and the response caches.
+"""
+from .models import Doctor, Appointment, MedicalRecord
+
+
+def only_fields(model, *related_fields):
+    """only() arguments keeping every column of ``model`` but just ``related_fields`` of its joins"""
+    return [field.name for field in model._meta.concrete_fields] + list(related_fields)
+
+
+def appointment_queryset():
+    """Appointments joined with everything AppointmentSerializer reads"""
+    return Appointment.objects.select_related('patient', 'doctor__user', 'department').only(*only_fields(
+        Appointment,
+        'patient__full_name', 'patient__phone',
+        'doctor__specialty', 'doctor__user__full_name',
+        'department__name', 'department__code',
+    ))
+
+
+def doctor_queryset():
+    """Doctors joined and prefetched with everything DoctorSerializer reads"""
+    return Doctor.objects.select_related('user', 'department').prefetch_related('availabilities').only(*only_fields(
+        Doctor, 'user__full_name', 'user__email', 'user__phone', 'department__name',
+    ))
+
+
+def medical_record_queryset():
+    """Medical records joined with everything MedicalRecordSerializer reads"""
+    return MedicalRecord.objects.select_related('patient', 'doctor__user', 'appointment').only(*only_fields(
+        MedicalRecord, 'patient__full_name', 'doctor__user__full_name', 'appointment__token_number',
+    ))
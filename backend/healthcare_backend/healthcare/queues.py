@@ -0,0 +1,440 @@
+"""
+Queue state derived from appointment status transitions.
+
+QueueStatus counters are maintained incrementally: every appointment change
+is turned into per-(doctor, date) deltas and applied with one atomic UPDATE
+instead of recounting the day. ``rebuild_queue_statuses`` recomputes the rows
+for a date from scratch (see the ``rebuild_queue_status`` command) and, once
+committed, reloads those queues' snapshots.
+
+The live queue shown on lobby screens is a snapshot per (doctor, date) held
+in the cache (Redis in production), which is its source of truth. Snapshots
+are patched in place on every transition, so WebSocket consumers read the
+queue without touching the database; it is only loaded from the database
+when a snapshot is missing, e.g. after a cache restart.
+
+Clients on ``ws/queue/<doctor_id>/`` get a ``queue_status`` snapshot carrying
+an ``epoch`` and ``seq``, then one ``queue_delta`` per transition with the
+next ``seq``. A client reconnecting with its last epoch and seq receives a
+``queue_replay`` of the deltas it missed, or a fresh snapshot when the replay
+log no longer covers them or the snapshot was rebuilt (new epoch). Messages
+for one queue published within QUEUE_BROADCAST_WINDOW seconds are sent as a
+single ``queue_replay`` (or latest snapshot), at most
+QUEUE_BROADCAST_MAX_DELAY seconds after the first of them. Deltas are
+published under the snapshot's lock, and the consumer drops anything older
+than what its client already has, as batches sent by different workers can
+still arrive out of order.
+"""
+import asyncio
+import atexit
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.utils import timezone
+
+from .broadcast import Broadcaster
+from .db import bulk_upsert
+from .locks import cache_lock
+from .models import Appointment, Doctor, QueueStatus
+
+# Statuses that hold a token in the day's queue
+COUNTED_STATUSES = ['scheduled', 'confirmed', 'in_progress', 'completed']
+# Statuses listed in the live queue
+LIVE_STATUSES = ['scheduled', 'confirmed', 'in_progress']
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+# Deltas kept per queue for clients resuming after a reconnect
+REPLAY_LOG_SIZE = 200
+
+
+def _deltas(state, sign, deltas):
+    key = (state['doctor_id'], state['appointment_date'])
+    delta = deltas.setdefault(key, {'total': 0, 'completed': 0, 'start': None, 'stop': None})
+    status = state['status']
+    if status in COUNTED_STATUSES:
+        delta['total'] += sign
+    if status == 'completed':
+        delta['completed'] += sign
+    if status == 'in_progress':
+        delta['start' if sign > 0 else 'stop'] = state['token_number']
+
+
+def record_change(before, after, appointment):
+    """Apply the queue changes for ``appointment`` going from ``before`` to ``after``"""
+    deltas = {}
+    if before is not None:
+        _deltas(before, -1, deltas)
+    if after is not None:
+        _deltas(after, 1, deltas)
+
+    for (doctor_id, appointment_date), delta in deltas.items():
+        _apply_counters(doctor_id, appointment_date, delta)
+
+    if deltas:
+        transaction.on_commit(lambda: _patch_snapshots(deltas, before, after, appointment))
+
+
+def _apply_counters(doctor_id, appointment_date, delta):
+    updates = {}
+    if delta['total']:
+        updates['total_tokens'] = F('total_tokens') + delta['total']
+    if delta['completed']:
+        updates['completed_tokens'] = F('completed_tokens') + delta['completed']
+    if delta['start'] and delta['start'] != delta['stop']:
+        updates['current_token'] = delta['start']
+    elif delta['stop'] and not delta['start']:
+        updates['current_token'] = Case(
+            When(current_token=delta['stop'], then=Value('')),
+            default=F('current_token')
+        )
+    if updates:
+        _apply(doctor_id, appointment_date, updates)
+
+
+def _apply(doctor_id, appointment_date, updates):
+    rows = QueueStatus.objects.filter(doctor_id=doctor_id, appointment_date=appointment_date)
+    if rows.update(last_updated=timezone.now(), **updates):
+        return
+    # First change of the day: count what is already there, including this change
+    try:
+        with transaction.atomic():
+            QueueStatus.objects.create(
+                doctor_id=doctor_id,
+                appointment_date=appointment_date,
+                **_recount(doctor_id, appointment_date)
+            )
+    except IntegrityError:
+        # Created concurrently by another booking that could not see this one
+        rows.update(last_updated=timezone.now(), **updates)
+
+
+def _recount(doctor_id, appointment_date):
+    return rebuild_values(Appointment.objects.filter(
+        doctor_id=doctor_id,
+        appointment_date=appointment_date
+    )).get(doctor_id, {'total_tokens': 0, 'completed_tokens': 0, 'current_token': ''})
+
+
+def rebuild_values(appointments):
+    """QueueStatus field values per doctor for an appointment queryset covering one date"""
+    values = {
+        row['doctor_id']: {
+            'total_tokens': row['total'],
+            'completed_tokens': row['completed'],
+            'current_token': '',
+        }
+        for row in appointments.order_by().values('doctor_id').annotate(
+            total=Count('id', filter=Q(status__in=COUNTED_STATUSES)),
+            completed=Count('id', filter=Q(status='completed')),
+        )
+    }
+    for doctor_id, token_number in appointments.filter(
+        status='in_progress'
+    ).order_by('queue_position').values_list('doctor_id', 'token_number'):
+        if doctor_id in values and not values[doctor_id]['current_token']:
+            values[doctor_id]['current_token'] = token_number
+    return values
+
+
+def rebuild_queue_statuses(appointment_date, doctor_ids=None, publish=False):
+    """
+    Recompute the QueueStatus rows for a date, of every doctor or just
+    ``doctor_ids``, in bulk; returns the number of rows written.
+
+    Cached snapshots of the rebuilt queues are dropped on commit. Only with
+    ``publish`` are today's sent out afresh, which is for requests that
+    changed the queues; maintenance rebuilds leave subscribers alone.
+    """
+    appointments = Appointment.objects.filter(appointment_date=appointment_date)
+    statuses = QueueStatus.objects.filter(appointment_date=appointment_date)
+    if doctor_ids is not None:
+        appointments = appointments.filter(doctor_id__in=doctor_ids)
+        statuses = statuses.filter(doctor_id__in=doctor_ids)
+    values = rebuild_values(appointments)
+    for doctor_id in statuses.exclude(doctor_id__in=values).values_list('doctor_id', flat=True):
+        values[doctor_id] = {'total_tokens': 0, 'completed_tokens': 0, 'current_token': ''}
+
+    now = timezone.now()
+    transaction.on_commit(lambda: _reload_snapshots(appointment_date, list(values), publish))
+    bulk_upsert(
+        QueueStatus,
+        [
+            QueueStatus(doctor_id=doctor_id, appointment_date=appointment_date, last_updated=now, **fields)
+            for doctor_id, fields in values.items()
+        ],
+        unique_fields=['doctor', 'appointment_date'],
+        update_fields=['total_tokens', 'completed_tokens', 'current_token', 'last_updated'],
+    )
+    return len(values)
+
+
+# ==================== Queue Versions ====================
+def version_key(appointment_date, doctor_id=None):
+    key = f'queue-version:{appointment_date.isoformat()}'
+    return f'{key}:{doctor_id}' if doctor_id is not None else key
+
+
+def version(appointment_date, doctor_id=None):
+    """
+    Opaque counter that changes whenever a queue of the date (or of one
+    doctor on that date) changes; used for ETags without touching the database
+    """
+    key = version_key(appointment_date, doctor_id)
+    value = cache.get(key)
+    if value is None:
+        # Seeded from the clock so a lost counter never reissues an old value
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump_versions(appointment_date, doctor_ids):
+    for key in [version_key(appointment_date)] + [version_key(appointment_date, d) for d in doctor_ids]:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+# ==================== Live Queue Snapshots ====================
+def snapshot_key(doctor_id, appointment_date):
+    return f'queue:{doctor_id}:{appointment_date.isoformat()}'
+
+
+def queue_entry(appointment, patient_name):
+    return {
+        'token_number': appointment.token_number,
+        'patient_name': patient_name,
+        'status': appointment.status,
+        'queue_position': appointment.queue_position,
+        'estimated_time': str(appointment.estimated_time) if appointment.estimated_time else None,
+    }
+
+
+def get_state(doctor_id, appointment_date=None):
+    """
+    The cached live queue of a doctor's day as ``{'snapshot': ..., 'log': [...]}``,
+    or None if the doctor does not exist. ``log`` holds the most recent deltas
+    so reconnecting clients can catch up without a full snapshot.
+    """
+    appointment_date = appointment_date or timezone.now().date()
+    key = snapshot_key(doctor_id, appointment_date)
+    state = cache.get(key)
+    if state is None:
+        snapshot = build_snapshot(doctor_id, appointment_date)
+        if snapshot is None:
+            return None
+        state = {'snapshot': snapshot, 'log': []}
+        if not cache.add(key, state, SNAPSHOT_TIMEOUT):
+            # Built concurrently; use the copy others are patching
+            state = cache.get(key) or state
+    return state
+
+
+def get_snapshot(doctor_id, appointment_date=None):
+    """The live queue of a doctor's day; None if the doctor does not exist"""
+    state = get_state(doctor_id, appointment_date)
+    return state['snapshot'] if state else None
+
+
+def resume(doctor_id, epoch, seq):
+    """
+    Message bringing a client that last saw ``seq`` of ``epoch`` up to date:
+    the missed deltas if the replay log still covers them, else a snapshot.
+    """
+    state = get_state(doctor_id)
+    if state is None:
+        return None
+    snapshot = state['snapshot']
+    missed = [event for event in state['log'] if event['seq'] > seq]
+    covered = missed[0]['seq'] == seq + 1 if missed else seq == snapshot['seq']
+    if epoch != snapshot['epoch'] or not covered:
+        return snapshot
+    return {'type': 'queue_replay', 'epoch': snapshot['epoch'], 'seq': snapshot['seq'], 'deltas': missed}
+
+
+def build_snapshot(doctor_id, appointment_date):
+    """Load a snapshot from the database: the doctor, the day's queue and its counters"""
+    doctor = Doctor.objects.select_related('user').filter(pk=doctor_id).first()
+    if doctor is None:
+        return None
+
+    appointments = Appointment.objects.filter(
+        doctor=doctor,
+        appointment_date=appointment_date,
+        status__in=LIVE_STATUSES
+    ).select_related('patient').only(
+        'token_number', 'status', 'queue_position', 'estimated_time', 'patient__full_name'
+    ).order_by('queue_position')
+
+    queue_status = QueueStatus.objects.filter(
+        doctor=doctor,
+        appointment_date=appointment_date
+    ).first()
+
+    return {
+        'type': 'queue_status',
+        # A new epoch tells clients their sequence numbers no longer apply
+        'epoch': time.time_ns() // 1000,
+        'seq': 0,
+        'doctor_id': doctor.id,
+        'doctor_name': doctor.full_name,
+        'current_token': queue_status.current_token if queue_status else None,
+        'total_tokens': queue_status.total_tokens if queue_status else 0,
+        'completed_tokens': queue_status.completed_tokens if queue_status else 0,
+        'queue': [queue_entry(apt, apt.patient.full_name) for apt in appointments],
+    }
+
+
+def _patch_snapshots(deltas, before, after, appointment):
+    today = timezone.now().date()
+    for (doctor_id, appointment_date), delta in deltas.items():
+        key = snapshot_key(doctor_id, appointment_date)
+        with cache_lock(key) as acquired:
+            state = cache.get(key) if acquired else None
+            if state is not None:
+                message = _patch_snapshot(state, delta, doctor_id, appointment_date, before, after, appointment)
+                cache.set(key, state, SNAPSHOT_TIMEOUT)
+            else:
+                # Missing, or unsafe to patch: rebuild so listeners start a new epoch
+                cache.delete(key)
+                message = None
+            bump_versions(appointment_date, [doctor_id])
+            if appointment_date != today:
+                continue
+            # Published under the lock so deltas are queued in seq order
+            if message is None:
+                message = get_snapshot(doctor_id, appointment_date)
+            if message is not None:
+                publish(doctor_id, message)
+
+
+def _reload_snapshots(appointment_date, doctor_ids, send):
+    """Drop the snapshots of rebuilt queues and, with ``send``, send today's out afresh"""
+    send = send and appointment_date == timezone.now().date()
+    for doctor_id in doctor_ids:
+        key = snapshot_key(doctor_id, appointment_date)
+        with cache_lock(key):
+            cache.delete(key)
+            if not send:
+                continue
+            snapshot = get_snapshot(doctor_id, appointment_date)
+            if snapshot is not None:
+                publish(doctor_id, snapshot)
+    bump_versions(appointment_date, doctor_ids)
+
+
+def _event(key, before, after):
+    """Name of what happened to the token in the queue identified by ``key``"""
+    was_live = (
+        before is not None and before['status'] in LIVE_STATUSES
+        and (before['doctor_id'], before['appointment_date']) == key
+    )
+    is_here = after is not None and (after['doctor_id'], after['appointment_date']) == key
+    status = after['status'] if is_here else None
+    if status == 'in_progress':
+        return 'started'
+    if status in LIVE_STATUSES:
+        return 'updated' if was_live else 'added'
+    if status == 'completed':
+        return 'completed'
+    if status in ('cancelled', 'no_show'):
+        return 'cancelled'
+    return 'removed'
+
+
+def _patch_snapshot(state, delta, doctor_id, appointment_date, before, after, appointment):
+    """Apply a transition to ``state`` and return the delta message describing it"""
+    snapshot = state['snapshot']
+    queue = snapshot['queue']
+    previous = next((e for e in queue if e['token_number'] == appointment.token_number), None)
+    if previous is not None:
+        queue.remove(previous)
+
+    entry = None
+    if (after is not None and after['status'] in LIVE_STATUSES
+            and (after['doctor_id'], after['appointment_date']) == (doctor_id, appointment_date)):
+        patient_name = previous['patient_name'] if previous else appointment.patient.full_name
+        entry = queue_entry(appointment, patient_name)
+        index = next(
+            (i for i, e in enumerate(queue) if e['queue_position'] > entry['queue_position']),
+            len(queue)
+        )
+        queue.insert(index, entry)
+
+    snapshot['total_tokens'] += delta['total']
+    snapshot['completed_tokens'] += delta['completed']
+    if delta['start'] and delta['start'] != delta['stop']:
+        snapshot['current_token'] = delta['start']
+    elif delta['stop'] and not delta['start'] and snapshot['current_token'] == delta['stop']:
+        snapshot['current_token'] = ''
+
+    snapshot['seq'] += 1
+    message = {
+        'type': 'queue_delta',
+        'epoch': snapshot['epoch'],
+        'seq': snapshot['seq'],
+        'event': _event((doctor_id, appointment_date), before, after),
+        'token_number': appointment.token_number,
+        'entry': entry,
+        'current_token': snapshot['current_token'],
+        'total_tokens': snapshot['total_tokens'],
+        'completed_tokens': snapshot['completed_tokens'],
+    }
+    state['log'] = (state['log'] + [message])[-REPLAY_LOG_SIZE:]
+    return message
+
+
+def _group_send(doctor_id, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        f'queue_{doctor_id}',
+        {'type': 'queue_update', 'data': message}
+    )
+
+
+def _group_send_at_exit(doctor_id, message):
+    """_group_send on an event loop of its own: asgiref's executors refuse new work at interpreter exit"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    asyncio.run(channel_layer.group_send(
+        f'queue_{doctor_id}',
+        {'type': 'queue_update', 'data': message}
+    ))
+
+
+def _coalesce(doctor_id, messages):
+    """One message equivalent to ``messages``: a replay of the deltas, or the latest snapshot"""
+    if len(messages) == 1:
+        return messages[0]
+    epochs = {message['epoch'] for message in messages}
+    if len(epochs) == 1 and all(message['type'] == 'queue_delta' for message in messages):
+        return {'type': 'queue_replay', 'epoch': messages[-1]['epoch'], 'seq': messages[-1]['seq'], 'deltas': messages}
+    return get_snapshot(doctor_id) or messages[-1]
+
+
+broadcaster = Broadcaster(
+    send=_group_send,
+    coalesce=_coalesce,
+    window=getattr(settings, 'QUEUE_BROADCAST_WINDOW', 0.1),
+    max_delay=getattr(settings, 'QUEUE_BROADCAST_MAX_DELAY', 0.5),
+)
+
+
+@atexit.register
+def _flush_at_exit():
+    """Send the batches still waiting for their window before the process exits"""
+    broadcaster.send = _group_send_at_exit
+    broadcaster.flush()
+
+
+def publish(doctor_id, message):
+    """Queue a message for every client watching the doctor's queue"""
+    broadcaster.publish(doctor_id, message)
@@ -0,0 +1,111 @@
+"""
+Daily appointment rollups behind the admin reports.
+
+AppointmentRollup holds the number of appointments per (date, department,
+doctor, status). Like the queue counters, rows are maintained incrementally:
+an appointment change becomes -1 on the key it leaves and +1 on the key it
+enters, applied with atomic UPDATEs. ``rebuild_rollups`` recomputes a date
+range from the appointments (see the ``backfill_rollups`` command).
+
+Reports then aggregate a few rows per day instead of every appointment.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Appointment, AppointmentRollup, Doctor
+
+BATCH_SIZE = 1000
+
+
+def _key(state):
+    return state['appointment_date'], state['department_id'], state['doctor_id'], state['status']
+
+
+def record_change(before, after):
+    """Apply the rollup changes for an appointment going from ``before`` to ``after``"""
+    deltas = {}
+    if before is not None:
+        deltas[_key(before)] = deltas.get(_key(before), 0) - 1
+    if after is not None:
+        deltas[_key(after)] = deltas.get(_key(after), 0) + 1
+
+    for key, delta in deltas.items():
+        if delta:
+            _apply(key, delta)
+
+
+def record_created(states):
+    """Apply the rollups of appointments created without signals, e.g. by bulk_create"""
+    deltas = {}
+    for state in states:
+        deltas[_key(state)] = deltas.get(_key(state), 0) + 1
+    for key, delta in deltas.items():
+        _apply(key, delta)
+
+
+def _apply(key, delta):
+    appointment_date, department_id, doctor_id, status = key
+    lookup = dict(appointment_date=appointment_date, department_id=department_id, doctor_id=doctor_id, status=status)
+    rows = AppointmentRollup.objects.filter(**lookup)
+    if rows.update(count=F('count') + delta):
+        return
+    # No row yet (new key or never backfilled): count what is there, including this change
+    count = Appointment.objects.filter(**lookup).count()
+    if not count:
+        return
+    try:
+        with transaction.atomic():
+            AppointmentRollup.objects.create(count=count, **lookup)
+    except IntegrityError:
+        # Created concurrently by a change that could not see this one
+        rows.update(count=F('count') + delta)
+
+
+@transaction.atomic
+def rebuild_rollups(start, end):
+    """Recompute the rollups of every date from ``start`` to ``end``; returns the number of rows written"""
+    AppointmentRollup.objects.filter(appointment_date__range=(start, end)).delete()
+    rows = AppointmentRollup.objects.bulk_create(
+        (
+            AppointmentRollup(**row)
+            for row in Appointment.objects.filter(appointment_date__range=(start, end)).order_by().values(
+                'appointment_date', 'department_id', 'doctor_id', 'status'
+            ).annotate(count=Count('id')).iterator()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    return len(rows)
+
+
+def _rollups(start=None, end=None):
+    rollups = AppointmentRollup.objects.order_by()
+    if start:
+        rollups = rollups.filter(appointment_date__gte=start)
+    if end:
+        rollups = rollups.filter(appointment_date__lte=end)
+    return rollups
+
+
+def appointment_report(start=None, end=None):
+    rollups = _rollups(start, end)
+    by_status = list(rollups.values('status').annotate(count=Sum('count')).order_by('status'))
+    by_department = list(
+        rollups.values('department__name').annotate(count=Sum('count')).order_by('department__name')
+    )
+    return {
+        'total_appointments': sum(row['count'] for row in by_status),
+        'by_status': by_status,
+        'by_department': by_department,
+    }
+
+
+def doctor_report(start=None, end=None):
+    dates = Q()
+    if start:
+        dates &= Q(daily_rollups__appointment_date__gte=start)
+    if end:
+        dates &= Q(daily_rollups__appointment_date__lte=end)
+    return list(Doctor.objects.annotate(
+        appointment_count=Coalesce(Sum('daily_rollups__count', filter=dates), Value(0))
+    ).values('id', 'user__full_name', 'specialty', 'rating', 'appointment_count'))
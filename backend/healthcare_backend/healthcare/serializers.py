@@ -103,6 +103,9 @@ class DepartmentSerializer(serializers.ModelSerializer):
         ]
 
     def get_doctor_count(self, obj):
+        # Annotated by DepartmentViewSet; counted per row elsewhere
+        if hasattr(obj, 'available_doctors'):
+            return obj.available_doctors
         return obj.doctors.filter(is_available=True).count()
 
 
@@ -222,25 +225,9 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
         doctor = attrs['doctor']
         appointment_date = attrs['appointment_date']
         time_slot = attrs['time_slot']
-        
-        # CRITICAL: Check if EXACT time slot is already booked by another patient
-        # This ensures only ONE person per time slot
-        existing = Appointment.objects.filter(
-            doctor=doctor,
-            appointment_date=appointment_date,
-            time_slot=time_slot,
-            status__in=['scheduled', 'confirmed', 'in_progress']
-        ).exclude(
-            # Exclude current appointment if updating
-            id=getattr(self.instance, 'id', None)
-        ).first()
-        
-        if existing:
-            raise serializers.ValidationError(
-                f"This time slot ({time_slot}) is already booked by another patient. "
-                "Please select a different time."
-            )
-        
+
+        # A slot that is already booked is refused by the insert itself (unique_active_slot)
+
         # Check doctor availability (optional - only if set up)
         day_name = appointment_date.strftime('%A').lower()
         availability = DoctorAvailability.objects.filter(
@@ -259,6 +246,68 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class BulkAppointmentEntrySerializer(serializers.Serializer):
+    patient_id = serializers.IntegerField()
+    time_slot = serializers.TimeField()
+    reason = serializers.CharField()
+    is_for_self = serializers.BooleanField(default=True)
+    patient_relation = serializers.CharField(max_length=50, required=False, default='')
+
+
+class BulkAppointmentSerializer(serializers.Serializer):
+    """Many patients booked into one doctor's day, validated in a fixed number of queries"""
+    MAX_APPOINTMENTS = 500
+
+    doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.select_related('department'))
+    appointment_date = serializers.DateField()
+    booking_type = serializers.ChoiceField(choices=Appointment.BOOKING_TYPE_CHOICES, default='doctor')
+    appointments = BulkAppointmentEntrySerializer(many=True, allow_empty=False)
+
+    def validate_appointments(self, entries):
+        if len(entries) > self.MAX_APPOINTMENTS:
+            raise serializers.ValidationError(f"At most {self.MAX_APPOINTMENTS} appointments can be booked at once.")
+        time_slots = [entry['time_slot'] for entry in entries]
+        if len(set(time_slots)) != len(time_slots):
+            raise serializers.ValidationError("Each time slot can only be booked once.")
+
+        patient_ids = {entry['patient_id'] for entry in entries}
+        found = set(User.objects.filter(id__in=patient_ids, role='patient').order_by().values_list('id', flat=True))
+        if found != patient_ids:
+            raise serializers.ValidationError(f"Unknown patients: {sorted(patient_ids - found)}")
+        return entries
+
+    def validate(self, attrs):
+        doctor = attrs['doctor']
+        appointment_date = attrs['appointment_date']
+        time_slots = [entry['time_slot'] for entry in attrs['appointments']]
+
+        # Every requested slot checked against the day's bookings in one query
+        taken = sorted(Appointment.objects.filter(
+            doctor=doctor,
+            appointment_date=appointment_date,
+            time_slot__in=time_slots,
+            status__in=['scheduled', 'confirmed', 'in_progress']
+        ).values_list('time_slot', flat=True))
+        if taken:
+            raise serializers.ValidationError(
+                f"These time slots are already booked: {', '.join(slot.strftime('%H:%M') for slot in taken)}."
+            )
+
+        availability = DoctorAvailability.objects.filter(
+            doctor=doctor,
+            day_of_week=appointment_date.strftime('%A').lower(),
+            is_available=True
+        ).first()
+        if availability and availability.start_time and availability.end_time:
+            outside = [slot for slot in time_slots if not availability.start_time <= slot <= availability.end_time]
+            if outside:
+                raise serializers.ValidationError(
+                    f"Selected times are outside doctor's available hours "
+                    f"({availability.start_time} - {availability.end_time})."
+                )
+        return attrs
+
+
 class QueueStatusSerializer(serializers.ModelSerializer):
     """Queue status serializer for live updates"""
     doctor_name = serializers.CharField(source='doctor.full_name', read_only=True)
@@ -0,0 +1,115 @@
+from django.db.models import Model
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from . import authentication, catalog, dashboards, queues, rollups, slots, stats
+from .models import User, Appointment, Department, Doctor, DoctorAvailability, MedicalRecord
+
+
+# ==================== Appointment Signals ====================
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    """Keep derived booking state in step with the saved appointment"""
+    if raw:
+        return
+    before = None if created else getattr(instance, '_tracked_state', None)
+    after = instance.tracked_state()
+    instance._tracked_state = after
+    slots.record_change(before, after)
+    queues.record_change(before, after, instance)
+    rollups.record_change(before, after)
+    stats.record_change(before, after, instance)
+    dashboards.patients_changed([before and before['patient_id'], after['patient_id']])
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    before = getattr(instance, '_tracked_state', None) or instance.tracked_state()
+    slots.record_change(before, None)
+    queues.record_change(before, None, instance)
+    rollups.record_change(before, None)
+    stats.record_change(before, None, instance)
+    dashboards.patients_changed([before['patient_id']])
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def medical_record_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    dashboards.patients_changed([instance.patient_id])
+
+
+# ==================== Catalog Signals ====================
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def department_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    catalog.departments_changed()
+    catalog.directory_changed([instance.pk])
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def doctor_changed(sender, instance, signal, raw=False, **kwargs):
+    """Department responses embed doctor counts, so doctor changes invalidate them too"""
+    if raw:
+        return
+    catalog.departments_changed()
+    catalog.directory_changed([instance.department_id, getattr(instance, '_loaded_department_id', None)])
+    if kwargs.get('created') or signal is post_delete:
+        # Tokens carry the doctor profile id
+        authentication.revoke(instance.user_id)
+
+
+@receiver(post_save, sender=DoctorAvailability)
+@receiver(post_delete, sender=DoctorAvailability)
+def availability_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or isinstance(origin, Model) and origin is not instance:
+        # Deleted along with its doctor, which invalidates the directory itself
+        return
+    catalog.directory_changed(Doctor.objects.filter(pk=instance.doctor_id).values_list('department_id', flat=True))
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, **kwargs):
+    """
+    Read the stored values of a user that was not loaded from the database
+    (built by a serializer, the importer or by hand), so saving it only
+    counts the fields that really change
+    """
+    if raw or instance.pk is None or hasattr(instance, '_tracked_state'):
+        return
+    instance._tracked_state = User.objects.filter(pk=instance.pk).values(*User.TRACKED_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Drop the cached auth user, revoke tokens whose claims no longer hold, and
+    refresh the directory only when a doctor's listed fields changed, so
+    logins and other profile edits leave it alone
+    """
+    before = None if created else getattr(instance, '_tracked_state', None)
+    after = instance.tracked_state()
+    instance._tracked_state = after
+    if raw or before is None:
+        return
+
+    if any(before[name] != after[name] for name in User.AUTH_FIELDS):
+        # Kept on the instance too, so saving it again does not undo the revocation
+        instance.tokens_revoked_at = authentication.revoke(instance.pk)
+    else:
+        authentication.forget(instance.pk)
+    if instance.role == 'patient':
+        # The dashboard embeds the profile
+        dashboards.patients_changed([instance.pk])
+
+    if instance.role == 'doctor' and any(before[name] != after[name] for name in User.DIRECTORY_FIELDS):
+        catalog.directory_changed(Doctor.objects.filter(user=instance).values_list('department_id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    authentication.revoke(instance.pk)
@@ -0,0 +1,147 @@
+"""
+Slot occupancy bitmaps for appointment booking.
+
+A doctor's day is split into 144 ten-minute slots and bit ``n`` of a bitmap
+stands for the slot starting at ``n * 10`` minutes past midnight. The booked
+slots of each (doctor, date) are kept as one integer in the cache and patched
+when appointments are booked, cancelled or rescheduled, so listing free slots
+is a couple of bit operations instead of a scan over the day's appointments.
+
+The bitmap is a read-side accelerator only: the unique_active_slot
+constraint still decides whether a slot can be taken. Patches and rebuilds
+of a bitmap hold its cache lock, so concurrent bookings of one doctor's day
+never overwrite each other's bits.
+"""
+from datetime import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .locks import cache_lock
+from .models import Appointment
+
+SLOT_MINUTES = 10
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+# Hours used when a doctor has not set availability for the weekday
+DEFAULT_HOURS = (time(9, 0), time(17, 0))
+OCCUPANCY_TIMEOUT = 60 * 60 * 24
+
+# Response payload for every slot of the day, built once
+SLOT_PAYLOADS = [
+    {
+        "value": slot.strftime("%H:%M"),
+        "display": slot.strftime("%I:%M %p"),
+        "duration": f"{SLOT_MINUTES} minutes",
+    }
+    for slot in (
+        time(index * SLOT_MINUTES // 60, index * SLOT_MINUTES % 60)
+        for index in range(SLOTS_PER_DAY)
+    )
+]
+
+
+def slot_index(value):
+    """Index of the slot containing ``value``"""
+    return (value.hour * 60 + value.minute) // SLOT_MINUTES
+
+
+def window_mask(start, end):
+    """Bitmap of the slots starting within [start, end); an end of midnight means end of day"""
+    first = -(-(start.hour * 60 + start.minute) // SLOT_MINUTES)
+    if end == time(0, 0):
+        last = SLOTS_PER_DAY
+    else:
+        last = -(-(end.hour * 60 + end.minute) // SLOT_MINUTES)
+    if last <= first:
+        return 0
+    return ((1 << last) - 1) ^ ((1 << first) - 1)
+
+
+def bitmap_for(time_slots):
+    bitmap = 0
+    for value in time_slots:
+        bitmap |= 1 << slot_index(value)
+    return bitmap
+
+
+def describe(bitmap):
+    """Response payloads for the set bits of ``bitmap``, in time order"""
+    return [SLOT_PAYLOADS[index] for index in range(SLOTS_PER_DAY) if bitmap >> index & 1]
+
+
+def occupancy_key(doctor_id, appointment_date):
+    return f'slots:{doctor_id}:{appointment_date.isoformat()}'
+
+
+def occupancy(doctor_id, appointment_date):
+    """Booked-slot bitmap for a doctor's day, loaded from the database on a cache miss"""
+    key = occupancy_key(doctor_id, appointment_date)
+    bitmap = cache.get(key)
+    if bitmap is not None:
+        return bitmap
+
+    # Loaded under the lock so a booking committed meanwhile is either in
+    # the query or patched in after the bitmap is stored
+    with cache_lock(key) as acquired:
+        bitmap = cache.get(key) if acquired else None
+        if bitmap is None:
+            bitmap = bitmap_for(Appointment.objects.filter(
+                doctor_id=doctor_id,
+                appointment_date=appointment_date,
+                status__in=Appointment.BOOKED_STATUSES
+            ).values_list('time_slot', flat=True))
+            if acquired:
+                cache.set(key, bitmap, OCCUPANCY_TIMEOUT)
+    return bitmap
+
+
+def forget(doctor_id, appointment_date):
+    """Drop a cached bitmap, e.g. after appointments were written without signals"""
+    cache.delete(occupancy_key(doctor_id, appointment_date))
+
+
+def occupancy_many(doctor_ids, start_date, end_date):
+    """Booked-slot bitmaps keyed by (doctor_id, date) for a date range, in one query"""
+    bitmaps = {}
+    for doctor_id, appointment_date, time_slot in Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        appointment_date__range=(start_date, end_date),
+        status__in=Appointment.BOOKED_STATUSES
+    ).values_list('doctor_id', 'appointment_date', 'time_slot'):
+        key = (doctor_id, appointment_date)
+        bitmaps[key] = bitmaps.get(key, 0) | 1 << slot_index(time_slot)
+    return bitmaps
+
+
+def _apply(doctor_id, appointment_date, time_slot, booked):
+    key = occupancy_key(doctor_id, appointment_date)
+    with cache_lock(key) as acquired:
+        bitmap = cache.get(key) if acquired else None
+        if bitmap is None:
+            # Nothing cached yet, or unsafe to patch; the next read builds it from the database
+            cache.delete(key)
+            return
+        bit = 1 << slot_index(time_slot)
+        cache.set(key, bitmap | bit if booked else bitmap & ~bit, OCCUPANCY_TIMEOUT)
+
+
+def record_change(before, after):
+    """
+    Patch cached bitmaps for an appointment whose tracked state went from
+    ``before`` to ``after`` (either may be None). Applied once the surrounding
+    transaction commits so rolled back bookings never show up.
+    """
+    was_booked = before is not None and before['status'] in Appointment.BOOKED_STATUSES
+    is_booked = after is not None and after['status'] in Appointment.BOOKED_STATUSES
+    keys = ('doctor_id', 'appointment_date', 'time_slot')
+    if was_booked and is_booked and all(before[k] == after[k] for k in keys):
+        return
+
+    def apply():
+        if was_booked:
+            _apply(before['doctor_id'], before['appointment_date'], before['time_slot'], False)
+        if is_booked:
+            _apply(after['doctor_id'], after['appointment_date'], after['time_slot'], True)
+
+    if was_booked or is_booked:
+        transaction.on_commit(apply)
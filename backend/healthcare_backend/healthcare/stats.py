@@ -0,0 +1,128 @@
+"""
+Per-doctor lifetime counters.
+
+DoctorStats holds how many distinct patients a doctor has seen an
+appointment with and how many consultations they completed. Appointment
+changes adjust the counters with one UPDATE; only an appointment that
+adds or removes a (doctor, patient) pair also checks for the pair's other
+appointments. That check runs with the doctor's stats row locked, so two
+first bookings of the same pair cannot both count the patient; the lock
+is held until the appointment write commits, which is why those writes run
+in a transaction. ``rebuild_doctor_stats`` recounts them from scratch (see the
+``rebuild_doctor_stats`` command).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+from .models import Appointment, DoctorStats
+
+
+def _pair(state):
+    return state and (state['doctor_id'], state['patient_id'])
+
+
+def _has_other_appointments(state, appointment_id):
+    # A locking read sees appointments committed after this transaction's
+    # snapshot, e.g. by the booking that held the stats row before us
+    return Appointment.objects.select_for_update().filter(
+        doctor_id=state['doctor_id'], patient_id=state['patient_id']
+    ).exclude(pk=appointment_id).exists()
+
+
+def _lock(states):
+    """Lock the stats rows of the doctors of ``states``; returns the doctors that have none yet"""
+    doctor_ids = {state['doctor_id'] for state in states if state is not None}
+    rows = DoctorStats.objects.select_for_update().filter(doctor_id__in=doctor_ids)
+    return doctor_ids - set(rows.order_by('doctor_id').values_list('pk', flat=True))
+
+
+def record_change(before, after, appointment):
+    """Apply the counter changes for ``appointment`` going from ``before`` to ``after``"""
+    deltas = {}
+
+    def add(state, field, delta):
+        counters = deltas.setdefault(state['doctor_id'], {'total_patients': 0, 'total_consultations': 0})
+        counters[field] += delta
+
+    missing = set()
+    if _pair(before) != _pair(after):
+        with transaction.atomic(savepoint=False):
+            missing = _lock([before, after])
+            for state, delta in ((before, -1), (after, 1)):
+                # A doctor without stats is counted from scratch below
+                if state is not None and state['doctor_id'] not in missing \
+                        and not _has_other_appointments(state, appointment.pk):
+                    add(state, 'total_patients', delta)
+    if before is not None and before['status'] == 'completed':
+        add(before, 'total_consultations', -1)
+    if after is not None and after['status'] == 'completed':
+        add(after, 'total_consultations', 1)
+
+    for doctor_id in missing:
+        deltas.pop(doctor_id, None)
+        _create(doctor_id)
+    for doctor_id, counters in deltas.items():
+        updates = {field: F(field) + delta for field, delta in counters.items() if delta}
+        if updates:
+            _apply(doctor_id, updates)
+
+
+def _apply(doctor_id, updates):
+    if not DoctorStats.objects.filter(doctor_id=doctor_id).update(**updates):
+        _create(doctor_id, updates)
+
+
+def _create(doctor_id, updates=None):
+    """
+    Store a doctor's first stats, counted from what is there including this
+    change. If they were created concurrently by a change that could not
+    see this one, apply ``updates`` to them, or recount without any.
+    """
+    counts = recount(doctor_id)
+    if not any(counts.values()):
+        # Nothing to count, e.g. the doctor's appointments are being deleted with them
+        return
+    try:
+        with transaction.atomic():
+            DoctorStats.objects.create(doctor_id=doctor_id, **counts)
+    except IntegrityError:
+        DoctorStats.objects.filter(doctor_id=doctor_id).update(**(updates or recount(doctor_id)))
+
+
+def recount(doctor_id):
+    return Appointment.objects.filter(doctor_id=doctor_id).aggregate(
+        total_patients=Count('patient', distinct=True),
+        total_consultations=Count('id', filter=Q(status='completed')),
+    )
+
+
+def refresh(doctor_id):
+    """Recount one doctor's stats, e.g. after appointments were created without signals"""
+    counts = recount(doctor_id)
+    if DoctorStats.objects.filter(doctor_id=doctor_id).update(**counts):
+        return
+    try:
+        with transaction.atomic():
+            DoctorStats.objects.create(doctor_id=doctor_id, **counts)
+    except IntegrityError:
+        DoctorStats.objects.filter(doctor_id=doctor_id).update(**counts)
+
+
+def for_doctor(doctor):
+    """The doctor's stats, counted and stored first if they have none yet"""
+    try:
+        return doctor.stats
+    except DoctorStats.DoesNotExist:
+        stats, _ = DoctorStats.objects.get_or_create(doctor_id=doctor.pk, defaults=recount(doctor.pk))
+        return stats
+
+
+@transaction.atomic
+def rebuild_doctor_stats():
+    """Recount every doctor's stats in bulk; returns the number of rows written"""
+    rows = Appointment.objects.order_by().values('doctor_id').annotate(
+        total_patients=Count('patient', distinct=True),
+        total_consultations=Count('id', filter=Q(status='completed')),
+    )
+    DoctorStats.objects.all().delete()
+    return len(DoctorStats.objects.bulk_create(DoctorStats(**row) for row in rows))
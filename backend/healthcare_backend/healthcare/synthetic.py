@@ -0,0 +1,520 @@
+"""
+Synthetic datasets for development and performance work.
+
+``Generator`` writes the departments and demo accounts, then any number of
+doctors (with weekly availability) and patients, a history and near future
+of appointments, and the medical records of completed visits. The state
+normally derived by signals (token sequences, queue statuses, rollups,
+doctor stats) is rebuilt once at the end. See the ``generate_data`` command.
+
+Every value is drawn from one ``random.Random(seed)`` and primary keys are
+assigned from the current maximum, so the same seed, sizes and anchor date
+give the same rows on the same starting database, whether SQLite or MySQL
+(which does not return primary keys from ``bulk_create``). Rows are written
+in batches as they are generated, so memory stays flat however many
+patients or days are requested.
+"""
+import math
+import random
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from . import catalog
+from .db import bulk_upsert
+from .models import (
+    User, Department, Doctor, DoctorAvailability, Appointment, MedicalRecord, TokenSequence,
+)
+from .queues import rebuild_queue_statuses
+from .rollups import rebuild_rollups
+from .slots import SLOT_MINUTES
+from .stats import rebuild_doctor_stats
+
+BATCH_SIZE = 5000
+
+# ==================== Reference Data ====================
+# code: department fields, the specialty and qualification of its doctors,
+# its share of the doctors, and (reason, diagnosis, treatment, medicines) cases
+DEPARTMENTS = {
+    'CARD': {
+        'name': 'Cardiology', 'description': 'Heart and cardiovascular system care', 'icon': 'fas fa-heartbeat',
+        'specialty': 'Cardiologist', 'qualification': 'MBBS, MD Cardiology', 'share': 14,
+        'cases': [
+            ('Chest pain on exertion', 'Stable angina', 'Lifestyle changes, stress test in two weeks',
+             ['Aspirin 75 mg once daily', 'Atorvastatin 20 mg at night', 'Metoprolol 25 mg twice daily']),
+            ('High blood pressure readings', 'Essential hypertension', 'Low salt diet, home BP monitoring',
+             ['Amlodipine 5 mg once daily', 'Telmisartan 40 mg once daily']),
+            ('Palpitations', 'Sinus tachycardia', 'ECG and thyroid profile, reduce caffeine',
+             ['Propranolol 10 mg as needed']),
+        ],
+    },
+    'NEURO': {
+        'name': 'Neurology', 'description': 'Brain and nervous system disorders', 'icon': 'fas fa-brain',
+        'specialty': 'Neurologist', 'qualification': 'MBBS, MD Neurology', 'share': 10,
+        'cases': [
+            ('Recurring headaches', 'Migraine without aura', 'Headache diary, regular sleep',
+             ['Naproxen 500 mg as needed', 'Propranolol 20 mg twice daily']),
+            ('Numbness in feet', 'Peripheral neuropathy', 'HbA1c and B12 levels, foot care',
+             ['Methylcobalamin 1500 mcg once daily', 'Pregabalin 75 mg at night']),
+            ('Dizziness', 'Benign positional vertigo', 'Repositioning exercises',
+             ['Betahistine 16 mg three times daily']),
+        ],
+    },
+    'ORTHO': {
+        'name': 'Orthopedics', 'description': 'Bone, joint, and muscle care', 'icon': 'fas fa-bone',
+        'specialty': 'Orthopedic Surgeon', 'qualification': 'MBBS, MS Orthopedics', 'share': 16,
+        'cases': [
+            ('Knee pain', 'Osteoarthritis of knee', 'Physiotherapy, weight reduction',
+             ['Paracetamol 650 mg three times daily', 'Diclofenac gel twice daily']),
+            ('Lower back pain', 'Lumbar strain', 'Rest for three days, core exercises',
+             ['Aceclofenac 100 mg twice daily', 'Thiocolchicoside 4 mg twice daily']),
+            ('Shoulder stiffness', 'Adhesive capsulitis', 'Physiotherapy twice weekly',
+             ['Ibuprofen 400 mg twice daily']),
+        ],
+    },
+    'PED': {
+        'name': 'Pediatrics', 'description': 'Children\'s healthcare', 'icon': 'fas fa-child',
+        'specialty': 'Pediatrician', 'qualification': 'MBBS, MD Pediatrics', 'share': 16,
+        'cases': [
+            ('Fever and cough', 'Acute upper respiratory infection', 'Fluids and rest, review if fever persists',
+             ['Paracetamol syrup 250 mg every six hours', 'Saline nasal drops']),
+            ('Loose stools', 'Acute gastroenteritis', 'Oral rehydration, light diet',
+             ['ORS after each stool', 'Zinc 20 mg once daily for 14 days']),
+            ('Routine vaccination', 'Healthy child', 'Next vaccination as per schedule', []),
+        ],
+    },
+    'DERM': {
+        'name': 'Dermatology', 'description': 'Skin, hair, and nail care', 'icon': 'fas fa-hand-paper',
+        'specialty': 'Dermatologist', 'qualification': 'MBBS, MD Dermatology', 'share': 12,
+        'cases': [
+            ('Itchy rash', 'Allergic contact dermatitis', 'Avoid the trigger, moisturise',
+             ['Cetirizine 10 mg at night', 'Mometasone cream twice daily']),
+            ('Acne', 'Acne vulgaris', 'Gentle cleanser, avoid picking',
+             ['Adapalene gel at night', 'Clindamycin gel in the morning']),
+            ('Hair fall', 'Telogen effluvium', 'Iron and thyroid tests',
+             ['Minoxidil 5% solution twice daily', 'Biotin 10 mg once daily']),
+        ],
+    },
+    'GEN': {
+        'name': 'General Medicine', 'description': 'General health and wellness', 'icon': 'fas fa-stethoscope',
+        'specialty': 'General Physician', 'qualification': 'MBBS, MD General Medicine', 'share': 32,
+        'cases': [
+            ('Fever', 'Viral fever', 'Fluids and rest, CBC if fever persists beyond three days',
+             ['Paracetamol 650 mg every six hours']),
+            ('Increased thirst and fatigue', 'Type 2 diabetes mellitus', 'Diet plan, HbA1c every three months',
+             ['Metformin 500 mg twice daily']),
+            ('Sore throat', 'Acute pharyngitis', 'Warm saline gargles',
+             ['Amoxicillin 500 mg three times daily for 5 days', 'Paracetamol 650 mg as needed']),
+            ('Annual health check', 'No abnormality detected', 'Routine review in one year', []),
+        ],
+    },
+}
+
+MALE_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Arjun', 'Rohan', 'Rahul', 'Vikram', 'Karan', 'Sanjay', 'Amit',
+              'Rajesh', 'Suresh', 'Manoj', 'Imran', 'Harpreet', 'Joseph', 'Kiran', 'Naveen', 'Deepak', 'Anil']
+FEMALE_NAMES = ['Priya', 'Ananya', 'Diya', 'Isha', 'Kavya', 'Meera', 'Neha', 'Pooja', 'Sunita', 'Anjali',
+                'Lakshmi', 'Fatima', 'Gurpreet', 'Mary', 'Divya', 'Shreya', 'Nisha', 'Rekha', 'Swati', 'Asha']
+SURNAMES = ['Sharma', 'Patel', 'Singh', 'Kumar', 'Gupta', 'Reddy', 'Iyer', 'Nair', 'Khan', 'Das',
+            'Mehta', 'Joshi', 'Verma', 'Rao', 'Banerjee', 'Chopra', 'Pillai', 'Mishra', 'Bose', 'Thomas']
+STREETS = ['MG Road', 'Station Road', 'Park Street', 'Gandhi Nagar', 'Civil Lines', 'Nehru Colony', 'Lake View']
+CITIES = ['New Delhi', 'Mumbai', 'Bengaluru', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune', 'Jaipur', 'Lucknow']
+RELATIONS = ['Mother', 'Father', 'Spouse', 'Son', 'Daughter']
+
+GENDERS = {'male': 49, 'female': 50, 'other': 1}
+BLOOD_GROUPS = {'O+': 36, 'B+': 32, 'A+': 21, 'AB+': 7, 'O-': 2, 'B-': 1, 'A-': 0.6, 'AB-': 0.4}
+# Outcome of appointments before today, and of those booked ahead
+PAST_STATUSES = {'completed': 80, 'no_show': 11, 'cancelled': 9}
+UPCOMING_STATUSES = {'scheduled': 72, 'confirmed': 20, 'cancelled': 8}
+# Relative demand from Monday to Sunday; nobody works on Sunday
+WEEKDAY_DEMAND = (1.25, 1.05, 1.0, 1.0, 0.95, 0.8, 0)
+# Weekday shifts and how often doctors keep them; some also see patients on Saturday morning
+SHIFTS = {(time(9, 0), time(17, 0)): 6, (time(10, 0), time(18, 0)): 2, (time(8, 0), time(14, 0)): 1,
+          (time(14, 0), time(20, 0)): 1}
+SATURDAY_HOURS = (time(9, 0), time(13, 0))
+SATURDAY_SHARE = 0.35
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
+# Share of completed visits that leave a medical record
+RECORD_SHARE = 0.75
+FOLLOW_UP_SHARE = 0.25
+
+# ==================== Demo Accounts ====================
+# Fixed accounts to log in with (see INTEGRATION_README.md)
+DEMO_ADMIN = {
+    'email': 'admin@healthcare.gov', 'password': 'admin123', 'full_name': 'System Administrator',
+    'phone': '+919876543210', 'role': 'admin', 'is_staff': True, 'is_superuser': True, 'is_verified': True,
+}
+DEMO_PATIENTS = [
+    {'email': 'patient1@example.com', 'full_name': 'Rahul Sharma', 'phone': '+919876543211',
+     'date_of_birth': date(1990, 5, 15), 'gender': 'male', 'address': '123 Main Street, New Delhi',
+     'aadhaar_number': '123456789012', 'blood_group': 'O+'},
+    {'email': 'patient2@example.com', 'full_name': 'Priya Patel', 'phone': '+919876543212',
+     'date_of_birth': date(1985, 8, 22), 'gender': 'female', 'address': '456 Park Avenue, Mumbai',
+     'aadhaar_number': '123456789013', 'blood_group': 'A+'},
+]
+DEMO_PATIENT_PASSWORD = 'patient123'
+DEMO_DOCTORS = [
+    ({'email': 'dr.singh@healthcare.gov', 'full_name': 'Dr. Rajesh Singh', 'phone': '+919876543213',
+      'date_of_birth': date(1975, 3, 10), 'gender': 'male', 'address': '789 Doctor Lane, Delhi',
+      'aadhaar_number': '123456789014'},
+     {'department': 'CARD', 'experience': '15 years', 'license_number': 'CARD001', 'consultation_fee': 500,
+      'bio': 'Experienced cardiologist with expertise in heart diseases.'}),
+    ({'email': 'dr.gupta@healthcare.gov', 'full_name': 'Dr. Anjali Gupta', 'phone': '+919876543214',
+      'date_of_birth': date(1980, 7, 18), 'gender': 'female', 'address': '321 Medical Center, Mumbai',
+      'aadhaar_number': '123456789015'},
+     {'department': 'NEURO', 'experience': '12 years', 'license_number': 'NEURO001', 'consultation_fee': 600,
+      'bio': 'Specialist in neurological disorders and brain conditions.'}),
+    ({'email': 'dr.kumar@healthcare.gov', 'full_name': 'Dr. Vikram Kumar', 'phone': '+919876543215',
+      'date_of_birth': date(1978, 11, 25), 'gender': 'male', 'address': '654 Ortho Street, Bangalore',
+      'aadhaar_number': '123456789016'},
+     {'department': 'ORTHO', 'experience': '18 years', 'license_number': 'ORTHO001', 'consultation_fee': 700,
+      'bio': 'Expert in bone and joint surgeries.'}),
+    ({'email': 'dr.sharma@healthcare.gov', 'full_name': 'Dr. Sunita Sharma', 'phone': '+919876543216',
+      'date_of_birth': date(1982, 4, 12), 'gender': 'female', 'address': '987 Children Hospital, Chennai',
+      'aadhaar_number': '123456789017'},
+     {'department': 'PED', 'experience': '10 years', 'license_number': 'PED001', 'consultation_fee': 400,
+      'bio': 'Caring pediatrician with expertise in child health.'}),
+]
+DEMO_DOCTOR_PASSWORD = 'doctor123'
+
+
+def _table(weights):
+    """(values, cumulative weights) for ``Random.choices``"""
+    values, cumulative, total = [], [], 0
+    for value, weight in weights.items():
+        total += weight
+        values.append(value)
+        cumulative.append(total)
+    return values, cumulative
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+class Schedule:
+    """A generated doctor and the hours they see patients, by weekday number"""
+
+    def __init__(self, doctor_id, department, popularity, hours):
+        self.doctor_id = doctor_id
+        self.department = department
+        self.popularity = popularity
+        self.hours = hours
+
+
+class Generator:
+    """
+    Generates one dataset. ``patients`` and ``doctors`` are in addition to
+    the demo accounts; appointments cover the ``days`` up to and including
+    ``today`` plus ``future_days`` after it, with ``per_day`` appointments
+    per working doctor per day on average.
+    """
+
+    def __init__(self, patients=200, doctors=12, days=30, future_days=14, per_day=12, seed=0, today=None,
+                 password='password123', batch_size=BATCH_SIZE, log=None):
+        self.patients = patients
+        self.doctors = doctors
+        self.days = days
+        self.future_days = future_days
+        self.per_day = per_day
+        self.today = today or timezone.localdate()
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.rng = random.Random(seed)
+        # One hash shared by every generated account; hashing a million passwords would dominate the run
+        self.password = make_password(password)
+        self.tables = {name: _table(weights) for name, weights in (
+            ('gender', GENDERS), ('blood_group', BLOOD_GROUPS), ('past', PAST_STATUSES),
+            ('upcoming', UPCOMING_STATUSES), ('shift', SHIFTS),
+            ('department', {code: department['share'] for code, department in DEPARTMENTS.items()}),
+        )}
+        self.departments = {}
+        self.first_patient = None
+        # Last token issued per (department id, date)
+        self.tokens = {}
+
+    def _pick(self, table):
+        values, cumulative = self.tables[table]
+        return self.rng.choices(values, cum_weights=cumulative)[0]
+
+    def run(self):
+        """Write the dataset; returns the number of rows written per model"""
+        written = {}
+        self.departments = self.create_departments()
+        self.create_demo_accounts()
+        written['patients'] = self.create_patients()
+        schedules = self.create_doctors()
+        written['doctors'] = len(schedules)
+        written['appointments'], written['medical_records'] = self.create_appointments(schedules)
+        self.rebuild_derived_state()
+        return written
+
+    # ==================== Accounts ====================
+    def create_departments(self):
+        departments = {}
+        for code, fields in DEPARTMENTS.items():
+            departments[code], _ = Department.objects.get_or_create(code=code, defaults={
+                name: fields[name] for name in ('name', 'description', 'icon')
+            })
+        return departments
+
+    def create_demo_accounts(self):
+        admin = self._demo_user(DEMO_ADMIN)
+        for fields in DEMO_PATIENTS:
+            self._demo_user(dict(fields, password=DEMO_PATIENT_PASSWORD))
+        for user_fields, doctor_fields in DEMO_DOCTORS:
+            user = self._demo_user(dict(user_fields, password=DEMO_DOCTOR_PASSWORD, role='doctor'))
+            department = DEPARTMENTS[doctor_fields['department']]
+            doctor, _ = Doctor.objects.get_or_create(user=user, defaults=dict(
+                doctor_fields, department=self.departments[doctor_fields['department']],
+                specialty=department['specialty'], qualification=department['qualification'],
+                is_verified=True, is_available=True, registered_by=admin,
+            ))
+            for day in WEEKDAYS[:5]:
+                DoctorAvailability.objects.get_or_create(doctor=doctor, day_of_week=day, defaults={
+                    'start_time': time(9, 0), 'end_time': time(17, 0),
+                })
+
+    @staticmethod
+    def _demo_user(fields):
+        fields = dict(fields)
+        password = fields.pop('password')
+        user, created = User.objects.get_or_create(email=fields['email'], defaults=fields)
+        if created:
+            user.set_password(password)
+            user.save()
+        return user
+
+    def _user(self, pk, role, age):
+        rng = self.rng
+        gender = self._pick('gender')
+        names = {'male': MALE_NAMES, 'female': FEMALE_NAMES}.get(gender) or rng.choice((MALE_NAMES, FEMALE_NAMES))
+        return User(
+            id=pk, username=f'synthetic-{pk}', email=f'{role}{pk}@synthetic.test', password=self.password,
+            full_name=f'{rng.choice(names)} {rng.choice(SURNAMES)}', phone=f'+91{6000000000 + pk}',
+            date_of_birth=self.today - timedelta(days=int(age * 365.25) + rng.randrange(365)), gender=gender,
+            address=f'{rng.randint(1, 999)} {rng.choice(STREETS)}, {rng.choice(CITIES)}',
+            aadhaar_number=f'9{pk:011d}', blood_group=self._pick('blood_group'),
+            role=role, is_verified=role == 'doctor',
+        )
+
+    def create_patients(self):
+        self.first_patient = _next_id(User)
+        # Ages skewed young with a long tail, as in an outpatient population
+        self._write(User, (
+            self._user(self.first_patient + n, 'patient', min(95, int(self.rng.gammavariate(2.0, 18))))
+            for n in range(self.patients)
+        ))
+        self.log(f'{self.patients} patients')
+        return self.patients
+
+    def create_doctors(self):
+        rng = self.rng
+        first_user, first_doctor = _next_id(User), _next_id(Doctor)
+        users, doctors, availability, schedules = [], [], [], []
+        for n in range(self.doctors):
+            code = self._pick('department')
+            department = DEPARTMENTS[code]
+            age = rng.randint(28, 65)
+            experience = max(1, age - 27 - rng.randint(0, 3))
+            users.append(self._user(first_user + n, 'doctor', age))
+            doctors.append(Doctor(
+                id=first_doctor + n, user_id=first_user + n, department_id=self.departments[code].pk,
+                specialty=department['specialty'], qualification=department['qualification'],
+                experience=f'{experience} years', license_number=f'MCI-{first_doctor + n:07d}',
+                consultation_fee=Decimal(max(200, round(rng.lognormvariate(6.2, 0.35) / 50) * 50)),
+                rating=Decimal(f'{min(5.0, max(1.0, rng.gauss(4.2, 0.4))):.2f}'),
+                is_available=rng.random() < 0.95, is_verified=True,
+                bio=f"{department['specialty']} with {experience} years of experience.",
+            ))
+            shift = self._pick('shift')
+            hours = {weekday: shift for weekday in range(5)}
+            if rng.random() < SATURDAY_SHARE:
+                hours[5] = SATURDAY_HOURS
+            availability.extend(
+                DoctorAvailability(doctor_id=first_doctor + n, day_of_week=WEEKDAYS[weekday],
+                                   start_time=start, end_time=end, max_appointments=self._capacity(start, end))
+                for weekday, (start, end) in hours.items()
+            )
+            # Some doctors are much busier than others
+            schedules.append(Schedule(first_doctor + n, code, rng.lognormvariate(0, 0.5), hours))
+
+        self._write(User, users)
+        self._write(Doctor, doctors)
+        self._write(DoctorAvailability, availability)
+        self.log(f'{self.doctors} doctors')
+        return schedules
+
+    @staticmethod
+    def _capacity(start, end):
+        return ((end.hour - start.hour) * 60 + end.minute - start.minute) // SLOT_MINUTES
+
+    # ==================== Appointments ====================
+    def _dates(self):
+        return self.today - timedelta(days=self.days - 1), self.today + timedelta(days=self.future_days)
+
+    def create_appointments(self, schedules):
+        if not schedules or not self.patients:
+            return 0, 0
+        first_day, last_day = self._dates()
+        self.tokens = {
+            (department_id, appointment_date): last_value
+            for department_id, appointment_date, last_value in TokenSequence.objects.filter(
+                appointment_date__range=(first_day, last_day)
+            ).values_list('department_id', 'appointment_date', 'last_value')
+        }
+        self.next_appointment, self.next_record = _next_id(Appointment), _next_id(MedicalRecord)
+
+        appointments = records = 0
+        for batch in _batches(self._appointments(schedules), self.batch_size):
+            batch_records = [record for _, record in batch if record]
+            with transaction.atomic():
+                Appointment.objects.bulk_create([appointment for appointment, _ in batch])
+                if batch_records:
+                    MedicalRecord.objects.bulk_create(batch_records)
+                    # visit_date is auto_now_add, which bulk_create fills with the current time
+                    MedicalRecord.objects.filter(
+                        id__range=(batch_records[0].id, batch_records[-1].id)
+                    ).update(visit_date=Subquery(Appointment.objects.filter(
+                        pk=OuterRef('appointment_id')
+                    ).values('consultation_ended_at')[:1]))
+            appointments += len(batch)
+            records += len(batch_records)
+            self.log(f'{appointments} appointments, {records} medical records')
+        return appointments, records
+
+    def _appointments(self, schedules):
+        """(appointment, medical record or None) pairs, day by day"""
+        rng = self.rng
+        first_day, last_day = self._dates()
+        day = first_day
+        while day <= last_day:
+            ahead = (day - self.today).days
+            # Days further ahead are less booked yet
+            fill = 1 if ahead <= 0 else max(0.1, 1 - ahead / (self.future_days + 1))
+            for schedule in schedules:
+                hours = schedule.hours.get(day.weekday())
+                if not hours:
+                    continue
+                capacity = self._capacity(*hours)
+                expected = self.per_day * schedule.popularity * WEEKDAY_DEMAND[day.weekday()] * fill
+                count = min(capacity, self._poisson(expected))
+                first_slot = (hours[0].hour * 60 + hours[0].minute) // SLOT_MINUTES
+                slots = sorted(rng.sample(range(first_slot, first_slot + capacity), count))
+                # Today's queue is partway through
+                done = round(count * rng.uniform(0.3, 0.7)) if ahead == 0 else None
+                for position, slot in enumerate(slots):
+                    if ahead < 0 or (done is not None and position < done):
+                        status = self._pick('past')
+                    elif position == done:
+                        status = 'in_progress'
+                    else:
+                        status = self._pick('upcoming')
+                    yield self._appointment(schedule, day, slot, status)
+            day += timedelta(days=1)
+
+    def _appointment(self, schedule, day, slot, status):
+        rng = self.rng
+        department = self.departments[schedule.department]
+        key = (department.pk, day)
+        self.tokens[key] = token = self.tokens.get(key, 0) + 1
+        # A few patients account for many visits, as with chronic conditions
+        patient_id = self.first_patient + int(self.patients * rng.random() ** 2)
+        reason, diagnosis, treatment, medicines = rng.choice(DEPARTMENTS[schedule.department]['cases'])
+        time_slot = time(slot * SLOT_MINUTES // 60, slot * SLOT_MINUTES % 60)
+        for_self = rng.random() < 0.9
+
+        appointment = Appointment(
+            id=self.next_appointment, patient_id=patient_id, doctor_id=schedule.doctor_id,
+            department_id=department.pk, appointment_date=day, time_slot=time_slot, status=status,
+            token_number=f'{department.code}-{day:%Y%m%d}-{token:04d}', queue_position=token,
+            reason=reason, booking_type='doctor' if rng.random() < 0.6 else 'disease',
+            is_for_self=for_self, patient_relation='' if for_self else rng.choice(RELATIONS),
+        )
+        self.next_appointment += 1
+        if status not in ('completed', 'in_progress'):
+            return appointment, None
+
+        appointment.consultation_started_at = timezone.make_aware(
+            datetime.combine(day, time_slot) + timedelta(minutes=rng.randint(0, 25))
+        )
+        if status == 'in_progress':
+            return appointment, None
+        appointment.consultation_ended_at = appointment.consultation_started_at + timedelta(
+            minutes=max(3.0, rng.gauss(12, 4))
+        )
+        if rng.random() >= RECORD_SHARE:
+            return appointment, None
+
+        follow_up = rng.random() < FOLLOW_UP_SHARE
+        record = MedicalRecord(
+            id=self.next_record, patient_id=patient_id, doctor_id=schedule.doctor_id,
+            appointment_id=appointment.id, diagnosis=diagnosis, symptoms=reason, treatment_plan=treatment,
+            prescriptions=rng.sample(medicines, rng.randint(min(1, len(medicines)), len(medicines))),
+            vitals={
+                'blood_pressure': f'{round(rng.gauss(122, 14))}/{round(rng.gauss(80, 9))}',
+                'pulse': round(rng.gauss(76, 10)),
+                'temperature': round(rng.gauss(98.4, 0.7), 1),
+                'spo2': min(100, round(rng.gauss(97.5, 1.5))),
+                'weight': round(max(3.0, rng.gauss(64, 14)), 1),
+            },
+            follow_up_required=follow_up,
+            follow_up_date=day + timedelta(days=rng.randint(7, 30)) if follow_up else None,
+        )
+        self.next_record += 1
+        return appointment, record
+
+    def _poisson(self, mean):
+        # Knuth's method; means here are a few dozen at most
+        limit, count, product = math.exp(-mean), 0, self.rng.random()
+        while product > limit:
+            count += 1
+            product *= self.rng.random()
+        return count
+
+    # ==================== Derived State ====================
+    def rebuild_derived_state(self):
+        """Recompute what signals would have maintained, as bulk_create sends none"""
+        first_day, last_day = self._dates()
+        if self.tokens:
+            bulk_upsert(
+                TokenSequence,
+                [
+                    TokenSequence(department_id=department_id, appointment_date=appointment_date, last_value=value)
+                    for (department_id, appointment_date), value in self.tokens.items()
+                ],
+                unique_fields=['department', 'appointment_date'],
+                update_fields=['last_value'],
+                batch_size=self.batch_size,
+            )
+        day = first_day
+        while day <= last_day:
+            rebuild_queue_statuses(day)
+            day += timedelta(days=1)
+        rebuild_rollups(first_day, last_day)
+        rebuild_doctor_stats()
+        catalog.departments_changed()
+        catalog.directory_changed([department.pk for department in self.departments.values()])
+
+        # Primary keys were set explicitly; backends with sequences (PostgreSQL) must be told
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(
+                no_style(), [User, Doctor, Appointment, MedicalRecord]
+            ):
+                cursor.execute(statement)
+        self.log('Rebuilt token sequences, queue statuses, rollups and doctor stats')
+
+    def _write(self, model, objs):
+        for batch in _batches(objs, self.batch_size):
+            model.objects.bulk_create(batch)
@@ -1,3 +1,1769 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time as clock
+import unittest
+from unittest import mock
+from datetime import date, time
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.admin import AdminSite
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Max, Sum
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import bookings, dashboards, queues, slots
+from .admin import DoctorAdmin
+from .authentication import ClaimsRefreshToken, ClaimsUser
+from .broadcast import Broadcaster
+from .consumer import QueueConsumer
+from .budgets import QueryBudgetExceeded, budget_for
+from .locks import cache_lock
+from .routing import websocket_urlpatterns
+from .models import (
+    User, Department, Doctor, DoctorAvailability, Appointment, QueueStatus,
+    MedicalRecord, FamilyMember, AppointmentRollup, DoctorStats, TokenSequence
+)
+from .urls import router
+from .views import (
+    AuthViewSet, PatientViewSet, DoctorViewSet, AdminViewSet, AppointmentViewSet,
+    DepartmentViewSet, MedicalRecordViewSet, FamilyMemberViewSet, QueueStatusViewSet
+)
+
+
+def create_department(code='CARD'):
+    return Department.objects.create(name=f'Department {code}', code=code, description='Test department')
+
+
+def create_patient(n):
+    return User.objects.create_user(
+        email=f'patient{n}@example.com', password=None,
+        full_name=f'Patient {n}', phone=f'+91900000{n:04d}', role='patient'
+    )
+
+
+def create_doctor(department, n=1):
+    user = User.objects.create_user(
+        email=f'doctor{n}@example.com', password=None,
+        full_name=f'Doctor {n}', phone=f'+91800000{n:04d}', role='doctor'
+    )
+    return Doctor.objects.create(
+        user=user, specialty='General', department=department,
+        qualification='MBBS', experience='5 years', license_number=f'LIC{n:04d}',
+        consultation_fee=500, is_verified=True, is_available=True
+    )
+
+
+class TokenAllocationTests(TransactionTestCase):
+    """Token numbers come from the per-department daily sequence"""
+
+    def setUp(self):
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patients = [create_patient(n) for n in range(20)]
+        self.day = date(2030, 1, 7)
+
+    def book(self, patient, slot=time(9, 0)):
+        return Appointment.objects.create(
+            patient=patient, doctor=self.doctor, department=self.department,
+            appointment_date=self.day, time_slot=slot,
+            reason='Checkup', booking_type='doctor'
+        )
+
+    def test_tokens_are_sequential_per_department_and_day(self):
+        first = self.book(self.patients[0])
+        second = self.book(self.patients[1], time(9, 10))
+        self.assertEqual(first.token_number, 'CARD-20300107-0001')
+        self.assertEqual(second.token_number, 'CARD-20300107-0002')
+        self.assertEqual([first.queue_position, second.queue_position], [1, 2])
+
+    def test_sequence_is_seeded_from_existing_tokens(self):
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=self.patients[0], doctor=self.doctor, department=self.department,
+                appointment_date=self.day, time_slot=time(9, 0), reason='Legacy',
+                booking_type='doctor', token_number='CARD-20300107-0007', queue_position=7
+            )
+        ])
+        self.assertEqual(self.book(self.patients[1], time(9, 10)).queue_position, 8)
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_bookings_have_no_gaps_or_duplicates(self):
+        workers, per_worker = 16, 125
+        errors = []
+
+        def run(worker):
+            try:
+                for n in range(per_worker):
+                    # A slot of its own per booking, as a slot holds one
+                    self.book(self.patients[(worker + n) % len(self.patients)], time(worker, n % 60, n // 60))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(w,)) for w in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = workers * per_worker
+        positions = sorted(Appointment.objects.values_list('queue_position', flat=True))
+        self.assertEqual(positions, list(range(1, total + 1)))
+        self.assertEqual(Appointment.objects.values('token_number').distinct().count(), total)
+
+
+class AvailableSlotsTests(TestCase):
+    """available_slots is answered from the cached occupancy bitmap"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patient = create_patient(1)
+        self.day = date(2030, 1, 7)
+        DoctorAvailability.objects.create(
+            doctor=self.doctor, day_of_week='monday', start_time=time(9, 0), end_time=time(12, 0)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def free_slots(self):
+        response = self.client.get(
+            '/api/appointments/available_slots/', {'doctor_id': self.doctor.id, 'date': self.day.isoformat()}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [slot['value'] for slot in response.data['available_slots']]
+
+    def book(self, slot):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, department=self.department,
+                appointment_date=self.day, time_slot=slot, reason='Checkup', booking_type='doctor'
+            )
+
+    def update(self, appointment, **fields):
+        for name, value in fields.items():
+            setattr(appointment, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+
+    def test_window_mask_matches_ten_minute_grid(self):
+        mask = slots.window_mask(time(9, 0), time(17, 0))
+        self.assertEqual(slots.describe(mask)[0]['value'], '09:00')
+        self.assertEqual(slots.describe(mask)[-1]['value'], '16:50')
+        self.assertEqual(len(slots.describe(slots.window_mask(time(23, 0), time(0, 0)))), 6)
+
+    def test_booking_cancelling_and_rescheduling_update_free_slots(self):
+        self.assertEqual(len(self.free_slots()), 18)
+        appointment = self.book(time(9, 30))
+        self.assertNotIn('09:30', self.free_slots())
+
+        self.update(appointment, time_slot=time(10, 0))
+        free = self.free_slots()
+        self.assertIn('09:30', free)
+        self.assertNotIn('10:00', free)
+
+        self.update(appointment, status='cancelled')
+        self.assertEqual(len(self.free_slots()), 18)
+
+    def test_cached_bitmap_skips_appointment_query(self):
+        for minute in (0, 10, 20, 30):
+            self.book(time(10, minute))
+        self.free_slots()
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.free_slots()), 14)
+
+    def test_bitmap_locked_by_another_writer_is_dropped_not_overwritten(self):
+        self.book(time(10, 0))
+        self.free_slots()
+        key = slots.occupancy_key(self.doctor.id, self.day)
+        with cache_lock(key, 60), mock.patch('healthcare.locks.LOCK_TIMEOUT', 0.01):
+            self.book(time(10, 10))
+        self.assertIsNone(cache.get(key))
+        free = self.free_slots()
+        self.assertNotIn('10:00', free)
+        self.assertNotIn('10:10', free)
+
+    def test_calendar_returns_week_for_department_in_fixed_queries(self):
+        other = create_doctor(self.department, n=2)
+        self.book(time(9, 0))
+        params = {'department': self.department.id, 'start': self.day.isoformat()}
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/appointments/available_calendar/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['end'], '2030-01-13')
+        by_doctor = {entry['doctor_id']: entry['days'] for entry in response.data['doctors']}
+        self.assertEqual(by_doctor[self.doctor.id][0]['total_available'], 17)
+        self.assertEqual(by_doctor[self.doctor.id][1]['total_available'], 48)
+        self.assertEqual(by_doctor[other.id][0]['total_available'], 48)
+        self.assertEqual(len(by_doctor[other.id]), 7)
+
+    def test_calendar_validates_department_and_lists_only_bookable_doctors(self):
+        other = create_doctor(self.department, n=2)
+        Doctor.objects.filter(pk=other.pk).update(is_verified=False)
+        start = self.day.isoformat()
+        response = self.client.get('/api/appointments/available_calendar/', {'department': 'x', 'start': start})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/appointments/available_calendar/', {
+            'doctor_ids': f'{self.doctor.id},{other.id}', 'start': start
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['doctor_id'] for entry in response.data['doctors']], [self.doctor.id])
+
+
+class QueueStatusCounterTests(TestCase):
+    """QueueStatus follows appointment transitions without recounting"""
+
+    def setUp(self):
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patient = create_patient(1)
+        self.day = date(2030, 1, 7)
+
+    def book(self, slot):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, department=self.department,
+            appointment_date=self.day, time_slot=slot, reason='Checkup', booking_type='doctor'
+        )
+
+    def counters(self):
+        queue = QueueStatus.objects.get(doctor=self.doctor, appointment_date=self.day)
+        return queue.total_tokens, queue.completed_tokens, queue.current_token
+
+    def test_transitions_update_counters(self):
+        first = self.book(time(9, 0))
+        second = self.book(time(9, 10))
+        self.assertEqual(self.counters(), (2, 0, ''))
+
+        first.status = 'in_progress'
+        # A single queue_status UPDATE, next to the appointment's own and the rollups'
+        with CaptureQueriesContext(connection) as queries:
+            first.save(update_fields=['status'])
+        self.assertEqual(len([q for q in queries if 'queue_status' in q['sql']]), 1)
+        self.assertEqual(self.counters(), (2, 0, first.token_number))
+
+        first.status = 'completed'
+        first.save()
+        second.status = 'cancelled'
+        second.save()
+        self.assertEqual(self.counters(), (1, 1, ''))
+
+    def test_rebuild_command_repairs_counters(self):
+        appointment = self.book(time(9, 0))
+        appointment.status = 'in_progress'
+        appointment.save()
+        QueueStatus.objects.update(total_tokens=9, completed_tokens=9, current_token='')
+        call_command('rebuild_queue_status', date=self.day.isoformat(), stdout=io.StringIO())
+        self.assertEqual(self.counters(), (1, 0, appointment.token_number))
+
+
+class LiveQueueSnapshotTests(TestCase):
+    """Consumers read the cached queue snapshot, patched on each transition"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patient = create_patient(1)
+        self.today = timezone.now().date()
+
+    def tearDown(self):
+        # Deliver pending batches now rather than into a later test
+        queues.broadcaster.flush()
+
+    def book(self, slot):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, department=self.department,
+                appointment_date=self.today, time_slot=slot, reason='Checkup', booking_type='doctor'
+            )
+
+    def update(self, appointment, status):
+        appointment.status = status
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+
+    def test_snapshot_follows_transitions_without_queries(self):
+        first = self.book(time(9, 0))
+        queues.get_snapshot(self.doctor.id)
+        second = self.book(time(9, 10))
+        third = self.book(time(9, 20))
+        self.update(first, 'in_progress')
+        self.update(second, 'cancelled')
+        self.update(first, 'completed')
+        self.update(third, 'in_progress')
+
+        with self.assertNumQueries(0):
+            snapshot = queues.get_snapshot(self.doctor.id)
+        rebuilt = queues.build_snapshot(self.doctor.id, self.today)
+        self.assertEqual(snapshot['seq'], 6)
+        self.assertEqual({**snapshot, 'epoch': 0, 'seq': 0}, {**rebuilt, 'epoch': 0, 'seq': 0})
+        self.assertEqual([entry['token_number'] for entry in snapshot['queue']], [third.token_number])
+        self.assertEqual(snapshot['current_token'], third.token_number)
+        self.assertEqual((snapshot['total_tokens'], snapshot['completed_tokens']), (2, 1))
+
+    def test_resume_replays_missed_deltas(self):
+        self.book(time(9, 0))
+        snapshot = queues.get_snapshot(self.doctor.id)
+        second = self.book(time(9, 10))
+        self.update(second, 'in_progress')
+
+        message = queues.resume(self.doctor.id, snapshot['epoch'], snapshot['seq'])
+        self.assertEqual(message['type'], 'queue_replay')
+        self.assertEqual(message['seq'], snapshot['seq'] + 2)
+        self.assertEqual([delta['event'] for delta in message['deltas']], ['added', 'started'])
+        self.assertEqual(message['deltas'][-1]['current_token'], second.token_number)
+
+        self.assertEqual(queues.resume(self.doctor.id, snapshot['epoch'], message['seq'])['deltas'], [])
+        self.assertEqual(queues.resume(self.doctor.id, snapshot['epoch'] + 1, 0)['type'], 'queue_status')
+
+    def test_queue_status_polling_gets_304_without_queries(self):
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        url = f'/api/queue-status/?doctor={self.doctor.id}&date={self.today.isoformat()}'
+        self.book(time(9, 0))
+        first = client.get(url)
+        self.assertEqual(first.status_code, 200)
+
+        with self.assertNumQueries(0):
+            again = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        self.book(time(9, 10))
+        changed = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['results'][0]['total_tokens'], 2)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+
+class QueueConsumerTests(TransactionTestCase):
+    """database_sync_to_async closes the connection, so these run outside a test transaction"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patient = create_patient(1)
+
+    def test_consumer_sends_cached_snapshot_on_connect(self):
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, department=self.department,
+            appointment_date=timezone.now().date(), time_slot=time(9, 0), reason='Checkup', booking_type='doctor'
+        )
+        expected = queues.get_snapshot(self.doctor.id)
+
+        async def connect():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/queue/{self.doctor.id}/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return message
+
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(connect)(), expected)
+
+    @mock.patch.object(queues.broadcaster, 'window', 0)
+    def test_consumer_receives_deltas_and_resumes(self):
+        # The in-memory channel layer only delivers within the test's event loop,
+        # so send from the publishing thread instead of the broadcaster thread
+        snapshot = queues.get_snapshot(self.doctor.id)
+        book = database_sync_to_async(lambda: Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, department=self.department,
+            appointment_date=timezone.now().date(), time_slot=time(9, 0), reason='Checkup', booking_type='doctor'
+        ))
+
+        async def session():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns),
+                f'/ws/queue/{self.doctor.id}/?epoch={snapshot["epoch"]}&seq={snapshot["seq"]}'
+            )
+            await communicator.connect()
+            replay = await communicator.receive_json_from()
+            appointment = await book()
+            delta = await communicator.receive_json_from()
+            await communicator.send_json_to({'type': 'resume', 'epoch': snapshot['epoch'], 'seq': 0})
+            catch_up = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return replay, appointment, delta, catch_up
+
+        replay, appointment, delta, catch_up = async_to_sync(session)()
+        self.assertEqual((replay['type'], replay['deltas']), ('queue_replay', []))
+        self.assertEqual((delta['type'], delta['event'], delta['seq']), ('queue_delta', 'added', 1))
+        self.assertEqual(delta['entry']['token_number'], appointment.token_number)
+        self.assertEqual(catch_up['deltas'], [delta])
+
+    def test_consumer_drops_queue_states_the_client_is_past(self):
+        consumer = QueueConsumer()
+        consumer.position = (5, 3)
+        delta = {'type': 'queue_delta', 'epoch': 5, 'seq': 3}
+        self.assertIsNone(consumer.unseen(delta))
+        self.assertEqual(consumer.unseen(dict(delta, seq=4)), dict(delta, seq=4))
+        self.assertIsNone(consumer.unseen(dict(delta, epoch=4, seq=9)))
+        self.assertEqual(consumer.unseen(dict(delta, epoch=6, seq=1))['epoch'], 6)
+        replay = {'type': 'queue_replay', 'epoch': 5, 'seq': 4, 'deltas': [dict(delta, seq=seq) for seq in (3, 4)]}
+        self.assertEqual([d['seq'] for d in consumer.unseen(replay)['deltas']], [4])
+
+
+class LoadTestWebsocketsCommandTests(TransactionTestCase):
+    """database_sync_to_async closes the connection, so these run outside a test transaction"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctors = [create_doctor(self.department, n) for n in range(2)]
+        self.patient = create_patient(1)
+
+    def test_every_client_receives_every_update(self):
+        out = io.StringIO()
+        call_command('loadtest_websockets', queue_clients=6, appointment_clients=2, doctors=2, rounds=3,
+                     interval=0, timeout=5, stdout=out)
+        report = out.getvalue()
+        self.assertIn('Connected 8 clients', report)
+        # One update per queue and per user each round, to every client of it
+        self.assertIn('Published 9 updates', report)
+        self.assertIn('delivered 24 of 24', report)
+        self.assertIn('Broadcast-to-receive latency', report)
+        self.assertIn('Every client received every update', report)
+
+
+class BroadcasterTests(TestCase):
+    """Queue updates are coalesced per key within the window"""
+
+    def setUp(self):
+        self.sent = []
+        self.done = threading.Event()
+
+    def send(self, key, message):
+        self.sent.append((key, message))
+        self.done.set()
+
+    def test_burst_is_sent_once(self):
+        broadcaster = Broadcaster(self.send, lambda key, messages: list(messages), window=0.05, max_delay=1)
+        for n in range(5):
+            broadcaster.publish(1, n)
+        broadcaster.publish(2, 'other')
+        self.assertTrue(self.done.wait(2))
+        clock.sleep(0.1)
+        self.assertEqual(sorted(self.sent, key=str), [(1, [0, 1, 2, 3, 4]), (2, ['other'])])
+        self.assertEqual(broadcaster.stats(), {'published': 6, 'sent': 2, 'coalesced': 4, 'pending': 0})
+
+    def test_max_delay_caps_latency(self):
+        broadcaster = Broadcaster(self.send, lambda key, messages: list(messages), window=0.05, max_delay=0.2)
+        started = clock.monotonic()
+        while not self.done.is_set() and clock.monotonic() - started < 2:
+            broadcaster.publish(1, 'tick')
+            clock.sleep(0.01)
+        self.assertTrue(self.done.is_set())
+        self.assertLess(clock.monotonic() - started, 0.5)
+
+    def test_counters_are_logged_while_sending(self):
+        broadcaster = Broadcaster(
+            self.send, lambda key, messages: list(messages), window=0.01, max_delay=1, log_interval=0
+        )
+        with self.assertLogs('healthcare.broadcast', 'INFO') as logs:
+            broadcaster.publish(1, 'a')
+            self.assertTrue(self.done.wait(2))
+            clock.sleep(0.05)
+        self.assertIn("'published': 1", logs.output[0])
+
+    def test_flush_sends_pending_batches(self):
+        broadcaster = Broadcaster(self.send, lambda key, messages: list(messages), window=60, max_delay=60)
+        broadcaster.publish(1, 'a')
+        broadcaster.publish(1, 'b')
+        broadcaster.flush()
+        self.assertEqual(self.sent, [(1, ['a', 'b'])])
+        self.assertEqual(broadcaster.stats(), {'published': 2, 'sent': 1, 'coalesced': 1, 'pending': 0})
+
+
+# ==================== Query Budgets ====================
+# One representative request per routed viewset action:
+# (viewset.action, role, method, path, data). Paths are formatted with the
+# ids seeded by QueryBudgetTests.setUpTestData.
+BUDGET_REQUESTS = [
+    ('AuthViewSet.register', None, 'post', '/api/auth/register/', {
+        'email': 'new@example.com', 'password': 'S3cure-pass!', 'password2': 'S3cure-pass!',
+        'full_name': 'New Patient', 'phone': '+919111111111'
+    }),
+    ('AuthViewSet.login', None, 'post', '/api/auth/login/', {'email': 'patient0@example.com', 'password': 'patient123'}),
+    ('PatientViewSet.dashboard', 'patient', 'get', '/api/patient/dashboard/', None),
+    ('PatientViewSet.profile', 'patient', 'get', '/api/patient/profile/', None),
+    ('PatientViewSet.update_profile', 'patient', 'patch', '/api/patient/update_profile/', {'address': 'New address'}),
+    ('DoctorViewSet.list', 'patient', 'get', '/api/doctor/', None),
+    ('DoctorViewSet.retrieve', 'patient', 'get', '/api/doctor/{doctor}/', None),
+    ('DoctorViewSet.create', 'admin', 'post', '/api/doctor/', {
+        'specialty': 'General', 'department': '{department}', 'qualification': 'MBBS', 'experience': '3 years',
+        'license_number': 'NEWLIC', 'consultation_fee': '300.00'
+    }),
+    ('DoctorViewSet.update', 'doctor', 'put', '/api/doctor/{doctor}/', {
+        'specialty': 'General', 'department': '{department}', 'qualification': 'MBBS, MD', 'experience': '6 years',
+        'license_number': 'LIC0000', 'consultation_fee': '500.00'
+    }),
+    ('DoctorViewSet.partial_update', 'doctor', 'patch', '/api/doctor/{doctor}/', {'bio': 'Updated'}),
+    ('DoctorViewSet.destroy', 'admin', 'delete', '/api/doctor/{other_doctor}/', None),
+    ('DoctorViewSet.dashboard', 'doctor', 'get', '/api/doctor/dashboard/', None),
+    ('DoctorViewSet.appointments', 'doctor', 'get', '/api/doctor/appointments/', None),
+    ('DoctorViewSet.availability', 'doctor', 'get', '/api/doctor/availability/', None),
+    ('AdminViewSet.dashboard', 'admin', 'get', '/api/admin/dashboard/', None),
+    ('AdminViewSet.register_doctor', 'admin', 'post', '/api/admin/register_doctor/', {
+        'email': 'newdoc@example.com', 'password': 'S3cure-pass!', 'full_name': 'New Doctor',
+        'phone': '+919222222222', 'gender': 'female', 'address': 'Clinic', 'aadhaar_number': '999988887777',
+        'specialty': 'General', 'department': '{department}', 'qualification': 'MBBS',
+        'experience': '3 years', 'license_number': 'NEWLIC', 'consultation_fee': '300.00'
+    }),
+    ('AdminViewSet.verify_doctor', 'admin', 'post', '/api/admin/{doctor}/verify_doctor/', None),
+    ('AdminViewSet.users', 'admin', 'get', '/api/admin/users/', None),
+    ('AdminViewSet.reports', 'admin', 'get', '/api/admin/reports/?type=doctors', None),
+    ('AdminViewSet.export', 'admin', 'get', '/api/admin/export/appointments/?department={department}', None),
+    ('AppointmentViewSet.list', 'patient', 'get', '/api/appointments/', None),
+    ('AppointmentViewSet.retrieve', 'patient', 'get', '/api/appointments/{appointment}/', None),
+    # Bookings are each doctor's and department's first of the day, the most expensive case
+    ('AppointmentViewSet.create', 'patient', 'post', '/api/appointments/', {
+        'doctor': '{new_doctor}', 'department': '{new_department}', 'appointment_date': '{today}',
+        'time_slot': '16:00', 'reason': 'Fever', 'booking_type': 'doctor'
+    }),
+    ('AppointmentViewSet.update', 'admin', 'put', '/api/appointments/{appointment}/', {
+        'doctor': '{doctor}', 'department': '{department}', 'appointment_date': '{today}', 'time_slot': '09:00',
+        'reason': 'Follow-up', 'booking_type': 'doctor'
+    }),
+    ('AppointmentViewSet.partial_update', 'admin', 'patch', '/api/appointments/{appointment}/', {'notes': 'Note'}),
+    ('AppointmentViewSet.destroy', 'admin', 'delete', '/api/appointments/{appointment}/', None),
+    ('AppointmentViewSet.bulk', 'admin', 'post', '/api/appointments/bulk/', {
+        'doctor': '{new_doctor}', 'appointment_date': '{today}', 'appointments': [
+            {'patient_id': '{patient}', 'time_slot': f'15:{minute}', 'reason': 'Screening'}
+            for minute in ('00', '10', '20', '30', '40', '50')
+        ]
+    }),
+    ('AppointmentViewSet.cancel', 'patient', 'post', '/api/appointments/{appointment}/cancel/', None),
+    ('AppointmentViewSet.reschedule', 'patient', 'post', '/api/appointments/{appointment}/reschedule/', {
+        'appointment_date': '{today}', 'time_slot': '16:30'
+    }),
+    ('AppointmentViewSet.queue_status', 'patient', 'get', '/api/appointments/queue_status/?doctor_id={doctor}', None),
+    ('AppointmentViewSet.start_consultation', 'doctor', 'post', '/api/appointments/{appointment}/start_consultation/', None),
+    ('AppointmentViewSet.end_consultation', 'doctor', 'post', '/api/appointments/{appointment}/end_consultation/', None),
+    ('AppointmentViewSet.available_slots', 'patient', 'get',
+     '/api/appointments/available_slots/?doctor_id={doctor}&date={today}', None),
+    ('AppointmentViewSet.available_calendar', 'patient', 'get',
+     '/api/appointments/available_calendar/?department={department}&start={today}', None),
+    ('DepartmentViewSet.list', None, 'get', '/api/departments/', None),
+    ('DepartmentViewSet.retrieve', None, 'get', '/api/departments/{department}/', None),
+    ('MedicalRecordViewSet.list', 'patient', 'get', '/api/medical-records/', None),
+    ('MedicalRecordViewSet.retrieve', 'patient', 'get', '/api/medical-records/{record}/', None),
+    ('MedicalRecordViewSet.create', 'doctor', 'post', '/api/medical-records/', {
+        'patient': '{patient}', 'doctor': '{doctor}', 'diagnosis': 'Flu', 'symptoms': 'Fever', 'treatment_plan': 'Rest'
+    }),
+    ('MedicalRecordViewSet.update', 'doctor', 'put', '/api/medical-records/{record}/', {
+        'patient': '{patient}', 'doctor': '{doctor}', 'diagnosis': 'Flu', 'symptoms': 'Fever', 'treatment_plan': 'Fluids'
+    }),
+    ('MedicalRecordViewSet.partial_update', 'doctor', 'patch', '/api/medical-records/{record}/', {'notes': 'Better'}),
+    ('MedicalRecordViewSet.destroy', 'admin', 'delete', '/api/medical-records/{record}/', None),
+    ('FamilyMemberViewSet.list', 'patient', 'get', '/api/family-members/', None),
+    ('FamilyMemberViewSet.retrieve', 'patient', 'get', '/api/family-members/{family_member}/', None),
+    ('FamilyMemberViewSet.create', 'patient', 'post', '/api/family-members/', {
+        'full_name': 'Child', 'age': 8, 'gender': 'female', 'aadhaar_number': '111122223333', 'relation': 'Daughter'
+    }),
+    ('FamilyMemberViewSet.update', 'patient', 'put', '/api/family-members/{family_member}/', {
+        'full_name': 'Member 0', 'age': 31, 'gender': 'male', 'aadhaar_number': '500000000000', 'relation': 'Sibling'
+    }),
+    ('FamilyMemberViewSet.partial_update', 'patient', 'patch', '/api/family-members/{family_member}/', {'age': 9}),
+    ('FamilyMemberViewSet.destroy', 'patient', 'delete', '/api/family-members/{family_member}/', None),
+    ('QueueStatusViewSet.list', 'patient', 'get', '/api/queue-status/', None),
+    ('QueueStatusViewSet.retrieve', 'patient', 'get', '/api/queue-status/{queue_status}/', None),
+]
+
+def _format(data, ids):
+    """Request data with its '{name}' placeholders filled in, at any depth"""
+    if isinstance(data, str):
+        return data.format(**ids)
+    if isinstance(data, dict):
+        return {key: _format(value, ids) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_format(value, ids) for value in data]
+    return data
+
+
+# Requests answered with an error by design; every other request must succeed
+BUDGET_STATUSES = {
+    'DoctorViewSet.create': 405,
+}
+
+# Rows seeded per list so that a per-row query cannot hide inside a budget
+BUDGET_ROWS = 8
+
+# Actions that still run queries per row; drop them from here as they are fixed
+KNOWN_OVER_BUDGET = set()
+
+
+class QueryBudgetTests(TestCase):
+    """Every routed action declares a query budget and stays within it on seeded data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.now().date()
+        departments = [create_department(code) for code in ('CARD', 'NEURO')]
+        doctors = [create_doctor(departments[n % 2], n) for n in range(BUDGET_ROWS)]
+        patients = [create_patient(n) for n in range(BUDGET_ROWS)]
+        patients[0].set_password('patient123')
+        patients[0].save()
+        admin = User.objects.create_user(
+            email='admin@example.com', password=None, full_name='Admin', phone='+917000000000', role='admin'
+        )
+        for doctor in doctors:
+            for day in ('monday', 'tuesday', 'wednesday', 'thursday', 'friday'):
+                DoctorAvailability.objects.create(
+                    doctor=doctor, day_of_week=day, start_time=time(9, 0), end_time=time(17, 0)
+                )
+        appointments = []
+        for n in range(BUDGET_ROWS):
+            for day_offset in (0, 1):
+                appointments.append(Appointment.objects.create(
+                    patient=patients[0], doctor=doctors[n % 2], department=departments[0],
+                    appointment_date=cls.today + timezone.timedelta(days=day_offset),
+                    time_slot=time(9 + n // 6, n % 6 * 10), reason='Checkup', booking_type='doctor'
+                ))
+        records = [
+            MedicalRecord.objects.create(
+                patient=patients[0], doctor=doctors[0], appointment=appointment,
+                diagnosis='Flu', symptoms='Fever', treatment_plan='Rest'
+            )
+            for appointment in appointments[:BUDGET_ROWS]
+        ]
+        family = [
+            FamilyMember.objects.create(
+                user=patients[0], full_name=f'Member {n}', age=30 + n, gender='male',
+                aadhaar_number=f'{500000000000 + n}', relation='Sibling'
+            )
+            for n in range(BUDGET_ROWS)
+        ]
+        cls.users = {'patient': patients[0], 'doctor': doctors[0].user, 'admin': admin}
+        cls.ids = {
+            'department': departments[0].id, 'doctor': doctors[0].id, 'other_doctor': doctors[-1].id,
+            'new_doctor': doctors[3].id, 'new_department': departments[1].id,
+            'patient': patients[0].id, 'appointment': appointments[0].id, 'record': records[0].id,
+            'family_member': family[0].id,
+            'queue_status': QueueStatus.objects.get(doctor=doctors[0], appointment_date=cls.today).id,
+            'today': cls.today.isoformat(),
+        }
+
+    def setUp(self):
+        cache.clear()
+
+    def request(self, role, method, path, data):
+        client = APIClient()
+        if role:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.users[role]).access_token}')
+        data = _format(data, self.ids)
+        # Post-commit work (cache patches, snapshot rebuilds) runs in the request in production
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = getattr(client, method)(path.format(**self.ids), data, format='json')
+            # Streamed bodies run their queries as they are read
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.body = body
+        return response, len(queries)
+
+    def test_every_routed_action_has_a_budget_and_a_request(self):
+        routed = set()
+        for prefix, viewset, basename in router.registry:
+            for route in router.get_routes(viewset):
+                for action in router.get_method_map(viewset, route.mapping).values():
+                    routed.add((viewset, action))
+        covered = {key for key, *_ in BUDGET_REQUESTS}
+        for viewset, action in routed:
+            key = f'{viewset.__name__}.{action}'
+            self.assertIsNotNone(budget_for(viewset, action), f'{key} has no query budget')
+            self.assertIn(key, covered, f'{key} is missing from BUDGET_REQUESTS')
+
+    def test_later_bookings_of_a_day_stay_well_within_the_budget(self):
+        spec = next(spec for key, *spec in BUDGET_REQUESTS if key == 'AppointmentViewSet.create')
+        first, first_count = self.request(*spec)
+        later, later_count = self.request(*spec[:3], dict(spec[3], time_slot='16:10'))
+        self.assertEqual((first.status_code, later.status_code), (201, 201))
+        # The budget covers the day's first booking; the rest skip its setup work
+        self.assertLessEqual(later_count, 14, f'later booking ran {later_count} queries')
+        self.assertLess(later_count, first_count)
+
+    def test_middleware_reports_exceeded_budget(self):
+        with override_settings(QUERY_BUDGET_MODE='raise'), \
+                mock.patch.dict(DepartmentViewSet.query_budgets, {'list': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                APIClient().get('/api/departments/')
+
+
+def _budget_test(key, role, method, path, data):
+    def test(self):
+        viewset, action = key.split('.')
+        budget = budget_for(globals()[viewset], action)
+        response, count = self.request(role, method, path, data)
+        if key in BUDGET_STATUSES:
+            self.assertEqual(response.status_code, BUDGET_STATUSES[key], response.body[:500])
+        else:
+            self.assertTrue(200 <= response.status_code < 300, response.body[:500])
+        self.assertLessEqual(count, budget, f'{method.upper()} {path} ran {count} queries')
+    return test
+
+
+for _key, *_spec in BUDGET_REQUESTS:
+    _test = _budget_test(_key, *_spec)
+    if _key in KNOWN_OVER_BUDGET:
+        _test = unittest.expectedFailure(_test)
+    setattr(QueryBudgetTests, f'test_budget_{_key.replace(".", "_")}', _test)
+
+
+class BenchmarkQueriesCommandTests(TransactionTestCase):
+    """The queue WebSocket is measured through database_sync_to_async, which closes the connection"""
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.baseline = os.path.join(self.directory.name, 'baseline.json')
+
+    def benchmark(self, **options):
+        out = io.StringIO()
+        with override_settings(QUERY_BUDGET_MODE='off'):
+            call_command('benchmark_queries', repeat=2, clients=3, baseline=self.baseline, stdout=out, **options)
+        return out.getvalue()
+
+    def test_seeds_and_reports_every_endpoint(self):
+        report = self.benchmark(appointments=200, save_baseline=True)
+        seeded = Appointment.objects.count()
+        self.assertGreaterEqual(seeded, 200)
+        for path in ('/api/patient/dashboard/', '/api/doctor/dashboard/', '/api/medical-records/',
+                     'POST /api/auth/login/', 'available_slots', 'WS /ws/queue/{doctor_id}/ broadcast'):
+            self.assertIn(path, report)
+        self.assertRegex(report, r'POST /api/appointments/ +patient +201 ')
+
+        with open(self.baseline) as handle:
+            stored = json.load(handle)
+        # Bookings made while measuring are deleted again
+        self.assertEqual(stored['appointments'], seeded)
+        result = stored['results']['GET /api/admin/dashboard/ [admin]']
+        self.assertEqual(set(result), {'status', 'queries', 'p50', 'p95', 'p99', 'throughput'})
+
+    def test_compare_fails_on_more_queries(self):
+        self.benchmark(appointments=50, save_baseline=True)
+        with open(self.baseline) as handle:
+            stored = json.load(handle)
+        stored['results']['GET /api/medical-records/ [admin]']['queries'] = 0
+        for result in stored['results'].values():
+            result['p95'] = 1e6
+        with open(self.baseline, 'w') as handle:
+            json.dump(stored, handle)
+
+        with self.assertRaisesMessage(CommandError, 'GET /api/medical-records/ [admin]: queries 0 -> 1'):
+            self.benchmark(compare=True)
+
+
+class DepartmentCatalogTests(TestCase):
+    """The department list is annotated in one query and cached until a department or doctor changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.client = APIClient()
+
+    def doctor_counts(self):
+        return {row['code']: row['doctor_count'] for row in self.client.get('/api/departments/').data['results']}
+
+    def test_counts_doctors_without_a_query_per_department(self):
+        for n, code in enumerate(('NEURO', 'ORTHO', 'DERM')):
+            create_doctor(create_department(code), n + 2)
+        with self.assertNumQueries(2):
+            counts = self.doctor_counts()
+        self.assertEqual(counts, {'CARD': 1, 'NEURO': 1, 'ORTHO': 1, 'DERM': 1})
+
+    def test_repeat_loads_are_served_from_cache(self):
+        self.doctor_counts()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.doctor_counts(), {'CARD': 1})
+
+    def test_doctor_changes_invalidate_the_cached_list(self):
+        self.doctor_counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_doctor(self.department, 2)
+        self.assertEqual(self.doctor_counts(), {'CARD': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.is_available = False
+            self.doctor.save()
+        self.assertEqual(self.doctor_counts(), {'CARD': 1})
+
+    def test_department_changes_invalidate_the_cached_list(self):
+        self.doctor_counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.department.is_active = False
+            self.department.save()
+        self.assertEqual(self.doctor_counts(), {})
+
+
+class DoctorDirectoryTests(TestCase):
+    """Patients read the doctor directory from cache until a doctor they can see changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.cardiology = create_department('CARD')
+        self.neurology = create_department('NEURO')
+        self.doctor = create_doctor(self.cardiology, 1)
+        self.other = create_doctor(self.neurology, 2)
+        self.client = APIClient()
+        self.client.force_authenticate(create_patient(1))
+
+    def names(self, department=None):
+        response = self.client.get('/api/doctor/', {'department': department} if department else {})
+        self.assertEqual(response.status_code, 200)
+        return sorted(doctor['full_name'] for doctor in response.json()['results'])
+
+    def test_lists_all_doctors_or_one_department(self):
+        self.assertEqual(self.names(), ['Doctor 1', 'Doctor 2'])
+        self.assertEqual(self.names(self.neurology.id), ['Doctor 2'])
+
+    def test_repeat_loads_are_served_from_cache(self):
+        self.names(self.cardiology.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(self.cardiology.id), ['Doctor 1'])
+
+    def test_doctor_changes_only_invalidate_listings_they_appear_in(self):
+        self.names(self.cardiology.id)
+        self.names(self.neurology.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.user.full_name = 'Renamed'
+            self.other.user.save()
+        with self.assertNumQueries(0):
+            self.names(self.cardiology.id)
+        self.assertEqual(self.names(self.neurology.id), ['Renamed'])
+        self.assertEqual(self.names(), ['Doctor 1', 'Renamed'])
+
+    def test_moving_a_doctor_updates_both_departments(self):
+        self.names(self.cardiology.id)
+        doctor = Doctor.objects.get(pk=self.doctor.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.department = self.neurology
+            doctor.save()
+        self.assertEqual(self.names(self.cardiology.id), [])
+        self.assertEqual(self.names(self.neurology.id), ['Doctor 1', 'Doctor 2'])
+
+    def test_admin_verify_action_invalidates_the_directory(self):
+        Doctor.objects.filter(pk=self.doctor.pk).update(is_verified=False)
+        cache.clear()
+        self.assertEqual(self.names(self.cardiology.id), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            DoctorAdmin(Doctor, AdminSite()).verify_doctors(mock.Mock(), Doctor.objects.filter(pk=self.doctor.pk))
+        self.assertEqual(self.names(self.cardiology.id), ['Doctor 1'])
+
+    def test_availability_changes_invalidate_the_directory(self):
+        self.names(self.cardiology.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            DoctorAvailability.objects.create(
+                doctor=self.doctor, day_of_week='monday', start_time=time(9, 0), end_time=time(13, 0)
+            )
+        response = self.client.get('/api/doctor/', {'department': self.cardiology.id})
+        self.assertEqual(len(response.json()['results'][0]['availabilities']), 1)
+
+    def test_logins_do_not_invalidate_the_directory(self):
+        self.names()
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(pk=self.doctor.user_id)
+            user.last_login_at = timezone.now()
+            user.save(update_fields=['last_login_at'])
+        with self.assertNumQueries(0):
+            self.names()
+
+    def test_warm_command_fills_every_listing(self):
+        call_command('warm_catalog', stdout=io.StringIO())
+        with self.assertNumQueries(0):
+            self.names()
+            self.names(self.cardiology.id)
+            self.names(self.neurology.id)
+
+
+class ClaimsAuthenticationTests(TestCase):
+    """Requests authenticate from token claims, loading the user only when a view needs it"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patient = create_patient(1)
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, department=self.department,
+            appointment_date=timezone.now().date(), time_slot=time(9, 0), reason='Checkup', booking_type='doctor'
+        )
+
+    def client_for(self, user, token_class=ClaimsRefreshToken):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token_class.for_user(user).access_token}')
+        return client
+
+    def test_claims_carry_role_and_doctor_profile(self):
+        token = AccessToken(str(ClaimsRefreshToken.for_user(self.doctor.user).access_token))
+        self.assertEqual((token['role'], token['doctor_id']), ('doctor', self.doctor.id))
+
+    def test_reads_run_no_authentication_query(self):
+        client = self.client_for(self.patient)
+        with self.assertNumQueries(1):
+            response = client.get('/api/appointments/')
+        self.assertEqual(len(response.data['results']), 1)
+
+        client = self.client_for(self.doctor.user)
+        with self.assertNumQueries(1):
+            response = client.get('/api/doctor/appointments/')
+        self.assertEqual(len(response.data), 1)
+
+    def test_user_fields_are_loaded_lazily_and_cached(self):
+        client = self.client_for(self.patient)
+        with self.assertNumQueries(1):
+            self.assertEqual(client.get('/api/patient/profile/').data['email'], self.patient.email)
+        with self.assertNumQueries(0):
+            client.get('/api/patient/profile/')
+
+    def test_tokens_without_claims_still_authenticate(self):
+        client = self.client_for(self.patient, token_class=RefreshToken)
+        self.assertEqual(client.get('/api/appointments/').status_code, 200)
+        with self.assertNumQueries(1):
+            client.get('/api/appointments/')
+
+    def test_role_change_revokes_earlier_tokens(self):
+        client = self.client_for(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.role = 'admin'
+            self.patient.save()
+        self.assertEqual(client.get('/api/appointments/').status_code, 401)
+        self.assertEqual(self.client_for(self.patient).get('/api/admin/users/').status_code, 200)
+
+    def test_deactivation_revokes_earlier_tokens(self):
+        client = self.client_for(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.is_active = False
+            self.patient.save()
+        self.assertEqual(client.get('/api/appointments/').status_code, 401)
+
+    def test_deactivating_a_user_not_loaded_from_the_database_revokes_earlier_tokens(self):
+        client = self.client_for(self.patient)
+        stored = User.objects.values().get(pk=self.patient.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            User(**stored).save()
+        self.assertEqual(client.get('/api/appointments/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            User(**dict(stored, is_active=False)).save()
+        self.assertEqual(client.get('/api/appointments/').status_code, 401)
+
+    def test_only_claims_are_answered_without_loading_the_user(self):
+        user = ClaimsUser(self.patient.pk, 'patient')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                (user.pk, user.role, user.doctor_id, user.is_authenticated), (self.patient.pk, 'patient', None, True)
+            )
+        User.objects.filter(pk=self.patient.pk).update(is_active=False)
+        with self.assertNumQueries(1):
+            self.assertFalse(user.is_active)
+        self.assertIsInstance(user, User)
+
+    def refresh(self, token):
+        return APIClient().post('/api/token/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_refresh_checks_revocation_in_the_database(self):
+        token = ClaimsRefreshToken.for_user(self.patient)
+        self.assertEqual(self.refresh(ClaimsRefreshToken.for_user(self.patient)).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.role = 'admin'
+            self.patient.save()
+        # Surviving the loss of the cached revocation
+        cache.clear()
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.patient.save()
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(self.refresh(ClaimsRefreshToken.for_user(self.patient)).status_code, 200)
+
+    def test_inactive_users_cannot_refresh(self):
+        token = ClaimsRefreshToken.for_user(self.patient)
+        User.objects.filter(pk=self.patient.pk).update(is_active=False)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_profile_edits_refresh_the_cached_user(self):
+        client = self.client_for(self.patient)
+        client.get('/api/patient/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch('/api/patient/update_profile/', {'address': 'New address'}, format='json')
+        self.assertEqual(client.get('/api/patient/profile/').data['address'], 'New address')
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages follow each other without gaps or repeats at a constant query cost"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password=None, full_name='Admin', phone='+917000000000', role='admin'
+        )
+        for n in range(1, 8):
+            create_patient(n)
+        # Ties on created_at must be broken by id
+        User.objects.filter(role='patient').update(created_at=timezone.now())
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}'
+        )
+
+    def test_pages_cover_every_row_once_in_order(self):
+        seen, url = [], '/api/admin/users/?page_size=3'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(user['id'] for user in response.data['results'])
+            url = response.data['next']
+
+        expected = list(User.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/admin/users/?cursor=bogus').status_code, 404)
+
+    def test_doctor_day_list_is_returned_whole(self):
+        doctor = create_doctor(create_department())
+        for n in range(25):
+            Appointment.objects.create(
+                patient_id=User.objects.filter(role='patient').values_list('id', flat=True)[n % 7],
+                doctor=doctor, department=doctor.department, appointment_date=timezone.now().date(),
+                time_slot=time(10 + n // 6, n % 6 * 10), reason='Checkup', booking_type='doctor'
+            )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(doctor.user).access_token}')
+        response = client.get('/api/doctor/appointments/')
+        self.assertEqual([row['queue_position'] for row in response.data], list(range(1, 26)))
+
+
+class ExportTests(TestCase):
+    """Admin exports stream every matching row in batches"""
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.departments = [create_department(code) for code in ('CARD', 'NEURO')]
+        doctors = [create_doctor(department, n) for n, department in enumerate(self.departments)]
+        self.patient = create_patient(1)
+        for n in range(5):
+            for doctor in doctors:
+                Appointment.objects.create(
+                    patient=self.patient, doctor=doctor, department=doctor.department,
+                    appointment_date=self.today + timezone.timedelta(days=n - 2),
+                    time_slot=time(9, n * 10), reason='Checkup', booking_type='doctor'
+                )
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password=None, full_name='Admin', phone='+917000000000', role='admin'
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}'
+        )
+
+    def read(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_filters_by_date_range_and_department(self):
+        response, body = self.read(
+            f'/api/admin/export/appointments/?start={self.today}&end={self.today + timezone.timedelta(days=1)}'
+            f'&department={self.departments[0].id}'
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row['department_id'] for row in rows}, {self.departments[0].id})
+        self.assertTrue(all(row['appointment_date'] >= self.today.isoformat() for row in rows))
+
+    def test_rows_are_read_in_batches(self):
+        with mock.patch('healthcare.exports.EXPORT_CHUNK_SIZE', 3):
+            response = self.client.get('/api/admin/export/appointments/')
+            with self.assertNumQueries(4):
+                body = b''.join(response.streaming_content).decode()
+        ids = [json.loads(line)['id'] for line in body.splitlines()]
+        self.assertEqual(ids, sorted(Appointment.objects.values_list('id', flat=True)))
+
+    def test_csv_has_a_header_and_one_line_per_row(self):
+        response, body = self.read('/api/admin/export/users/?output=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(lines[0][:2], ['id', 'email'])
+        self.assertEqual(len(lines) - 1, User.objects.count())
+        self.assertNotIn('password', lines[0])
+
+    def test_invalid_dates_are_rejected(self):
+        self.assertEqual(self.client.get('/api/admin/export/medical-records/?start=soon').status_code, 400)
+
+    def test_exports_are_admin_only(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.patient).access_token}')
+        self.assertEqual(client.get('/api/admin/export/users/').status_code, 403)
+
+
+class AppointmentRollupTests(TestCase):
+    """Reports are answered from daily rollups kept in step with appointment transitions"""
+
+    def setUp(self):
+        self.departments = [create_department(code) for code in ('CARD', 'NEURO')]
+        self.doctors = [create_doctor(department, n) for n, department in enumerate(self.departments)]
+        self.patient = create_patient(1)
+        self.day = date(2030, 1, 7)
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password=None, full_name='Admin', phone='+917000000000', role='admin'
+        )
+
+    def book(self, doctor, day, slot):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=doctor, department=doctor.department,
+            appointment_date=day, time_slot=slot, reason='Checkup', booking_type='doctor'
+        )
+
+    def rollups(self):
+        return {
+            (row.appointment_date, row.doctor_id, row.status): row.count
+            for row in AppointmentRollup.objects.exclude(count=0)
+        }
+
+    def recounted(self):
+        AppointmentRollup.objects.all().delete()
+        call_command('backfill_rollups', stdout=io.StringIO())
+        return self.rollups()
+
+    def test_transitions_move_counts_between_statuses(self):
+        first = self.book(self.doctors[0], self.day, time(9, 0))
+        self.book(self.doctors[0], self.day, time(9, 10))
+        first.status = 'completed'
+        first.save()
+        self.assertEqual(self.rollups(), {
+            (self.day, self.doctors[0].id, 'scheduled'): 1,
+            (self.day, self.doctors[0].id, 'completed'): 1,
+        })
+
+        first.appointment_date = self.day + timezone.timedelta(days=1)
+        first.save()
+        first.delete()
+        self.assertEqual(self.rollups(), {(self.day, self.doctors[0].id, 'scheduled'): 1})
+        self.assertEqual(self.rollups(), self.recounted())
+
+    def test_missing_rows_are_recounted_on_first_change(self):
+        first = self.book(self.doctors[0], self.day, time(9, 0))
+        self.book(self.doctors[0], self.day, time(9, 10))
+        AppointmentRollup.objects.all().delete()
+        first.status = 'cancelled'
+        first.save()
+        self.assertEqual(self.rollups(), {
+            (self.day, self.doctors[0].id, 'scheduled'): 1,
+            (self.day, self.doctors[0].id, 'cancelled'): 1,
+        })
+
+    def test_reports_filter_by_date_range(self):
+        for n, doctor in enumerate(self.doctors):
+            for offset in range(n + 1):
+                self.book(doctor, self.day + timezone.timedelta(days=offset), time(9, 0))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}')
+
+        with self.assertNumQueries(2):
+            report = client.get('/api/admin/reports/').data
+        self.assertEqual(report['total_appointments'], 3)
+        self.assertEqual(report['by_status'], [{'status': 'scheduled', 'count': 3}])
+
+        report = client.get(f'/api/admin/reports/?start={self.day}&end={self.day}').data
+        self.assertEqual(report['total_appointments'], 2)
+        self.assertEqual(
+            {row['department__name']: row['count'] for row in report['by_department']},
+            {'Department CARD': 1, 'Department NEURO': 1}
+        )
+
+        doctors = client.get(f'/api/admin/reports/?type=doctors&start={self.day + timezone.timedelta(days=1)}').data
+        self.assertEqual(
+            {row['id']: row['appointment_count'] for row in doctors['doctors']},
+            {self.doctors[0].id: 0, self.doctors[1].id: 1}
+        )
+        self.assertEqual(client.get('/api/admin/reports/?start=yesterday').status_code, 400)
+
+
+class AdminDashboardTests(TestCase):
+    """The admin dashboard is computed with a few aggregates and shared through the cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patient = create_patient(1)
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, department=self.department,
+            appointment_date=timezone.now().date(), time_slot=time(9, 0), reason='Checkup', booking_type='doctor'
+        )
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password=None, full_name='Admin', phone='+917000000000', role='admin'
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}'
+        )
+
+    def test_counts_are_cached(self):
+        with self.assertNumQueries(5):
+            stats = self.client.get('/api/admin/dashboard/').data
+        self.assertEqual(
+            (stats['total_users'], stats['total_patients'], stats['total_doctors'], stats['total_departments']),
+            (3, 1, 1, 1)
+        )
+        self.assertEqual((stats['total_appointments'], stats['today_appointments']), (1, 1))
+        self.assertEqual(stats['pending_verifications'], 0)
+        self.assertEqual(len(stats['recent_registrations']), 3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/admin/dashboard/').data, stats)
+
+    def test_stale_stats_are_served_while_refreshed_in_the_background(self):
+        self.client.get('/api/admin/dashboard/')
+        create_patient(2)
+        later = clock.time() + dashboards.ADMIN_DASHBOARD_TTL + 1
+
+        with mock.patch('healthcare.dashboards.time.time', return_value=later), \
+                mock.patch('healthcare.dashboards.threading.Thread') as thread:
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get('/api/admin/dashboard/').data['total_patients'], 1)
+            # A second stale read does not start another refresh
+            self.client.get('/api/admin/dashboard/')
+        thread.assert_called_once()
+
+        # Run the refresh here, where the test's data is visible
+        with mock.patch('healthcare.dashboards.connection'):
+            thread.call_args.kwargs['target']()
+        self.assertEqual(self.client.get('/api/admin/dashboard/').data['total_patients'], 2)
+
+
+class DoctorStatsTests(TestCase):
+    """Doctor totals follow appointment changes without recounting the history"""
+
+    def setUp(self):
+        self.department = create_department()
+        self.doctors = [create_doctor(self.department, n) for n in range(2)]
+        self.patients = [create_patient(n) for n in range(2)]
+        self.today = timezone.now().date()
+
+    def book(self, patient, doctor=None, slot=time(9, 0)):
+        return Appointment.objects.create(
+            patient=patient, doctor=doctor or self.doctors[0], department=self.department,
+            appointment_date=self.today, time_slot=slot, reason='Checkup', booking_type='doctor'
+        )
+
+    def totals(self, doctor=None):
+        stats = DoctorStats.objects.filter(doctor=doctor or self.doctors[0]).first()
+        return (stats.total_patients, stats.total_consultations) if stats else (0, 0)
+
+    def test_patients_are_counted_once_per_doctor(self):
+        first = self.book(self.patients[0])
+        self.book(self.patients[0], slot=time(9, 10))
+        self.book(self.patients[1], slot=time(9, 20))
+        self.assertEqual(self.totals(), (2, 0))
+
+        first.delete()
+        self.assertEqual(self.totals(), (2, 0))
+        second = Appointment.objects.get(patient=self.patients[0])
+        second.doctor = self.doctors[1]
+        second.save()
+        self.assertEqual(self.totals(), (1, 0))
+        self.assertEqual(self.totals(self.doctors[1]), (1, 0))
+
+    def test_completed_consultations_are_counted(self):
+        appointment = self.book(self.patients[0])
+        appointment.status = 'completed'
+        # The appointment UPDATE and one stats UPDATE next to the queue and rollup ones
+        with CaptureQueriesContext(connection) as queries:
+            appointment.save()
+        self.assertEqual(len([q for q in queries if 'doctor_stats' in q['sql']]), 1)
+        self.assertEqual(self.totals(), (1, 1))
+
+        appointment.status = 'no_show'
+        appointment.save()
+        self.assertEqual(self.totals(), (1, 0))
+
+    def test_rebuild_matches_incremental_counts(self):
+        self.book(self.patients[0]).delete()
+        for n, patient in enumerate(self.patients):
+            self.book(patient, slot=time(10, n * 10))
+        expected = [self.totals(doctor) for doctor in self.doctors]
+        DoctorStats.objects.update(total_patients=9)
+        call_command('rebuild_doctor_stats', stdout=io.StringIO())
+        self.assertEqual([self.totals(doctor) for doctor in self.doctors], expected)
+
+    def test_dashboard_reads_the_stats(self):
+        appointment = self.book(self.patients[0])
+        appointment.status = 'completed'
+        appointment.save()
+        DoctorStats.objects.all().delete()
+
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.doctors[0].user).access_token}'
+        )
+        data = client.get('/api/doctor/dashboard/').data
+        self.assertEqual((data['total_patients'], data['total_consultations'], data['completed_today']), (1, 1, 1))
+        with self.assertNumQueries(4):
+            client.get('/api/doctor/dashboard/')
+
+
+class PatientDashboardTests(TestCase):
+    """The patient dashboard is cached until that patient's data is written"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patients = [create_patient(n) for n in range(2)]
+        self.today = timezone.now().date()
+        self.book(self.patients[0], time(9, 0))
+        self.clients = []
+        for patient in self.patients:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(patient).access_token}')
+            self.clients.append(client)
+
+    def book(self, patient, slot):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                patient=patient, doctor=self.doctor, department=self.department,
+                appointment_date=self.today, time_slot=slot, reason='Checkup', booking_type='doctor'
+            )
+
+    def dashboard(self, n=0):
+        return self.clients[n].get('/api/patient/dashboard/').data
+
+    def test_misses_run_fixed_queries_and_hits_none(self):
+        for n in range(3):
+            self.book(self.patients[1], time(10, n * 10))
+        # The (cached) user, upcoming appointments, recent records and the total
+        with self.assertNumQueries(4):
+            self.assertEqual(self.dashboard(1)['total_appointments'], 3)
+        with self.assertNumQueries(0):
+            self.dashboard(1)
+
+    def test_writes_invalidate_only_that_patient(self):
+        self.assertEqual(self.dashboard(0)['pending_appointments'], 1)
+        self.dashboard(1)
+
+        appointment = self.book(self.patients[0], time(9, 10))
+        self.assertEqual(self.dashboard(0)['pending_appointments'], 2)
+        with self.assertNumQueries(0):
+            self.dashboard(1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MedicalRecord.objects.create(
+                patient=self.patients[0], doctor=self.doctor, appointment=appointment,
+                diagnosis='Flu', symptoms='Fever', treatment_plan='Rest'
+            )
+        self.assertEqual(len(self.dashboard(0)['recent_records']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'cancelled'
+            appointment.save()
+        self.assertEqual(self.dashboard(0)['pending_appointments'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clients[0].patch('/api/patient/update_profile/', {'address': 'New address'}, format='json')
+        self.assertEqual(self.dashboard(0)['profile']['address'], 'New address')
+
+
+class BulkBookingTests(TestCase):
+    """Admins book many patients into one doctor's day in a single request"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patients = [create_patient(n) for n in range(4)]
+        self.day = date(2030, 1, 7)
+        self.booked = Appointment.objects.create(
+            patient=self.patients[0], doctor=self.doctor, department=self.department,
+            appointment_date=self.day, time_slot=time(9, 0), reason='Checkup', booking_type='doctor'
+        )
+        admin = User.objects.create_user(
+            email='admin@example.com', password=None, full_name='Admin', phone='+917000000000', role='admin'
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(admin).access_token}')
+
+    def book(self, slots, patients=None):
+        return self.client.post('/api/appointments/bulk/', {
+            'doctor': self.doctor.id, 'appointment_date': self.day.isoformat(), 'booking_type': 'disease',
+            'appointments': [
+                {'patient_id': patient.id, 'time_slot': slot, 'reason': 'Vaccination'}
+                for patient, slot in zip(patients or self.patients[1:], slots)
+            ],
+        }, format='json')
+
+    def test_books_with_consecutive_tokens_and_refreshes_queue_state(self):
+        slots.occupancy(self.doctor.id, self.day)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.book(['10:20', '10:00', '10:10'])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            [(row['time_slot'], row['token_number']) for row in response.data],
+            [('10:00:00', 'CARD-20300107-0002'), ('10:10:00', 'CARD-20300107-0003'),
+             ('10:20:00', 'CARD-20300107-0004')]
+        )
+
+        queue = QueueStatus.objects.get(doctor=self.doctor, appointment_date=self.day)
+        self.assertEqual(queue.total_tokens, 4)
+        self.assertEqual(DoctorStats.objects.get(doctor=self.doctor).total_patients, 4)
+        self.assertEqual(AppointmentRollup.objects.get(doctor=self.doctor, status='scheduled').count, 4)
+        self.assertEqual(slots.occupancy(self.doctor.id, self.day), slots.bitmap_for(
+            [time(9, 0), time(10, 0), time(10, 10), time(10, 20)]
+        ))
+        # Single bookings carry on after the block
+        single = Appointment.objects.create(
+            patient=self.patients[1], doctor=self.doctor, department=self.department,
+            appointment_date=self.day, time_slot=time(11, 0), reason='Checkup', booking_type='doctor'
+        )
+        self.assertEqual(single.token_number, 'CARD-20300107-0005')
+
+    def test_booking_today_sends_a_fresh_snapshot_once_committed(self):
+        self.day = timezone.now().date()
+        stale = queues.get_snapshot(self.doctor.id)
+        with mock.patch.object(queues, 'publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.book(['10:00', '10:10'])
+            self.assertEqual(response.status_code, 201, response.data)
+            # Until the commit, readers keep the snapshot matching the database
+            self.assertEqual(queues.get_snapshot(self.doctor.id), stale)
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        snapshot = queues.get_snapshot(self.doctor.id)
+        self.assertNotEqual(snapshot['epoch'], stale['epoch'])
+        self.assertEqual(snapshot['total_tokens'], 2)
+        publish.assert_called_once_with(self.doctor.id, snapshot)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        more = [create_patient(n) for n in range(10, 30)]
+        with CaptureQueriesContext(connection) as small:
+            self.book(['10:00', '10:10'])
+        with CaptureQueriesContext(connection) as large:
+            self.book([f'{hour}:{minute}0' for hour in (12, 13, 14, 15) for minute in range(5)], patients=more)
+        self.assertEqual(Appointment.objects.count(), 23)
+        self.assertLessEqual(len(large), len(small) + 1)
+
+    def test_taken_slots_reject_the_whole_batch(self):
+        response = self.book(['09:00', '10:00'])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('09:00', str(response.data))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_duplicate_slots_and_unknown_patients_are_rejected(self):
+        self.assertEqual(self.book(['10:00', '10:00']).status_code, 400)
+        ghost = User(id=999, role='patient')
+        self.assertEqual(self.book(['10:00'], patients=[ghost]).status_code, 400)
+
+    def test_patients_cannot_bulk_book(self):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.patients[0]).access_token}'
+        )
+        self.assertEqual(client.post('/api/appointments/bulk/', {}, format='json').status_code, 403)
+
+
+class ImportUsersCommandTests(TestCase):
+    """Users are imported in chunks with batched uniqueness checks, and imports resume"""
+
+    HEADER = ['role', 'email', 'password', 'full_name', 'phone', 'aadhaar_number', 'department',
+              'specialty', 'qualification', 'experience', 'license_number', 'consultation_fee', 'availability']
+
+    def setUp(self):
+        self.department = create_department()
+        create_patient(1)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, rows, name='users.csv'):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(self.HEADER)
+            writer.writerows(rows)
+        return path
+
+    def patient_row(self, n, **overrides):
+        row = dict(role='patient', email=f'import{n}@example.com', full_name=f'Imported {n}',
+                   phone=f'+91600000{n:04d}', aadhaar_number=f'{700000000000 + n}')
+        row.update(overrides)
+        return [row.get(column, '') for column in self.HEADER]
+
+    def run_import(self, path, **options):
+        out, err = io.StringIO(), io.StringIO()
+        options.setdefault('workers', 0)
+        call_command('import_users', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_imports_patients_and_doctors_with_availability(self):
+        doctor = dict(zip(self.HEADER, [
+            'doctor', 'importdoc@example.com', 'S3cure-pass!', 'Imported Doctor', '+916100000001', '',
+            'card', 'General', 'MBBS', '4 years', 'IMP001', '450.00', 'monday 09:00-13:00; friday 14:00-18:00'
+        ]))
+        path = self.write([self.patient_row(n) for n in range(3)] + [list(doctor.values())])
+        self.run_import(path)
+
+        self.assertEqual(User.objects.filter(email__startswith='import', role='patient').count(), 3)
+        imported = Doctor.objects.get(license_number='IMP001')
+        self.assertEqual((imported.department, imported.user.role), (self.department, 'doctor'))
+        self.assertTrue(imported.user.check_password('S3cure-pass!'))
+        self.assertEqual(
+            sorted(imported.availabilities.values_list('day_of_week', 'start_time')),
+            [('friday', time(14, 0)), ('monday', time(9, 0))]
+        )
+
+    def test_duplicates_and_invalid_rows_are_reported(self):
+        path = self.write([
+            self.patient_row(1),
+            self.patient_row(2, phone='+91900000' + '0001'),   # phone of the existing patient
+            self.patient_row(3, aadhaar_number=f'{700000000001}'),   # aadhaar repeated from row 1
+            self.patient_row(4, phone='not-a-phone'),
+            self.patient_row(5, role='doctor', department='NOPE'),
+            self.patient_row(6, email='patient1@example.com', phone='+916999999999'),   # already imported
+        ])
+        out, err = self.run_import(path)
+        self.assertEqual(User.objects.filter(email__startswith='import').count(), 1)
+        for number in (2, 3, 4, 5):
+            self.assertIn(f'Row {number}:', err)
+        self.assertIn('1 already present, 4 rejected', out)
+
+    def test_checks_run_a_fixed_number_of_queries_per_chunk(self):
+        path = self.write([self.patient_row(n) for n in range(40)])
+        # Departments, the existing-user check and the insert, per chunk of 40
+        with self.assertNumQueries(5):
+            self.run_import(path, chunk_size=40)
+        self.assertEqual(User.objects.filter(email__startswith='import').count(), 40)
+
+    def test_resumes_after_the_last_committed_chunk(self):
+        path = self.write([self.patient_row(n) for n in range(6)])
+        with open(f'{path}.progress', 'w') as handle:
+            json.dump({'rows': 4, 'created': 4, 'skipped': 0, 'rejected': 0}, handle)
+        out, _ = self.run_import(path, chunk_size=2)
+        self.assertIn('Resuming after row 4', out)
+        self.assertEqual(
+            sorted(User.objects.filter(email__startswith='import').values_list('email', flat=True)),
+            ['import4@example.com', 'import5@example.com']
+        )
+        with open(f'{path}.progress') as handle:
+            self.assertEqual(json.load(handle)['rows'], 6)
+
+    def test_passwords_are_hashed_in_worker_processes(self):
+        path = self.write([self.patient_row(n, password=f'Pass-{n}-word') for n in range(2)])
+        self.run_import(path, workers=2, progress=os.path.join(self.directory.name, 'state'))
+        self.assertTrue(User.objects.get(email='import1@example.com').check_password('Pass-1-word'))
+
+
+class GenerateDataCommandTests(TestCase):
+    """Synthetic datasets are reproducible and their derived state is consistent"""
+
+    TODAY = date(2026, 3, 4)
+
+    def generate(self, **options):
+        out = io.StringIO()
+        options = dict(dict(patients=40, doctors=5, days=10, future_days=3, today=self.TODAY), **options)
+        call_command('generate_data', stdout=out, **options)
+        return out.getvalue()
+
+    def fingerprint(self, **options):
+        """Generated rows, generated in a transaction that is then rolled back"""
+        class Rollback(Exception):
+            pass
+
+        try:
+            with transaction.atomic():
+                self.generate(**options)
+                rows = (
+                    list(User.objects.order_by('id').values_list('id', 'email', 'full_name', 'date_of_birth')),
+                    list(Appointment.objects.order_by('id').values_list(
+                        'patient_id', 'doctor_id', 'appointment_date', 'time_slot', 'status', 'token_number'
+                    )),
+                    list(MedicalRecord.objects.order_by('id').values_list(
+                        'appointment_id', 'diagnosis', 'prescriptions', 'vitals'
+                    )),
+                )
+                raise Rollback
+        except Rollback:
+            return rows
+
+    def test_same_seed_gives_the_same_data(self):
+        first = self.fingerprint(seed=3)
+        self.assertTrue(first[1] and first[2])
+        self.assertEqual(self.fingerprint(seed=3), first)
+        self.assertNotEqual(self.fingerprint(seed=4)[1], first[1])
+
+    def test_counts_and_demo_accounts(self):
+        out = io.StringIO()
+        call_command('generate_data', '--patients', '1e2', '--doctors', '5', '--days', '10', '--future-days', '3',
+                     '--today', self.TODAY.isoformat(), stdout=out)
+        out = out.getvalue()
+        self.assertIn('Generated 100 patients, 5 doctors', out)
+        self.assertEqual(User.objects.filter(email__endswith='@synthetic.test', role='patient').count(), 100)
+        self.assertEqual(Doctor.objects.count(), 5 + 4)
+        self.assertEqual(Department.objects.count(), 6)
+        self.assertTrue(User.objects.get(email='admin@healthcare.gov').check_password('admin123'))
+        self.assertTrue(User.objects.get(email='dr.singh@healthcare.gov').check_password('doctor123'))
+
+        # Past visits are resolved, future ones are not, and records belong to completed visits
+        self.assertFalse(Appointment.objects.filter(
+            appointment_date__lt=self.TODAY, status__in=['scheduled', 'confirmed', 'in_progress']
+        ).exists())
+        self.assertFalse(Appointment.objects.filter(
+            appointment_date__gt=self.TODAY, status__in=['completed', 'no_show', 'in_progress']
+        ).exists())
+        self.assertFalse(MedicalRecord.objects.exclude(appointment__status='completed').exists())
+        self.assertEqual(
+            MedicalRecord.objects.filter(visit_date=F('appointment__consultation_ended_at')).count(),
+            MedicalRecord.objects.count()
+        )
+
+    def test_derived_state_matches_the_appointments(self):
+        self.generate()
+        self.assertEqual(
+            AppointmentRollup.objects.aggregate(total=Sum('count'))['total'], Appointment.objects.count()
+        )
+        self.assertEqual(
+            QueueStatus.objects.aggregate(total=Sum('total_tokens'))['total'],
+            Appointment.objects.filter(status__in=queues.COUNTED_STATUSES).count()
+        )
+        self.assertEqual(
+            DoctorStats.objects.aggregate(total=Sum('total_consultations'))['total'],
+            Appointment.objects.filter(status='completed').count()
+        )
+        for sequence in TokenSequence.objects.all():
+            self.assertEqual(sequence.last_value, Appointment.objects.filter(
+                department_id=sequence.department_id, appointment_date=sequence.appointment_date
+            ).aggregate(last=Max('queue_position'))['last'])
+
+        # Later bookings continue the token sequence
+        appointment = Appointment.objects.filter(appointment_date=self.TODAY).first()
+        booked = Appointment.objects.create(
+            patient=appointment.patient, doctor=appointment.doctor, department=appointment.department,
+            appointment_date=self.TODAY, time_slot=time(23, 50), reason='Review', booking_type='doctor'
+        )
+        self.assertEqual(booked.queue_position, TokenSequence.objects.get(
+            department=appointment.department, appointment_date=self.TODAY
+        ).last_value)
+
+    def test_rebuilding_today_does_not_broadcast(self):
+        today = timezone.now().date()
+        with mock.patch.object(queues, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.generate(today=today)
+        publish.assert_not_called()
+        doctor_id = QueueStatus.objects.filter(appointment_date=today, total_tokens__gt=0).values_list(
+            'doctor_id', flat=True
+        ).first()
+        self.assertEqual(
+            queues.get_snapshot(doctor_id, today)['total_tokens'],
+            QueueStatus.objects.get(doctor_id=doctor_id, appointment_date=today).total_tokens
+        )
+
+
+class SlotConstraintTests(TestCase):
+    """The database, not a prior SELECT, refuses a second active booking of a slot"""
+
+    def setUp(self):
+        cache.clear()
+        self.department = create_department()
+        self.doctor = create_doctor(self.department)
+        self.patients = [create_patient(n) for n in range(3)]
+        self.day = date(2030, 1, 7)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+        return client
+
+    def book(self, patient, slot='09:00'):
+        return self.client_for(patient).post('/api/appointments/', {
+            'doctor': self.doctor.id, 'department': self.department.id, 'appointment_date': self.day.isoformat(),
+            'time_slot': slot, 'reason': 'Checkup', 'booking_type': 'doctor'
+        }, format='json')
+
+    def test_second_booking_of_a_slot_is_a_conflict(self):
+        self.assertEqual(self.book(self.patients[0]).status_code, 201)
+        response = self.book(self.patients[1])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['detail'].code, 'slot_taken')
+        self.assertEqual(Appointment.objects.count(), 1)
+        # The refused insert gave its token back
+        self.book(self.patients[1], '09:10')
+        self.assertEqual(Appointment.objects.get(patient=self.patients[1]).token_number, 'CARD-20300107-0002')
+
+    def test_finished_and_cancelled_bookings_free_the_slot(self):
+        self.book(self.patients[0])
+        first = Appointment.objects.get()
+        first.status = 'cancelled'
+        first.save(update_fields=['status'])
+        first.refresh_from_db()
+        self.assertIsNone(first.active_slot)
+        self.assertEqual(self.book(self.patients[1]).status_code, 201)
+        Appointment.objects.filter(patient=self.patients[1]).get().delete()
+
+        first.status = 'scheduled'
+        first.save()
+        self.assertTrue(Appointment.objects.get(id=first.id).active_slot)
+
+    def test_moving_onto_a_taken_slot_is_a_conflict(self):
+        self.book(self.patients[0])
+        self.book(self.patients[1], '09:10')
+        moved = Appointment.objects.get(patient=self.patients[1]).id
+        client = self.client_for(self.patients[1])
+        response = client.post(f'/api/appointments/{moved}/reschedule/', {
+            'appointment_date': self.day.isoformat(), 'time_slot': '09:00'
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Appointment.objects.get(id=moved).time_slot, time(9, 10))
+
+        admin = User.objects.create_user(
+            email='admin@example.com', password=None, full_name='Admin', phone='+917000000000', role='admin'
+        )
+        response = self.client_for(admin).patch(f'/api/appointments/{moved}/', {'time_slot': '09:00'}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_bulk_booking_racing_a_single_booking_is_refused_whole(self):
+        self.book(self.patients[0])
+        with self.assertRaises(bookings.SlotTaken):
+            with bookings.slot_guard():
+                bookings.book_many(self.doctor, self.day, [
+                    {'patient_id': patient.id, 'time_slot': slot, 'reason': 'Vaccination'}
+                    for patient, slot in zip(self.patients[1:], (time(9, 10), time(9, 0)))
+                ])
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(TokenSequence.objects.get().last_value, 1)
+
+    def test_starting_a_double_booking_left_by_the_migration_is_a_conflict(self):
+        self.book(self.patients[0])
+        # 0008_appointment_active_slot leaves later bookings of a slot without the flag
+        leftover = Appointment.objects.create(
+            patient=self.patients[1], doctor=self.doctor, department=self.department, appointment_date=self.day,
+            time_slot=time(9, 0), reason='Checkup', booking_type='doctor', status='cancelled'
+        )
+        Appointment.objects.filter(id=leftover.id).update(status='scheduled')
+
+        response = self.client_for(self.doctor.user).post(f'/api/appointments/{leftover.id}/start_consultation/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Appointment.objects.get(id=leftover.id).status, 'scheduled')
+
+    def test_other_integrity_errors_are_not_conflicts(self):
+        with self.assertRaises(IntegrityError), bookings.slot_guard(), transaction.atomic():
+            create_department()
 
-# Create your tests here.
@@ -0,0 +1,22 @@
+"""Version counters held in the cache, for keying cached state that is invalidated by bumping"""
+import time
+
+from django.core.cache import cache
+
+
+def version(key):
+    """Current value of the counter at ``key``, starting one if there is none"""
+    value = cache.get(key)
+    if value is None:
+        # Seeded from the clock so a lost counter never reissues an old value
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump(key):
+    """Move the counter at ``key`` on, so entries keyed by its old value are never read again"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
@@ -1,33 +1,45 @@
+import hashlib
+import json
+
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import MethodNotAllowed, NotFound
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.utils.http import parse_etags
+from django.db.models import Q, Count, F
 from datetime import datetime, timedelta, date, time
 
-from channels.layers import get_channel_layer
-from datetime import time
-
-from asgiref.sync import async_to_sync
+from . import bookings, catalog, dashboards, exports, queues, rollups, slots, stats
+from .authentication import ClaimsRefreshToken
+from .budgets import query_budget
+from .pagination import KeysetPagination
 from .models import (
     User, Doctor, Department, Appointment, MedicalRecord,
     FamilyMember, DoctorAvailability, Admin, QueueStatus
 )
 from .serializers import *
 from .permissions import IsPatient, IsDoctor, IsAdmin, IsDoctorOrAdmin
+from .querysets import only_fields, appointment_queryset, doctor_queryset, medical_record_queryset
 
 
 # ==================== Authentication Views ====================
 class AuthViewSet(viewsets.ViewSet):
     permission_classes = [permissions.AllowAny]
 
+    @query_budget(4)
     @action(detail=False, methods=['post'])
     def register(self, request):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'user': UserProfileSerializer(user).data,
                 'refresh': str(refresh),
@@ -36,12 +48,13 @@ class AuthViewSet(viewsets.ViewSet):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @query_budget(3)
     @action(detail=False, methods=['post'])
     def login(self, request):
         serializer = LoginSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             dashboard_urls = {
                 'patient': '/patient/dashboard',
                 'doctor': '/doctor/dashboard',
@@ -66,37 +79,17 @@ class PatientViewSet(viewsets.GenericViewSet):
     def get_queryset(self):
         return User.objects.filter(id=self.request.user.id)
 
+    @query_budget(4)
     @action(detail=False, methods=['get'])
     def dashboard(self, request):
-        user = request.user
-        today = timezone.now().date()
-
-        upcoming = Appointment.objects.filter(
-            patient=user,
-            appointment_date__gte=today,
-            status__in=['scheduled', 'confirmed']
-        ).order_by('appointment_date', 'time_slot')[:5]
-
-        recent_records = MedicalRecord.objects.filter(
-            patient=user
-        ).order_by('-visit_date')[:3]
-
-        total_appointments = Appointment.objects.filter(patient=user).count()
-        pending_appointments = upcoming.count()
-
-        data = {
-            'profile': UserProfileSerializer(user).data,
-            'upcoming_appointments': AppointmentSerializer(upcoming, many=True).data,
-            'recent_records': MedicalRecordSerializer(recent_records, many=True).data,
-            'total_appointments': total_appointments,
-            'pending_appointments': pending_appointments,
-        }
-        return Response(data)
+        return Response(dashboards.patient_dashboard(request.user))
 
+    @query_budget(1)
     @action(detail=False, methods=['get'])
     def profile(self, request):
         return Response(UserProfileSerializer(request.user).data)
 
+    @query_budget(2)
     @action(detail=False, methods=['patch', 'put'])
     def update_profile(self, request):
         serializer = UserProfileSerializer(request.user, data=request.data, partial=True)
@@ -110,73 +103,116 @@ class PatientViewSet(viewsets.GenericViewSet):
 class DoctorViewSet(viewsets.ModelViewSet):
     serializer_class = DoctorSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budgets = {
+        'list': 3, 'retrieve': 2, 'create': 0, 'update': 6, 'partial_update': 5, 'destroy': 11
+    }
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'doctor':
-            return Doctor.objects.filter(user=user)
+            queryset = doctor_queryset().filter(user_id=user.id)
         elif user.role == 'admin':
-            return Doctor.objects.all()
-        return Doctor.objects.filter(is_verified=True, is_available=True)
+            queryset = doctor_queryset()
+        else:
+            queryset = doctor_queryset().filter(is_verified=True, is_available=True)
+        department_id = self.request.query_params.get('department')
+        if department_id:
+            queryset = queryset.filter(department_id=department_id)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        # A profile needs its user account, which only register_doctor creates
+        raise MethodNotAllowed(request.method, detail='Doctors are registered through /api/admin/register_doctor/')
+
+    def list(self, request, *args, **kwargs):
+        """Patients get the cached doctor directory; doctors and admins see live rows"""
+        if request.user.role in ('doctor', 'admin'):
+            return super().list(request, *args, **kwargs)
+        try:
+            department_id = int(request.query_params.get('department') or 0) or None
+            page = int(request.query_params.get('page', 1))
+            count, results = catalog.doctor_directory(department_id, page)
+        except ValueError:
+            return Response({'error': 'department and page must be integers'}, status=400)
+        except InvalidPage:
+            raise NotFound('Invalid page.')
+
+        url = request.build_absolute_uri()
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        links = {
+            'next': replace_query_param(url, 'page', page + 1) if page * page_size < count else None,
+            'previous': (
+                None if page == 1
+                else remove_query_param(url, 'page') if page == 2
+                else replace_query_param(url, 'page', page - 1)
+            ),
+        }
+        body = b'{"count":%d,"next":%s,"previous":%s,"results":%s}' % (
+            count, json.dumps(links['next']).encode(), json.dumps(links['previous']).encode(), results
+        )
+        return HttpResponse(body, content_type='application/json')
 
+    @query_budget(4)
     @action(detail=False, methods=['get'], permission_classes=[IsDoctor])
     def dashboard(self, request):
         try:
-            doctor = request.user.doctor_profile
+            doctor = doctor_queryset().select_related('stats').get(pk=request.user.doctor_id)
         except Doctor.DoesNotExist:
             return Response({"error": "Doctor profile not found."}, status=404)
 
         today = timezone.now().date()
 
-        today_appointments = Appointment.objects.filter(
+        today_appointments = list(appointment_queryset().filter(
             doctor=doctor,
             appointment_date=today
-        ).order_by('queue_position')
-
-        total_patients = Appointment.objects.filter(
-            doctor=doctor
-        ).values('patient').distinct().count()
+        ).order_by('queue_position'))
 
-        completed_today = today_appointments.filter(status='completed').count()
+        doctor_stats = stats.for_doctor(doctor)
+        completed_today = sum(1 for appointment in today_appointments if appointment.status == 'completed')
 
         queue_status = QueueStatus.objects.filter(
             doctor=doctor,
             appointment_date=today
         ).first()
+        if queue_status:
+            queue_status.doctor = doctor
 
         return Response({
             'profile': DoctorSerializer(doctor).data,
             'today_appointments': AppointmentSerializer(today_appointments, many=True).data,
-            'total_patients': total_patients,
+            'total_patients': doctor_stats.total_patients,
+            'total_consultations': doctor_stats.total_consultations,
             'completed_today': completed_today,
             'current_queue': QueueStatusSerializer(queue_status).data if queue_status else None,
         })
 
+    @query_budget(1)
     @action(detail=False, methods=['get'], permission_classes=[IsDoctor])
     def appointments(self, request):
-        doctor = request.user.doctor_profile
         date_param = request.query_params.get('date', timezone.now().date())
 
-        appointments = Appointment.objects.filter(
-            doctor=doctor,
+        # One doctor's day is bounded and queue screens need all of it, so it is not paginated
+        appointments = appointment_queryset().filter(
+            doctor_id=request.user.doctor_id,
             appointment_date=date_param
-        ).order_by('queue_position')
+        ).order_by('queue_position', 'id')
 
         return Response(AppointmentSerializer(appointments, many=True).data)
 
     # availability unchanged
+    @query_budget(2)
     @action(detail=False, methods=['get', 'post'], permission_classes=[IsDoctor])
     def availability(self, request):
-        doctor = request.user.doctor_profile
+        doctor_id = request.user.doctor_id
 
         if request.method == 'GET':
-            availabilities = DoctorAvailability.objects.filter(doctor=doctor)
+            availabilities = DoctorAvailability.objects.filter(doctor_id=doctor_id)
             return Response(DoctorAvailabilitySerializer(availabilities, many=True).data)
 
         data = request.data
-        data['doctor'] = doctor.id
+        data['doctor'] = doctor_id
         slot = DoctorAvailability.objects.filter(
-            doctor=doctor,
+            doctor_id=doctor_id,
             day_of_week=data.get('day_of_week')
         ).first()
 
@@ -187,69 +223,25 @@ class DoctorViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
-    # helper functions
-    def _update_queue_status(self, doctor, appointment_date):
-        queue_status, created = QueueStatus.objects.get_or_create(
-            doctor=doctor,
-            appointment_date=appointment_date
-        )
-
-        completed = Appointment.objects.filter(
-            doctor=doctor,
-            appointment_date=appointment_date,
-            status='completed'
-        ).count()
-
-        current = Appointment.objects.filter(
-            doctor=doctor,
-            appointment_date=appointment_date,
-            status='in_progress'
-        ).first()
 
-        total = Appointment.objects.filter(
-            doctor=doctor,
-            appointment_date=appointment_date,
-            status__in=['scheduled', 'confirmed', 'in_progress', 'completed']
-        ).count()
-
-        queue_status.current_token = current.token_number if current else ""
-        queue_status.total_tokens = total
-        queue_status.completed_tokens = completed
-        queue_status.save()
-
-    def _broadcast_queue_update(self, doctor_id):
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'queue_{doctor_id}',
-            {
-                'type': 'queue_update',
-                'data': {'status': 'updated', 'message': 'Queue updated'}
-            }
-        )
+# ==================== Admin Views ====================
+def _date_range(request):
+    """Optional ``start`` and ``end`` dates of the query string; raises ValueError when malformed"""
+    return tuple(
+        date.fromisoformat(request.query_params[name]) if request.query_params.get(name) else None
+        for name in ('start', 'end')
+    )
 
 
-# ==================== Admin Views ====================
 class AdminViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
 
+    @query_budget(5)
     @action(detail=False, methods=['get'])
     def dashboard(self, request):
-        today = timezone.now().date()
-        stats = {
-            'total_users': User.objects.count(),
-            'total_patients': User.objects.filter(role='patient').count(),
-            'total_doctors': Doctor.objects.count(),
-            'total_departments': Department.objects.filter(is_active=True).count(),
-            'total_appointments': Appointment.objects.count(),
-            'today_appointments': Appointment.objects.filter(appointment_date=today).count(),
-            'pending_verifications': Doctor.objects.filter(is_verified=False).count(),
-            'recent_registrations': UserProfileSerializer(
-                User.objects.order_by('-created_at')[:5],
-                many=True
-            ).data,
-        }
-        return Response(stats)
+        return Response(dashboards.admin_dashboard())
 
+    @query_budget(6)
     @action(detail=False, methods=['post'])
     def register_doctor(self, request):
         serializer = DoctorRegistrationSerializer(data=request.data, context={'request': request})
@@ -258,6 +250,7 @@ class AdminViewSet(viewsets.ViewSet):
             return Response(DoctorSerializer(doctor).data, status=201)
         return Response(serializer.errors, status=400)
 
+    @query_budget(2)
     @action(detail=True, methods=['post'])
     def verify_doctor(self, request, pk=None):
         try:
@@ -268,136 +261,195 @@ class AdminViewSet(viewsets.ViewSet):
         except Doctor.DoesNotExist:
             return Response({'error': 'Doctor not found'}, status=404)
 
+    @query_budget(1)
     @action(detail=False, methods=['get'])
     def users(self, request):
-        return Response(UserProfileSerializer(User.objects.all().order_by('-created_at'), many=True).data)
+        paginator = KeysetPagination(ordering=('-created_at', '-id'))
+        page = paginator.paginate_queryset(User.objects.all(), request)
+        return paginator.get_paginated_response(UserProfileSerializer(page, many=True).data)
 
+    @query_budget(2)
     @action(detail=False, methods=['get'])
     def reports(self, request):
         report_type = request.query_params.get('type', 'appointments')
+        try:
+            start, end = _date_range(request)
+        except ValueError:
+            return Response({'error': 'Invalid date'}, status=400)
 
+        # Answered from the daily rollups, see healthcare.rollups
         if report_type == 'appointments':
-            total = Appointment.objects.count()
-            by_status = list(Appointment.objects.values('status').annotate(count=Count('id')))
-            by_department = list(Appointment.objects.values('department__name').annotate(count=Count('id')))
-            return Response({
-                'total_appointments': total,
-                'by_status': by_status,
-                'by_department': by_department
-            })
+            return Response(rollups.appointment_report(start, end))
 
         elif report_type == 'doctors':
-            doctors = Doctor.objects.annotate(
-                appointment_count=Count('doctor_appointments')
-            ).values(
-                'id', 'user__full_name', 'specialty', 'rating', 'appointment_count'
-            )
-            return Response({'doctors': list(doctors)})
+            return Response({'doctors': rollups.doctor_report(start, end)})
 
         return Response({'error': 'Invalid report type'}, status=400)
 
+    # One query per exports.EXPORT_CHUNK_SIZE rows, run while the response streams
+    @query_budget(1)
+    @action(detail=False, methods=['get'], url_path='export/(?P<resource>appointments|medical-records|users)')
+    def export(self, request, resource=None):
+        try:
+            start, end = _date_range(request)
+            department_id = int(request.query_params.get('department') or 0) or None
+        except ValueError:
+            return Response({'error': 'Invalid date or department'}, status=400)
+
+        export = exports.EXPORTS[resource]
+        rows = export.rows(start, end, department_id)
+        if request.query_params.get('output') == 'csv':
+            response = StreamingHttpResponse(exports.csv_lines(export.fields, rows), content_type='text/csv')
+            extension = 'csv'
+        else:
+            response = StreamingHttpResponse(exports.ndjson_lines(rows), content_type='application/x-ndjson')
+            extension = 'ndjson'
+        filename = f'{resource}-{timezone.now():%Y%m%d}.{extension}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 
 # ==================== Appointment Views ====================
 class AppointmentViewSet(viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-appointment_date', 'queue_position', 'id')
+    # Writes include their post-commit work (slot bitmaps, queue snapshots).
+    # A booking into a day already under way runs 14 queries (held by
+    # QueryBudgetTests). The doctor's first booking of the day adds 18:
+    # seeding the token sequence (4), queue status (5), rollup (4) and stats
+    # (3) rows from what is already booked, and loading the queue snapshot
+    # after commit instead of patching it (2). Savepoints count, though most
+    # are not nested outside tests.
+    query_budgets = {
+        'list': 1, 'retrieve': 1, 'create': 32, 'update': 10, 'partial_update': 7, 'destroy': 11
+    }
+    MAX_CALENDAR_DAYS = 31
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'patient':
-            return Appointment.objects.filter(patient=user)
+            return appointment_queryset().filter(patient_id=user.id)
         elif user.role == 'doctor':
-            return Appointment.objects.filter(doctor=user.doctor_profile)
+            return appointment_queryset().filter(doctor_id=user.doctor_id)
         elif user.role == 'admin':
-            return Appointment.objects.all()
+            return appointment_queryset()
         return Appointment.objects.none()
 
     def get_serializer_class(self):
         return AppointmentCreateSerializer if self.action == 'create' else AppointmentSerializer
 
+    # The slot is claimed by the insert itself, see healthcare.bookings.slot_guard.
+    # Appointment.save already runs the insert in a transaction
     def perform_create(self, serializer):
-        appointment = serializer.save(patient=self.request.user)
-        self._update_queue_status(appointment.doctor, appointment.appointment_date)
+        with bookings.slot_guard():
+            serializer.save(patient_id=self.request.user.id)
+
+    def perform_update(self, serializer):
+        with bookings.slot_guard(), transaction.atomic():
+            serializer.save()
 
+    # Independent of the number of appointments booked. The same day setup
+    # as a first booking, with the queue snapshot reloaded once committed
+    @query_budget(32)
+    @action(detail=False, methods=['post'], permission_classes=[IsAdmin])
+    def bulk(self, request):
+        serializer = BulkAppointmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        with bookings.slot_guard():
+            appointments = bookings.book_many(**serializer.validated_data)
+        return Response(AppointmentSerializer(appointments, many=True).data, status=201)
+
+    @query_budget(12)
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         appointment = self.get_object()
-        if appointment.patient != request.user and request.user.role != 'admin':
+        if appointment.patient_id != request.user.id and request.user.role != 'admin':
             return Response({'error': 'Not authorized'}, status=403)
 
         appointment.status = 'cancelled'
         appointment.save()
-        self._update_queue_status(appointment.doctor, appointment.appointment_date)
         return Response({'message': 'Appointment cancelled successfully'})
 
+    @query_budget(7)
     @action(detail=True, methods=['post'])
     def reschedule(self, request, pk=None):
         appointment = self.get_object()
-        if appointment.patient != request.user:
+        if appointment.patient_id != request.user.id:
             return Response({'error': 'Not authorized'}, status=403)
 
-        new_date = request.data.get('appointment_date')
-        new_time = request.data.get('time_slot')
-
-        if new_date and new_time:
-            appointment.appointment_date = new_date
-            appointment.time_slot = new_time
-            appointment.status = 'scheduled'
+        try:
+            new_date = date.fromisoformat(request.data.get('appointment_date', ''))
+            new_time = time.fromisoformat(request.data.get('time_slot', ''))
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid date or time'}, status=400)
+
+        appointment.appointment_date = new_date
+        appointment.time_slot = new_time
+        appointment.status = 'scheduled'
+        with bookings.slot_guard(), transaction.atomic():
             appointment.save()
-            return Response(AppointmentSerializer(appointment).data)
-
-        return Response({'error': 'Invalid date or time'}, status=400)
-@action(detail=False, methods=['get'], url_path='queue_status')
-def queue_status(self, request):
-    user = request.user
-    doctor_id = request.query_params.get("doctor_id")
-
-    # Get today's appointments for that doctor
-    today = datetime.date.today()
-    appointments = Appointment.objects.filter(
-        doctor_id=doctor_id,
-        appointment_date=today
-    ).order_by("token_number")
-
-    # Current token
-    current_token = appointments.filter(status="in-progress").first()
-    current_number = current_token.token_number if current_token else None
-
-    # Get patient's own token
-    patient_appointment = appointments.filter(patient=user).first()
-    patient_token = patient_appointment.token_number if patient_appointment else None
-
-    # Pending list (waiting + arrived)
-    pending = appointments.filter(status__in=["waiting", "arrived"]).values(
-        "token_number", "patient_name"
-    )
+        return Response(AppointmentSerializer(appointment).data)
+
+    @query_budget(3)
+    @action(detail=False, methods=['get'], url_path='queue_status')
+    def queue_status(self, request):
+        user = request.user
+        doctor_id = request.query_params.get("doctor_id")
+
+        # Get today's appointments for that doctor
+        today = timezone.now().date()
+        etag = _queue_etag(request, queues.version(today, doctor_id), per_user=True)
+        if _not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        appointments = Appointment.objects.filter(
+            doctor_id=doctor_id,
+            appointment_date=today
+        ).order_by("token_number")
 
-    return Response({
-        "current_token": current_number,
-        "pending_tokens": pending,
-        "patient_token": patient_token
-    })
+        # Current token
+        current_token = appointments.filter(status="in_progress").first()
+        current_number = current_token.token_number if current_token else None
 
-    # ⭐ MOVED HERE — FIXED ⭐
+        # Get patient's own token
+        patient_appointment = appointments.filter(patient_id=user.id).first()
+        patient_token = patient_appointment.token_number if patient_appointment else None
+
+        # Pending list (scheduled + confirmed)
+        pending = appointments.filter(status__in=["scheduled", "confirmed"]).values(
+            "token_number", patient_name=F("patient__full_name")
+        )
+
+        return Response({
+            "current_token": current_number,
+            "pending_tokens": pending,
+            "patient_token": patient_token
+        }, headers={'ETag': etag})
+
+    @query_budget(14)
     @action(detail=True, methods=['post'], permission_classes=[IsDoctor])
     def start_consultation(self, request, pk=None):
         appointment = self.get_object()
 
-        if appointment.doctor.user != request.user:
+        if appointment.doctor_id != request.user.doctor_id:
             return Response({'error': 'Not authorized'}, status=403)
 
         appointment.status = 'in_progress'
         appointment.consultation_started_at = timezone.now()
-        appointment.save()
+        # A double booking left from before unique_active_slot takes its slot back here
+        with bookings.slot_guard(), transaction.atomic():
+            appointment.save()
 
         return Response(AppointmentSerializer(appointment).data)
 
-    # ⭐ MOVED HERE — FIXED ⭐
+    @query_budget(13)
     @action(detail=True, methods=['post'], permission_classes=[IsDoctor])
     def end_consultation(self, request, pk=None):
         appointment = self.get_object()
 
-        if appointment.doctor.user != request.user:
+        if appointment.doctor_id != request.user.doctor_id:
             return Response({'error': 'Not authorized'}, status=403)
 
         appointment.status = 'completed'
@@ -416,10 +468,9 @@ def queue_status(self, request):
             if serializer.is_valid():
                 serializer.save()
 
-        self._update_queue_status(appointment.doctor, appointment.appointment_date)
         return Response(AppointmentSerializer(appointment).data)
 
-    # AVAILABLE SLOTS unchanged
+    @query_budget(3)
     @action(detail=False, methods=['get'], url_path='available_slots')
     def available_slots(self, request):
         doctor_id = request.query_params.get('doctor_id')
@@ -446,37 +497,12 @@ def queue_status(self, request):
         ).first()
 
         if not availability:
-            start_t = time(9, 0)
-            end_t = time(17, 0)
+            window = slots.window_mask(*slots.DEFAULT_HOURS)
         else:
-            start_t = availability.start_time
-            end_t = availability.end_time
-            if end_t == time(0, 0):
-                end_t = time(23, 59)
-
-        start_dt = datetime.combine(appointment_date, start_t)
-        end_dt = datetime.combine(appointment_date, end_t)
-
-        booked = set(
-            t.strftime("%H:%M")
-            for t in Appointment.objects.filter(
-                doctor=doctor,
-                appointment_date=appointment_date,
-                status__in=['scheduled', 'confirmed', 'in_progress']
-            ).values_list('time_slot', flat=True)
-        )
+            window = slots.window_mask(availability.start_time, availability.end_time)
 
-        available = []
-        current = start_dt
-        while current < end_dt:
-            sv = current.strftime("%H:%M")
-            if sv not in booked:
-                available.append({
-                    "value": sv,
-                    "display": current.strftime("%I:%M %p"),
-                    "duration": "10 minutes"
-                })
-            current += timedelta(minutes=10)
+        free = window & ~slots.occupancy(doctor.id, appointment_date)
+        available = slots.describe(free)
 
         return Response({
             "doctor_id": doctor_id,
@@ -485,44 +511,118 @@ def queue_status(self, request):
             "total_available": len(available)
         })
 
-    def _update_queue_status(self, doctor, appointment_date):
-        queue_status, created = QueueStatus.objects.get_or_create(
-            doctor=doctor, appointment_date=appointment_date
-        )
-        total = Appointment.objects.filter(
-            doctor=doctor,
-            appointment_date=appointment_date,
-            status__in=['scheduled', 'confirmed', 'in_progress']
-        ).count()
-        queue_status.total_tokens = total
-        queue_status.save()
+    @query_budget(3)
+    @action(detail=False, methods=['get'], url_path='available_calendar')
+    def available_calendar(self, request):
+        """Free slots for several doctors over a date range, in a fixed number of queries"""
+        department_id = request.query_params.get('department')
+        doctor_ids = request.query_params.get('doctor_ids')
+        start_str = request.query_params.get('start')
+        end_str = request.query_params.get('end')
+
+        if not start_str or not (department_id or doctor_ids):
+            return Response({'error': 'start and department or doctor_ids are required'}, status=400)
+
+        try:
+            start_date = date.fromisoformat(start_str)
+            end_date = date.fromisoformat(end_str) if end_str else start_date + timedelta(days=6)
+        except ValueError:
+            return Response({'error': 'Invalid date format'}, status=400)
+
+        days = (end_date - start_date).days + 1
+        if days < 1 or days > self.MAX_CALENDAR_DAYS:
+            return Response({'error': f'Date range must cover 1 to {self.MAX_CALENDAR_DAYS} days'}, status=400)
+
+        doctors = Doctor.objects.select_related('user').filter(is_verified=True, is_available=True)
+        if doctor_ids:
+            try:
+                doctors = doctors.filter(pk__in=[int(pk) for pk in doctor_ids.split(',')])
+            except ValueError:
+                return Response({'error': 'doctor_ids must be a comma-separated list of ids'}, status=400)
+        else:
+            try:
+                doctors = doctors.filter(department_id=int(department_id))
+            except ValueError:
+                return Response({'error': 'department must be an id'}, status=400)
+        doctors = list(doctors)
+        ids = [doctor.id for doctor in doctors]
+
+        windows = {}
+        for doctor_id, day_name, start_t, end_t in DoctorAvailability.objects.filter(
+            doctor_id__in=ids,
+            is_available=True
+        ).values_list('doctor_id', 'day_of_week', 'start_time', 'end_time'):
+            windows[(doctor_id, day_name)] = slots.window_mask(start_t, end_t)
+        default_window = slots.window_mask(*slots.DEFAULT_HOURS)
+        booked = slots.occupancy_many(ids, start_date, end_date)
+
+        dates = [start_date + timedelta(days=offset) for offset in range(days)]
+        calendar = []
+        for doctor in doctors:
+            doctor_days = []
+            for day in dates:
+                window = windows.get((doctor.id, day.strftime('%A').lower()), default_window)
+                available = slots.describe(window & ~booked.get((doctor.id, day), 0))
+                doctor_days.append({
+                    "date": day.isoformat(),
+                    "available_slots": available,
+                    "total_available": len(available)
+                })
+            calendar.append({
+                "doctor_id": doctor.id,
+                "doctor_name": doctor.full_name,
+                "days": doctor_days
+            })
+
+        return Response({
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat(),
+            "doctors": calendar
+        })
 
 
 # ==================== Department Views ====================
 class DepartmentViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Department.objects.filter(is_active=True)
+    queryset = Department.objects.filter(is_active=True).annotate(
+        available_doctors=Count('doctors', filter=Q(doctors__is_available=True))
+    ).order_by('name')
     serializer_class = DepartmentSerializer
     permission_classes = [permissions.AllowAny]
+    query_budgets = {'list': 2, 'retrieve': 1}
+
+    def list(self, request, *args, **kwargs):
+        """Served from the versioned catalog cache; a department or doctor change starts a new version"""
+        key = catalog.departments_key(request.get_full_path())
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, catalog.CATALOG_TIMEOUT)
+        return Response(data)
 
 
 # ==================== Medical Record Views ====================
 class MedicalRecordViewSet(viewsets.ModelViewSet):
     serializer_class = MedicalRecordSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-visit_date', '-id')
+    query_budgets = {
+        'list': 1, 'retrieve': 1, 'create': 4, 'update': 5, 'partial_update': 5, 'destroy': 2
+    }
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'patient':
-            return MedicalRecord.objects.filter(patient=user)
+            return medical_record_queryset().filter(patient_id=user.id)
         elif user.role == 'doctor':
-            return MedicalRecord.objects.filter(doctor=user.doctor_profile)
+            return medical_record_queryset().filter(doctor_id=user.doctor_id)
         elif user.role == 'admin':
-            return MedicalRecord.objects.all()
+            return medical_record_queryset()
         return MedicalRecord.objects.none()
 
     def perform_create(self, serializer):
         if self.request.user.role == 'doctor':
-            serializer.save(doctor=self.request.user.doctor_profile)
+            serializer.save(doctor=Doctor.objects.select_related('user').get(pk=self.request.user.doctor_id))
         else:
             serializer.save()
 
@@ -531,24 +631,61 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
 class FamilyMemberViewSet(viewsets.ModelViewSet):
     serializer_class = FamilyMemberSerializer
     permission_classes = [permissions.IsAuthenticated, IsPatient]
+    query_budgets = {
+        'list': 2, 'retrieve': 1, 'create': 2, 'update': 3, 'partial_update': 2, 'destroy': 2
+    }
 
     def get_queryset(self):
-        return FamilyMember.objects.filter(user=self.request.user)
+        return FamilyMember.objects.filter(user_id=self.request.user.id)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
 
 
 # ==================== Queue Status Views ====================
+def _queue_etag(request, version, per_user=False):
+    """Weak ETag for a queue response, specific to the URL (and user if needed)"""
+    digest = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()[:12]
+    user = f'-u{request.user.id}' if per_user else ''
+    return f'W/"q{version}-{digest}{user}"'
+
+
+def _not_modified(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    return etag in parse_etags(if_none_match) or '*' in parse_etags(if_none_match)
+
+
 class QueueStatusViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = QueueStatusSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budgets = {'list': 2, 'retrieve': 1}
 
     def get_queryset(self):
         doctor_id = self.request.query_params.get('doctor')
         appointment_date = self.request.query_params.get('date', timezone.now().date())
 
-        queryset = QueueStatus.objects.filter(appointment_date=appointment_date)
+        queryset = QueueStatus.objects.select_related('doctor__user').only(
+            *only_fields(QueueStatus, 'doctor__user__full_name')
+        ).filter(appointment_date=appointment_date)
         if doctor_id:
             queryset = queryset.filter(doctor_id=doctor_id)
         return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Answers If-None-Match pollers with 304 from the cached queue version alone"""
+        date_param = request.query_params.get('date')
+        doctor_id = request.query_params.get('doctor')
+        try:
+            appointment_date = date.fromisoformat(date_param) if date_param else timezone.now().date()
+        except ValueError:
+            return super().list(request, *args, **kwargs)
+
+        # Read the version before the data so a concurrent change can only make the ETag older
+        etag = _queue_etag(request, queues.version(appointment_date, doctor_id or None))
+        if _not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
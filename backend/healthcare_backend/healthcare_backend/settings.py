@@ -40,6 +40,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'healthcare.budgets.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'healthcare_backend.urls'
@@ -114,7 +115,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'healthcare.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -146,6 +147,8 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
     'JTI_CLAIM': 'jti',
+    'TOKEN_OBTAIN_SERIALIZER': 'healthcare.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'healthcare.authentication.ClaimsTokenRefreshSerializer',
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -164,6 +167,14 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Query budgets declared on viewset actions: 'log' a warning, 'raise', or 'off'
+QUERY_BUDGET_MODE = config('QUERY_BUDGET_MODE', default='log')
+
+# Live queue broadcasts: updates for one doctor's queue arriving within the
+# window are coalesced into a single message, delayed by at most MAX_DELAY
+QUEUE_BROADCAST_WINDOW = config('QUEUE_BROADCAST_WINDOW', default=0.1, cast=float)
+QUEUE_BROADCAST_MAX_DELAY = config('QUEUE_BROADCAST_MAX_DELAY', default=0.5, cast=float)
+
 # Redis Configuration (for caching)
 CACHES = {
     'default': {